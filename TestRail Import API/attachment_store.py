@@ -0,0 +1,50 @@
+import hashlib
+import os
+import tempfile
+
+# Bytes read or written at a time when streaming attachments
+CHUNK_SIZE = 1024 * 1024
+
+
+# Content-addressed store for attachment binaries. Every blob is saved under
+# its SHA-256 (attachments/ab/abcdef...), so identical files such as repeated
+# screenshots are kept once however many entities they are attached to.
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def has(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def open(self, sha256):
+        return open(self.path(sha256), 'rb')
+
+    # Write an iterable of byte chunks to the store, hashing while writing, and
+    # return (sha256, size). Nothing is kept in memory beyond one chunk.
+    def save_chunks(self, chunks):
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            sha256 = digest.hexdigest()
+            blob_path = self.path(sha256)
+            if os.path.exists(blob_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(tmp_path, blob_path)
+            return sha256, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,73 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from testrail_client import RateLimiter, TestRailClient
+
+# Compares per-request latency of one-off requests.get calls (a new connection
+# per call, as the scripts used to do) against the pooled TestRailClient session.
+# Usage: python benchmark_client.py --requests 500
+
+
+# Minimal stand-in for the TestRail API that answers every GET with a small JSON body
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like a real TestRail server
+    disable_nagle_algorithm = True  # Avoid delayed-ACK stalls on reused connections
+
+    def do_GET(self):
+        body = json.dumps({'offset': 0, 'limit': 250, 'size': 1, 'cases': [{'id': 1, 'title': 'Stub case'}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def time_requests(fetch, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        response = fetch()
+        response.raise_for_status()
+        response.json()
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pooled vs unpooled TestRail requests against a local stub server.')
+    parser.add_argument('--requests', type=int, default=500, help='Number of requests per mode')
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    # A limiter that never throttles, so the client itself is measured
+    client = TestRailClient(base_url, 'user@example.com', 'key', limiter=RateLimiter(rate=1e6, max_rate=1e6))
+    url = client.url('get_cases/1')
+
+    try:
+        unpooled = time_requests(lambda: requests.get(url, auth=('user@example.com', 'key')), args.requests)
+        pooled = time_requests(lambda: client.get('get_cases/1'), args.requests)
+    finally:
+        client.close()
+        server.shutdown()
+
+    print(f"requests.get (new connection per call): {unpooled * 1000:.3f} ms/request")
+    print(f"TestRailClient (pooled keep-alive):     {pooled * 1000:.3f} ms/request")
+    print(f"Speedup: {unpooled / pooled:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import io
+import json
+import logging
+import time
+
+import json_codec
+from fake_testrail import FakeData
+
+# Micro-benchmark of the JSON paths the scripts run per record, with the
+# standard library and with orjson (when installed): decoding a page of an API
+# response, encoding a POST body, writing and reading a JSON Lines record and
+# logging a POST payload (formatted for every request, as post_data used to,
+# against one in payload_log_every). Records are synthetic cases and results
+# from fake_testrail.py. Reports microseconds per record.
+# Usage: python benchmark_codec.py --records 5000 --text-size 2000
+
+
+# Best of repeat runs of func over records, in microseconds per record
+def per_record(func, records, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(records)
+        best = min(best, time.perf_counter() - start)
+    return best / len(records) * 1e6
+
+
+# Per-record cost of the codec paths with the current codec
+def measure_codec(records, repeat):
+    page = json.dumps({'offset': 0, 'limit': len(records), 'size': len(records), 'records': records}).encode('utf-8')
+    lines = [json_codec.dumps(record) for record in records]
+    return {
+        'decode response': per_record(lambda records: json_codec.loads(page), records, repeat),
+        'encode POST body': per_record(lambda records: [json_codec.dumps_bytes(r) for r in records], records, repeat),
+        'write JSONL': per_record(lambda records: [json_codec.dumps(r) for r in records], records, repeat),
+        'read JSONL': per_record(lambda records: [json_codec.loads(line) for line in lines], records, repeat),
+    }
+
+
+# Per-record cost of logging the indented payload of one POST in every, as post_data does
+def measure_logging(records, repeat, every):
+    logger = logging.getLogger('benchmark_codec')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.handlers = [logging.StreamHandler(io.StringIO())]
+
+    def log_payloads(records):
+        for i, record in enumerate(records):
+            if every and i % every == 0:
+                logger.info(f"Posting with data: {json.dumps(record, indent=4)}")
+    return per_record(log_payloads, records, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the JSON codecs on synthetic TestRail records.')
+    parser.add_argument('--records', type=int, default=5000, help='Cases (and about as many results) per measurement')
+    parser.add_argument('--text-size', type=int, default=400, help='Characters of each case text field')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the fastest is reported')
+    parser.add_argument('--log-every', type=int, default=100, help='Sampling rate of the logged payloads (import payload_log_every)')
+    args = parser.parse_args()
+
+    data = FakeData(cases=args.records, sections=50, plans=1, runs_per_plan=1, runs=0,
+                    tests_per_run=max(1, args.records // 2), results_per_test=2, attachment_every=0, text_size=args.text_size)
+    samples = {'cases': list(data.cases.values()), 'results': list(data.results.values())}
+
+    codecs = ['json'] + (['orjson'] if json_codec.orjson is not None else [])
+    timings = {}
+    for name in codecs:
+        json_codec.use(name)
+        timings[name] = {entity: measure_codec(records, args.repeat) for entity, records in samples.items()}
+    if json_codec.orjson is None:
+        print("orjson is not installed; only the standard library is measured (pip install orjson)")
+
+    header = f"{'entity':<8} {'path':<20}" + ''.join(f" {name + ' us':>10}" for name in codecs)
+    print(header + (f" {'speedup':>8}" if len(codecs) > 1 else ''))
+    for entity in samples:
+        for path in timings['json'][entity]:
+            values = [timings[name][entity][path] for name in codecs]
+            line = f"{entity:<8} {path:<20}" + ''.join(f" {value:>10.2f}" for value in values)
+            if len(values) > 1 and values[1]:
+                line += f" {values[0] / values[1]:>7.1f}x"
+            print(line)
+
+    print()
+    print(f"{'entity':<8} {'payload logging':<20} {'every us':>10} {f'1/{args.log_every} us':>10} {'speedup':>8}")
+    for entity, records in samples.items():
+        every = measure_logging(records, args.repeat, 1)
+        sampled = measure_logging(records, args.repeat, args.log_every)
+        print(f"{entity:<8} {'post_data':<20} {every:>10.2f} {sampled:>10.2f} {every / sampled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
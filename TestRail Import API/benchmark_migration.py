@@ -0,0 +1,215 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from fake_testrail import add_data_arguments, server_from_args
+
+# End-to-end benchmark: seeds a local fake TestRail server, runs a full export
+# of the source project and a full import of the result into an empty project,
+# and reports wall time, requests/second and peak RSS of each phase. Each phase
+# runs in its own process so its peak memory is measured in isolation.
+# Usage: python benchmark_migration.py --cases 5000 --runs 20 --latency 0.01
+
+# Stages enabled in each phase
+EXPORT_STAGES = ['milestones', 'test_cases', 'sections', 'suites', 'test_plans', 'test_runs', 'test_results',
+                 'tests', 'attachments_for_case', 'attachments_for_plan', 'attachments_for_run', 'attachments_for_test']
+IMPORT_STAGES = ['milestones', 'suites', 'sections', 'test_cases', 'test_runs', 'test_results',
+                 'attachments_for_case', 'attachments_for_run', 'attachments_for_test']
+# Stages of every phase when comparing against a streaming migration (--migrate)
+MIGRATE_STAGES = ['milestones', 'suites', 'sections', 'test_cases', 'test_runs', 'test_results']
+
+
+# Peak resident set size of this process in MiB, or None where it cannot be measured
+def peak_rss_mb():
+    # VmHWM covers only this process image; on Linux ru_maxrss also counts the
+    # memory of the parent (the fake server) that the child had before exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Point a script module at the fake server and the benchmark's output directory
+def configure(module, args, stages):
+    from response_cache import ResponseCache
+    from testrail_client import RateLimiter, TestRailClient
+
+    module.client = TestRailClient(args.url, 'user@example.com', 'key', pool_size=module.pool_size,
+                                   limiter=RateLimiter(rate=args.client_rate, max_rate=args.client_rate),
+                                   max_retries=module.max_retries, metrics=module.metrics)
+    module.script_dir = args.out
+    module.archive_filename = args.archive
+    module.store_filename = args.store
+    module.progress_interval = 0  # The plan's own requests would be counted as part of the phase
+    module.response_cache = ResponseCache(os.path.join(args.out, module.cache_dirname), namespace=args.url)
+    for name in module.import_config:
+        module.import_config[name] = name in stages
+
+
+# Run a streaming migration from the source project into project_id
+def run_migration(args):
+    import migrate
+    from record_streams import RecordStreams
+    from testrail_client import RateLimiter
+
+    migrate.source_base_url = migrate.target_base_url = args.url
+    migrate.source_project_id = args.source_project_id
+    migrate.target_project_id = args.project_id
+    migrate.script_dir = args.out
+    for stage in migrate.migrate_config:
+        migrate.migrate_config[stage] = stage in MIGRATE_STAGES
+    streams = RecordStreams(migrate.queue_size)
+    migrate.configure(streams)
+    for module in (migrate.export, migrate.importer):
+        module.client.limiter = RateLimiter(rate=args.client_rate, max_rate=args.client_rate)
+        module.max_workers = args.workers
+    logging.getLogger().setLevel(logging.WARNING)
+    migrate.run(streams)
+
+
+# Run one phase in this (child) process and print its measurements as JSON
+def run_phase(args):
+    start = time.perf_counter()
+    if args.phase == 'migrate':
+        run_migration(args)
+        print(json.dumps({'wall_time': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}))
+        return
+    if args.phase == 'export':
+        import export_testrail as module
+        module.project_id = args.project_id
+        module.max_workers = args.workers
+        module.output_format = args.output_format
+        module.drop_unused_fields = args.drop_unused_fields
+        configure(module, args, MIGRATE_STAGES + ['test_plans', 'tests'] if args.migrate else EXPORT_STAGES)
+    else:
+        import import_testrail as module
+        module.new_project_id = args.project_id
+        configure(module, args, MIGRATE_STAGES if args.migrate else IMPORT_STAGES)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    try:
+        module.main()
+    finally:
+        module.client.close()
+    print(json.dumps({'wall_time': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def run_child(phase, server, project_id, args, out=None):
+    command = [
+        sys.executable, os.path.abspath(__file__), '--phase', phase, '--url', server.url, '--out', out or args.out,
+        '--project-id', str(project_id), '--source-project-id', str(min(server.data.projects)),
+        '--client-rate', str(args.client_rate), '--workers', str(args.workers), '--output-format', args.output_format,
+    ] + (['--drop-unused-fields'] if args.drop_unused_fields else []) + (['--archive', args.archive] if args.archive else []) + (['--store', args.store] if args.store else []) + (
+        ['--migrate'] if args.migrate else [])
+    before = server.stats()
+    completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    after = server.stats()
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit(f"{phase} phase failed with exit code {completed.returncode}")
+    measurements = json.loads(completed.stdout.strip().splitlines()[-1])
+    requests = after['requests'] - before['requests']
+    measurements.update({
+        'phase': phase,
+        'requests': requests,
+        'requests_per_second': requests / measurements['wall_time'] if measurements['wall_time'] else 0.0,
+        'throttled': after['throttled'] - before['throttled'],
+        'failed': after['failed'] - before['failed'],
+        'bytes_sent': after['bytes_in'] - before['bytes_in'],
+        'bytes_received': after['bytes_out'] - before['bytes_out'],
+        'errors_logged': completed.stderr.count(' - ERROR - '),
+    })
+    return measurements
+
+
+def print_report(results):
+    print(f"{'phase':<8} {'wall s':>8} {'requests':>9} {'req/s':>8} {'peak RSS MiB':>13} {'429s':>6} {'5xx':>6} {'MiB in':>8} {'MiB out':>8} {'errors':>7}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else 'n/a'
+        print(f"{r['phase']:<8} {r['wall_time']:>8.2f} {r['requests']:>9} {r['requests_per_second']:>8.1f} {rss:>13} "
+              f"{r['throttled']:>6} {r['failed']:>6} {r['bytes_received'] / 1048576:>8.2f} {r['bytes_sent'] / 1048576:>8.2f} "
+              f"{r['errors_logged']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark a full export and import against a local fake TestRail server.')
+    add_data_arguments(parser)
+    parser.add_argument('--client-rate', type=float, default=1000.0, help='Client-side request rate limit per second')
+    parser.add_argument('--workers', type=int, default=8, help='Export max_workers')
+    parser.add_argument('--output-format', choices=['json', 'jsonl'], default='json', help='Export output format')
+    parser.add_argument('--drop-unused-fields', action='store_true', help='Drop fields the import never sends as the export fetches them')
+    parser.add_argument('--archive', help='Export into and import from this single archive file (e.g. export.zip)')
+    parser.add_argument('--store', help='Export into and import from this SQLite store (e.g. export.sqlite)')
+    parser.add_argument('--migrate', action='store_true',
+                        help='Compare export + import of the core entities with a streaming migration (migrate.py)')
+    parser.add_argument('--max-export-rss', type=float,
+                        help='Fail unless the export phase peaks below this many MiB of RSS (memory ceiling check)')
+    parser.add_argument('--out', help='Directory for the exported files (a temporary directory by default)')
+    parser.add_argument('--json', action='store_true', help='Print the measurements as JSON instead of a table')
+    # Internal: run a single phase in a child process
+    parser.add_argument('--phase', choices=['export', 'import', 'migrate'], help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--project-id', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--source-project-id', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        run_phase(args)
+        return
+
+    server = server_from_args(args).start()
+    source_project_id = min(server.data.projects)
+    target_project_id = max(server.data.projects)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        args.out = args.out or tmp_dir
+        os.makedirs(args.out, exist_ok=True)
+        try:
+            results = [
+                run_child('export', server, source_project_id, args),
+                run_child('import', server, target_project_id, args),
+            ]
+            if args.migrate:
+                with server.data.lock:
+                    migrate_project_id = server.data.add_project({'name': 'Migration target'})['id']
+                migrate_dir = os.path.join(args.out, 'migrate')
+                os.makedirs(migrate_dir, exist_ok=True)
+                results.append(run_child('migrate', server, migrate_project_id, args, out=migrate_dir))
+        finally:
+            server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_report(results)
+    if args.max_export_rss:
+        peak = results[0]['peak_rss_mb']
+        if peak is None:
+            sys.stderr.write("Peak RSS cannot be measured on this platform; memory ceiling not checked\n")
+        elif peak > args.max_export_rss:
+            raise SystemExit(f"Export peak RSS {peak:.1f} MiB exceeds the ceiling of {args.max_export_rss:g} MiB")
+        else:
+            print(f"Export peak RSS {peak:.1f} MiB is within the ceiling of {args.max_export_rss:g} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager
+
+from attachment_store import CHUNK_SIZE
+from export_files import read_records
+
+# Members up to this size are spooled in memory before being added to the
+# archive; larger ones overflow to a temporary file
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Member listing every other member with its size and record count
+INDEX_MEMBER = 'index.json'
+
+# Archive directory holding the attachment blobs, by SHA-256 as in BlobStore
+BLOBS_DIR = 'attachments'
+
+
+# Single-file export: every export file and attachment blob is a member of one
+# deflate-compressed ZIP archive instead of a file of its own. The ZIP central
+# directory indexes the members, so the importer opens any member directly
+# without extracting the others. Members are spooled while they are produced
+# and then copied into the archive under a lock, so workers can write members
+# concurrently. A new archive is written to a .part file and only moved into
+# place by close(), so an interrupted export never leaves a truncated archive.
+class ExportArchive:
+    def __init__(self, path, mode='r', compresslevel=6):
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.zip_path = f'{path}.part' if mode == 'w' else path
+        self.zip = zipfile.ZipFile(self.zip_path, mode, compression=zipfile.ZIP_DEFLATED,
+                                   compresslevel=compresslevel, allowZip64=True)
+        self.members = {info.filename: info.file_size for info in self.zip.infolist()}
+        self.records = {}  # Record count of each member written through writer()
+
+    def has(self, name):
+        return name in self.members
+
+    def names(self):
+        return list(self.members)
+
+    # Text file whose content becomes member name once the block exits without an error
+    @contextmanager
+    def writer(self, name):
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+            text = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+            yield text
+            text.flush()
+            text.detach()
+            self.add(name, spool)
+
+    # Copy an open binary file into the archive as member name. Members are
+    # written once; a name that is already in the archive keeps its content.
+    def add(self, name, f):
+        f.seek(0)
+        with self.lock:
+            if name in self.members:
+                return
+            with self.zip.open(name, 'w', force_zip64=True) as member:
+                shutil.copyfileobj(f, member, CHUNK_SIZE)
+            self.members[name] = self.zip.getinfo(name).file_size
+
+    # Record count of a member, listed in the index
+    def set_records(self, name, count):
+        with self.lock:
+            self.records[name] = count
+
+    # Open a member for reading as binary, without extracting it
+    def open(self, name):
+        return self.zip.open(name)
+
+    # Lazily yield the records of an export file stored in the archive
+    def iter_records(self, name, key=None, group=None):
+        with io.TextIOWrapper(self.open(name), encoding='utf-8') as f:
+            yield from read_records(f, key, jsonl=name.endswith('.jsonl'), group=group)
+
+    # Finish the archive. A new archive is moved into place only if commit is
+    # set; otherwise it stays behind as a readable .part file.
+    def close(self, commit=True):
+        with self.lock:
+            if self.mode == 'w':
+                index = {
+                    name: {'size': size, 'records': self.records.get(name)}
+                    for name, size in sorted(self.members.items())
+                }
+                self.zip.writestr(INDEX_MEMBER, json.dumps({'members': index}, indent=4))
+            self.zip.close()
+        if self.mode == 'w' and commit:
+            os.replace(self.zip_path, self.path)
+
+
+# BlobStore counterpart that keeps the attachment blobs inside an ExportArchive
+class ArchiveBlobStore:
+    def __init__(self, archive, root=BLOBS_DIR):
+        self.archive = archive
+        self.root = root
+
+    def name(self, sha256):
+        return f'{self.root}/{sha256[:2]}/{sha256}'
+
+    def has(self, sha256):
+        return self.archive.has(self.name(sha256))
+
+    def open(self, sha256):
+        return self.archive.open(self.name(sha256))
+
+    # Spool an iterable of byte chunks, hashing while writing, and add it to the
+    # archive unless a blob with the same content is already there. Returns (sha256, size).
+    def save_chunks(self, chunks):
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+            for chunk in chunks:
+                if chunk:
+                    digest.update(chunk)
+                    spool.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            self.archive.add(self.name(sha256), spool)
+        return sha256, size
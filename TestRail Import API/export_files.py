@@ -0,0 +1,273 @@
+import json
+import os
+import re
+import textwrap
+
+import json_codec
+
+# Export file formats shared by the export and import scripts:
+#   'json'  - one indented JSON document per file (the original format)
+#   'jsonl' - JSON Lines, one compact record per line, appended as records arrive
+# Both are written and read back lazily, so no entity set is ever held in RAM.
+OUTPUT_FORMATS = ('json', 'jsonl')
+
+# Characters read at a time from a .json export file while streaming its records
+READ_SIZE = 1 << 16
+
+# Items per chunk when the grouped documents of a .json file are read in chunks
+CHUNK_ITEMS = 250
+
+WHITESPACE = re.compile(r'\s*')
+DECODER = json.JSONDecoder()
+
+
+# File name for the given format, e.g. test_cases.json -> test_cases.jsonl
+def format_filename(filename, output_format):
+    root, _ = os.path.splitext(filename)
+    return f'{root}.{output_format}'
+
+
+# Stream items into an open file as indented JSON, byte-for-byte what
+# json.dump(..., indent=4) writes for {key: items}, or for the bare list if key is None
+def write_json_items(items, f, key=None):
+    count = 0
+    f.write(f'{{\n    {json.dumps(key)}: [' if key else '[')
+    indent = ' ' * 8 if key else ' ' * 4
+    for item in items:
+        f.write(',\n' if count else '\n')
+        f.write(textwrap.indent(json.dumps(item, indent=4), indent))
+        count += 1
+    f.write(f'\n{indent[4:]}]' if count else ']')
+    f.write('\n}' if key else '')
+    return count
+
+
+# Stream {group: id, items_key: [...]} chunks into an open file as indented
+# JSON, merging consecutive chunks of the same group into one document, so a
+# group's items can be written a page at a time. The file is byte-for-byte what
+# json.dump(..., indent=4) writes for the list of merged documents. Returns the
+# number of documents written.
+def write_json_groups(chunks, f, group, items_key='results'):
+    count = 0
+    current = None
+    written = 0  # Items of the current document
+    f.write('[')
+    for chunk in chunks:
+        if not count or chunk.get(group) != current:
+            if count:
+                f.write('\n        ]\n    }' if written else ']\n    }')
+            f.write(',\n' if count else '\n')
+            current = chunk.get(group)
+            f.write(f'    {{\n        {json.dumps(group)}: {json.dumps(current)},\n        {json.dumps(items_key)}: [')
+            count += 1
+            written = 0
+        for item in chunk.get(items_key) or []:
+            f.write(',\n' if written else '\n')
+            f.write(textwrap.indent(json.dumps(item, indent=4), ' ' * 12))
+            written += 1
+    if count:
+        f.write('\n        ]\n    }' if written else ']\n    }')
+    f.write('\n]' if count else ']')
+    return count
+
+
+# Stream items into an open file as JSON Lines
+def write_jsonl_items(items, f):
+    count = 0
+    for item in items:
+        f.write(json_codec.dumps(item))
+        f.write('\n')
+        count += 1
+    return count
+
+
+# Lazily yield the records stored in a .json or .jsonl export file.
+# For JSON documents shaped like a TestRail bulk response the records are
+# read from doc[key]; a lone object is yielded as a single record. In JSON
+# Lines files a line without an 'id' that holds a key list is a whole bulk
+# response written by save_data, and its items are yielded instead. With
+# group, the records are {group: id, 'results': [...]} documents (such as
+# test_results), yielded in chunks of consecutive results of a group.
+def iter_records(file_path, key=None, group=None):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield from read_records(f, key, jsonl=file_path.endswith('.jsonl'), group=group)
+
+
+# Reader of one JSON document from an open text file that decodes the items of
+# its arrays one at a time, so only the current item (and one read buffer) is
+# held in memory instead of the whole document
+class JsonStream:
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    # Next non-whitespace character, without consuming it ('' at the end)
+    def peek(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.read_more()
+
+    def read_more(self, size=READ_SIZE):
+        chunk = self.f.read(size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    # Consume the next character, which must be one of chars
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON document, found {char or 'the end'!r}")
+        self.pos += 1
+        return char
+
+    # Decode the next value. A value ending at the end of the buffer may be cut
+    # short (e.g. a number), so it is only accepted once more text follows it.
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Read at least as much again as is buffered, so a large value is decoded a few times at most
+            self.read_more(max(READ_SIZE, len(self.buffer) - self.pos))
+
+    # Lazily yield the items of the array whose '[' is next
+    def items(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+    # Lazily yield the records of the document: the items of a list, of the
+    # key member of an object, or a lone object (see iter_records)
+    def records(self, key=None):
+        first = self.peek()
+        if first == '[':
+            yield from self.items()
+        elif first == '{' and key:
+            self.expect('{')
+            if self.peek() == '}':
+                return
+            while True:
+                name = self.value()
+                self.expect(':')
+                if name == key and self.peek() == '[':
+                    yield from self.items()
+                else:
+                    value = self.value()
+                    if name == key:
+                        yield from value or []
+                if self.expect(',}') == '}':
+                    return
+        else:
+            data = self.value()
+            if data is not None:
+                yield data
+
+    # Lazily yield the {group: id, items_key: [...]} documents of a list (as
+    # written by write_json_groups) as chunks of at most CHUNK_ITEMS items, so
+    # not even one document is held whole. A document's items are streamed when
+    # its group member comes first, as write_json_groups writes it.
+    def chunks(self, group, items_key='results'):
+        if self.peek() != '[':
+            yield from self.records()
+            return
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() == '{':
+                yield from self.document_chunks(group, items_key)
+            else:
+                yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+    def document_chunks(self, group, items_key):
+        self.expect('{')
+        document = {}
+        streamed = False
+        while self.peek() != '}':
+            name = self.value()
+            self.expect(':')
+            if name == items_key and group in document and self.peek() == '[':
+                batch = []
+                for item in self.items():
+                    batch.append(item)
+                    if len(batch) >= CHUNK_ITEMS:
+                        yield {**document, items_key: batch}
+                        batch = []
+                        streamed = True
+                if batch or not streamed:
+                    yield {**document, items_key: batch}
+                streamed = True
+            else:
+                document[name] = self.value()
+            if self.peek() != '}':
+                self.expect(',')
+        self.pos += 1
+        if not streamed:
+            yield document
+
+
+# Lazily yield the records of an open export file (see iter_records). JSON
+# documents are decoded a record at a time as well (see JsonStream).
+def read_records(f, key=None, jsonl=False, group=None):
+    if jsonl:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json_codec.loads(line)
+            if key and isinstance(record, dict) and 'id' not in record and isinstance(record.get(key), list):
+                yield from record[key]
+            else:
+                yield record
+        return
+
+    if group is not None:
+        yield from JsonStream(f).chunks(group)
+    else:
+        yield from JsonStream(f).records(key)
+
+
+# Rewrite an export file with the delta records merged in by id_field: existing
+# records are replaced in place (or combined via combine(old, new)) and new ones
+# appended. Existing records are streamed through a temporary file, so only the
+# delta is held in memory. Returns the number of records written.
+def merge_records(file_path, delta, key=None, id_field='id', combine=None):
+    pending = {record[id_field]: record for record in delta if isinstance(record, dict) and id_field in record}
+
+    def merged():
+        if os.path.exists(file_path):
+            for record in iter_records(file_path, key):
+                record_id = record.get(id_field) if isinstance(record, dict) else None
+                if record_id in pending:
+                    new = pending.pop(record_id)
+                    yield combine(record, new) if combine else new
+                else:
+                    yield record
+        yield from pending.values()
+
+    tmp_path = f'{file_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if file_path.endswith('.jsonl'):
+            count = write_jsonl_items(merged(), f)
+        else:
+            count = write_json_items(merged(), f, key)
+    os.replace(tmp_path, file_path)
+    return count
@@ -0,0 +1,221 @@
+import os
+import re
+import sqlite3
+import threading
+
+import json_codec
+
+# Rows inserted per transaction while writing
+BATCH_SIZE = 1000
+
+# Fields copied from each record into columns of their own (when present), and
+# the ones of those that are indexed; the whole record is kept as JSON in data
+COLUMNS = ('id', 'project_id', 'suite_id', 'section_id', 'milestone_id', 'plan_id', 'run_id', 'test_id', 'case_id')
+INDEXED = ('id', 'project_id', 'section_id', 'run_id', 'case_id')
+
+# Export files and the table their records are stored in, with
+#   context - column filled from the ID in the file name ('{0}' is replaced by
+#             the first group of the pattern, e.g. attachments_case_7 -> case_id = 7)
+#   group   - the file holds {group: id, 'results': [...]} documents, whose
+#             results are stored one per row with the group ID in that column
+#             (groups without results are not kept)
+# Files that match no pattern (lookups, project settings, ...) go to 'records'.
+FILE_TABLES = [
+    (re.compile(r'^test_cases$'), 'cases', None, None),
+    (re.compile(r'^sections$'), 'sections', None, None),
+    (re.compile(r'^suites$'), 'suites', None, None),
+    (re.compile(r'^milestones$'), 'milestones', None, None),
+    (re.compile(r'^test_plans$'), 'plans', None, None),
+    (re.compile(r'^(?:test_)?runs$'), 'runs', None, None),
+    (re.compile(r'^tests_run_(\d+)$'), 'tests', 'run_id', None),
+    (re.compile(r'^test_results$'), 'results', None, 'run_id'),
+    (re.compile(r'^results_run_(\d+)$'), 'results', 'run_id', 'test_id'),
+    (re.compile(r'^attachments_(case|plan|run|test)_(\d+)$'), 'attachments', '{0}_id', None),
+]
+DEFAULT_TABLE = 'records'
+TABLES = sorted({table for _, table, _, _ in FILE_TABLES} | {DEFAULT_TABLE})
+
+
+def file_stem(filename):
+    return os.path.splitext(filename)[0]
+
+
+# The records of a document passed to save_data: a list, the item list of a
+# bulk response ({'offset': ..., 'users': [...]}, {'runs': [...]}) or one object
+def records_of(data, key=None):
+    if isinstance(data, list):
+        return data
+    if not isinstance(data, dict):
+        return []
+    if key is None:
+        lists = [name for name, value in data.items() if isinstance(value, list)]
+        if len(lists) == 1 and ('offset' in data or len(data) == 1):
+            key = lists[0]
+    return data[key] if key and isinstance(data.get(key), list) else [data]
+
+
+# Optional SQLite store for an export: one table per entity type with indexed
+# ID columns and the raw JSON of every record, so the importer can read just
+# the records it needs (the cases of one section, the results of one run) in
+# their original order instead of parsing whole files. Records are inserted in
+# batched transactions; every thread reads through its own connection.
+class ExportStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.readers = []
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        columns = ''.join(f' {column} INTEGER,' for column in COLUMNS)
+        for table in TABLES:
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ('
+                ' seq INTEGER PRIMARY KEY,'
+                ' file TEXT NOT NULL,'
+                f'{columns}'
+                ' data TEXT NOT NULL)'
+            )
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_file ON {table} (file, seq)')
+            for column in INDEXED:
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            ' file TEXT PRIMARY KEY,'
+            ' table_name TEXT NOT NULL,'
+            ' records INTEGER NOT NULL)'
+        )
+        self.conn.commit()
+
+    # (table, context column, context value, group field) of an export file
+    @staticmethod
+    def layout(file):
+        for pattern, table, context, group in FILE_TABLES:
+            match = pattern.match(file)
+            if match:
+                if context is None:
+                    return table, None, None, group
+                return table, context.format(*match.groups()), int(match.groups()[-1]), group
+        return DEFAULT_TABLE, None, None, None
+
+    def _reader(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, check_same_thread=False)
+            with self.lock:
+                self.readers.append(conn)
+        return conn
+
+    def _insert(self, table, rows):
+        with self.lock:
+            self.conn.executemany(
+                f'INSERT INTO {table} (file, {", ".join(COLUMNS)}, data) VALUES (?, {", ".join("?" * len(COLUMNS))}, ?)',
+                rows
+            )
+            self.conn.commit()
+
+    def _discard(self, table, file):
+        with self.lock:
+            self.conn.execute(f'DELETE FROM {table} WHERE file = ?', (file,))
+            self.conn.commit()
+
+    # Replace the records of an export file with the given records, consumed
+    # lazily and inserted BATCH_SIZE rows per transaction under a staging name.
+    # The staged rows only replace the file's previous rows once records is
+    # exhausted, so an error while iterating it keeps the previous rows (and
+    # their count in files). Returns the count.
+    def write(self, filename, records):
+        file = file_stem(filename)
+        table, context, context_id, group = self.layout(file)
+        staging = f'{file}.partial'
+        self._discard(table, staging)  # Left over from an interrupted write
+        try:
+            count = self._stage(table, staging, context, context_id, group, records)
+        except BaseException:
+            self._discard(table, staging)
+            raise
+        with self.lock:
+            self.conn.execute(f'DELETE FROM {table} WHERE file = ?', (file,))
+            self.conn.execute(f'UPDATE {table} SET file = ? WHERE file = ?', (file, staging))
+            self.conn.execute('INSERT OR REPLACE INTO files (file, table_name, records) VALUES (?, ?, ?)',
+                              (file, table, count))
+            self.conn.commit()
+        return count
+
+    # Insert the rows of records under the staging file name; returns the record count
+    def _stage(self, table, staging, context, context_id, group, records):
+        rows = []
+        count = 0
+        for record in records:
+            count += 1
+            if group is not None and isinstance(record, dict):
+                items = [(item, {group: record.get(group)}) for item in record.get('results') or []]
+            else:
+                items = [(record, {})]
+            for item, extra in items:
+                fields = dict(item) if isinstance(item, dict) else {}
+                fields.update(extra)
+                if context is not None:
+                    fields[context] = context_id
+                rows.append((staging,) + tuple(fields.get(column) if isinstance(fields.get(column), int) else None
+                                               for column in COLUMNS) + (json_codec.dumps(item),))
+            if len(rows) >= BATCH_SIZE:
+                self._insert(table, rows)
+                rows = []
+        self._insert(table, rows)
+        return count
+
+    def has(self, filename):
+        return self._reader().execute('SELECT 1 FROM files WHERE file = ?', (file_stem(filename),)).fetchone() is not None
+
+    # Names of the stored export files, as .json file names
+    def filenames(self):
+        return [f'{file}.json' for file, in self._reader().execute('SELECT file FROM files ORDER BY file')]
+
+    # Lazily yield the records of an export file in their original order, as
+    # iter_records does for the file itself. Grouped files yield one
+    # {group: id, 'results': [...]} document per group.
+    def iter_records(self, filename, key=None):
+        file = file_stem(filename)
+        table, _, _, group = self.layout(file)
+        rows = self._reader().execute(f'SELECT {group or "NULL"}, data FROM {table} WHERE file = ? ORDER BY seq', (file,))
+        if group is None:
+            for _, data in rows:
+                yield json_codec.loads(data)
+            return
+        current = None
+        for group_id, data in rows:
+            if current is None or current[group] != group_id:
+                if current is not None:
+                    yield current
+                current = {group: group_id, 'results': []}
+            current['results'].append(json_codec.loads(data))
+        if current is not None:
+            yield current
+
+    # Lazily yield the records of a table matching column = value filters, in
+    # export order, e.g. query('cases', section_id=12) or query('results', case_id=7)
+    def query(self, table, **filters):
+        if table not in TABLES or any(column not in COLUMNS + ('file',) for column in filters):
+            raise ValueError(f"Unknown table or column in query: {table} {sorted(filters)}")
+        where = ' AND '.join(f'{column} = ?' for column in filters) or '1'
+        rows = self._reader().execute(f'SELECT data FROM {table} WHERE {where} ORDER BY seq', tuple(filters.values()))
+        for data, in rows:
+            yield json_codec.loads(data)
+
+    # Distinct values of a column among the matching records, in export order
+    def values(self, table, column, **filters):
+        if table not in TABLES or any(name not in COLUMNS + ('file',) for name in (column, *filters)):
+            raise ValueError(f"Unknown table or column in query: {table} {column} {sorted(filters)}")
+        where = ' AND '.join(f'{name} = ?' for name in filters) or '1'
+        rows = self._reader().execute(
+            f'SELECT {column} FROM {table} WHERE {where} GROUP BY {column} ORDER BY MIN(seq)', tuple(filters.values()))
+        return [value for value, in rows]
+
+    def close(self):
+        with self.lock:
+            for conn in self.readers:
+                conn.close()
+            self.readers = []
+            self.conn.close()
@@ -1,8 +1,29 @@
 import requests
+import itertools
 import json
 import os
 import logging
+import multiprocessing
+import queue
+import sqlite3
 import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import json_codec
+from attachment_store import CHUNK_SIZE, BlobStore
+from export_archive import ArchiveBlobStore, ExportArchive
+from export_files import format_filename, iter_records, merge_records, write_json_groups, write_json_items, write_jsonl_items
+from export_state import ExportState
+from export_store import ExportStore, records_of
+from field_projections import fetch_projection, project_all
+from request_metrics import RequestMetrics
+from response_cache import ResponseCache
+from result_spool import ResultSpool
+from run_planner import ProgressReporter, RunPlan, StagePlan, count_items, format_duration, mean, measured_latency, pages, sample_counts, spread
+from testrail_client import PaginationError, RateLimiter, SharedRateLimiter, TestRailClient, paginate, paginate_pages
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,11 +33,33 @@ base_url = 'https://your_testrail_instance.testrail.io'
 username = 'your_email@example.com'  # Your TestRail email
 api_key = 'your_api_key'
 project_id = 2  # Your project ID
+project_ids = None  # e.g. [2, 5, 9] or 'all' (every active project): export several projects at once, each into project_<id>/
+project_workers = 4  # Projects exported in parallel when project_ids is set, each in its own process
+pool_size = 10  # Number of pooled keep-alive connections to TestRail
+rate_limit = 5  # Starting request rate per second; adapts to TestRail's 429 responses
+max_retries = 8  # Retries with exponential backoff for throttled or failed requests
+metrics_interval = 60  # Seconds between request metrics snapshots written during a run (0 = only at the end)
+metrics_filename = 'export_metrics.json'  # Per-endpoint request counts, latencies, bytes, status codes and retries
+prometheus_filename = 'export_metrics.prom'  # The same metrics in Prometheus textfile format
+plan_only = False  # Only estimate the requests and duration of every enabled stage with a few cheap calls, log the plan and exit
+progress_interval = 0  # Seconds between progress/ETA log lines, measured against a plan made before the run (0 = no plan)
+max_workers = 8  # Number of concurrent requests for per-plan/run/test stages (1 = sequential)
+pages_ahead = 2  # Pages of a run's tests or results buffered per worker while earlier runs are written
+output_format = 'json'  # 'json' (indented documents) or 'jsonl' (streamed JSON Lines, one record per line)
+archive_filename = None  # e.g. 'testrail_export.zip': write all export files and attachments into this one compressed archive
+store_filename = None  # e.g. 'testrail_export.sqlite': write the export into this indexed SQLite database instead of files
+incremental = False  # Only fetch cases, runs, plans and results changed since the last export and merge them in
+state_filename = 'export_state.json'  # High-water marks of incremental exports, kept with the export files
+download_attachments = True  # Download attachment files, not just their metadata
+attachments_dir = 'attachments'  # Attachment files, stored once per unique content by SHA-256
+cache_dirname = '.testrail_cache'  # On-disk cache of lookup endpoints (statuses, case fields, users, ...)
+drop_unused_fields = False  # Drop fields the import never sends (see field_projections.py) from milestones, sections, cases, plans and results as they are fetched
 
 # Import configuration
 import_config = {
     'milestones': True,
     'test_cases': True,
+    'sections': True,
     'test_plans': False,
     'test_runs': False,
     'test_results': False,
@@ -47,115 +90,602 @@ import_config = {
 # Get the directory of the current script
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
+# Per-endpoint metrics of every request sent by the client
+metrics = RequestMetrics(labels={'script': 'export'})
+
+# Shared client, reusing pooled connections and one rate limit across all requests
+client = TestRailClient(base_url, username, api_key, pool_size=pool_size,
+                        limiter=RateLimiter(rate=rate_limit), max_retries=max_retries, metrics=metrics)
+
+# Cache of slowly changing lookup responses, shared with the import script's cache format
+response_cache = ResponseCache(os.path.join(script_dir, cache_dirname), namespace=base_url)
+
+# High-water marks of the incremental export, loaded by main() when incremental is set
+export_state = None
+
+# Archive receiving the export files, opened by main() when archive_filename is set
+archive = None
+
+# SQLite store receiving the export records, opened by main() when store_filename is set
+store = None
+
+# Record streams receiving the export records instead of files, set by migrate.py
+streams = None
+
+# Tests and results of the runs spooled to disk for the results_run_{id} files, opened by export_project()
+result_spool = None
+
+# Export files of the current export that could not be fetched completely
+failed_files = []
+
 def get_data(endpoint):
-    url = f'{base_url}/index.php?/api/v2/{endpoint}'
+    cached, data = response_cache.get(endpoint)
+    if cached:
+        return data
+    url = client.url(endpoint)
     try:
-        response = requests.get(url, auth=(username, api_key))
+        response = client.get(endpoint)
         response.raise_for_status()  # Raise an error for bad status codes
-        return response.json()
+        data = json_codec.loads(response.content)
+        response_cache.put(endpoint, data, len(response.content))
+        return data
     except requests.exceptions.RequestException as e:
         logging.error(f"RequestException for URL {url}: {e}")
+    except ValueError as e:
+        logging.error(f"Invalid JSON from URL {url}: {e}")
     return None
 
+# Text file for an export file, in the script directory or in the archive. A
+# file only replaces the previous export once it is complete, so an error while
+# writing it keeps the previous data.
+@contextmanager
+def open_output(filename):
+    if archive is not None:
+        with archive.writer(filename) as f:
+            yield f
+        return
+    file_path = os.path.join(script_dir, filename)
+    partial_path = f'{file_path}.partial'
+    try:
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            yield f
+        os.replace(partial_path, file_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+# Record an export file that could not be fetched completely; the export then fails
+def export_failed(filename, e):
+    logging.error(f"Export of {filename} failed, keeping previous data: {e}")
+    if filename not in failed_files:
+        failed_files.append(filename)
+
+# Write the records of an export file into the SQLite store
+def save_to_store(records, filename):
+    try:
+        count = store.write(filename, records)
+        logging.info(f"Data saved to {filename} in {store_filename} ({count} items)")
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"SQLite error while saving {filename}: {e}")
+    except PaginationError as e:
+        export_failed(filename, e)
+    return False
+
 def save_data(data, filename):
-    if data is not None:
-        file_path = os.path.join(script_dir, filename)
+    if data is not None and streams is not None:
+        count = streams.put_all(filename, records_of(data))
+        logging.info(f"Streamed {count} items of {filename}")
+    elif data is not None and store is not None:
+        save_to_store(records_of(data), filename)
+    elif data is not None:
+        filename = format_filename(filename, output_format)
         try:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=4)
+            with open_output(filename) as f:
+                if output_format == 'jsonl':
+                    write_jsonl_items(data if isinstance(data, list) else [data], f)
+                else:
+                    json.dump(data, f, indent=4)
             logging.info(f"Data saved to {filename}")
         except IOError as e:
             logging.error(f"IOError while saving {filename}: {e}")
     else:
         logging.warning(f"Skipping saving {filename} due to no data.")
 
+# Write items to a file as they arrive, without holding them all in memory.
+# In 'json' format the file holds {key: [...]} like a TestRail bulk response
+# (or a bare list if key is None); in 'jsonl' format one item per line. With
+# group, items are {group: id, 'results': [...]} chunks and consecutive chunks
+# of a group become one document in 'json' format (one line each in 'jsonl').
+# Returns True on success; if a page of the items cannot be fetched the
+# previous file is kept and the export fails.
+def save_items(items, filename, key=None, group=None):
+    if streams is not None:
+        count = streams.put_all(filename, items)
+        logging.info(f"Streamed {count} items of {filename}")
+        return True
+    if store is not None:
+        return save_to_store(items, filename)
+    filename = format_filename(filename, output_format)
+    try:
+        with open_output(filename) as f:
+            if output_format == 'jsonl':
+                count = write_jsonl_items(items, f)
+            elif group is not None:
+                count = write_json_groups(items, f, group)
+            else:
+                count = write_json_items(items, f, key)
+        if archive is not None:
+            archive.set_records(filename, count)
+        logging.info(f"Data saved to {filename} ({count} items)")
+        return True
+    except IOError as e:
+        logging.error(f"IOError while saving {filename}: {e}")
+    except PaginationError as e:
+        export_failed(filename, e)
+    return False
+
+# Merge changed records into an existing export file by ID; returns True on success
+def merge_data(delta, filename, key=None, id_field='id', combine=None):
+    filename = format_filename(filename, output_format)
+    file_path = os.path.join(script_dir, filename)
+    try:
+        count = merge_records(file_path, delta, key, id_field, combine)
+        logging.info(f"Merged {len(delta)} changed items into {filename} ({count} items)")
+        return True
+    except IOError as e:
+        logging.error(f"IOError while merging into {filename}: {e}")
+        return False
+
+# Lazily read back the records of a saved export file (nothing if it is missing)
+def iter_saved(filename, key=None):
+    if store is not None:
+        if store.has(filename):
+            yield from store.iter_records(filename, key)
+        return
+    filename = format_filename(filename, output_format)
+    if archive is not None:
+        if archive.has(filename):
+            yield from archive.iter_records(filename, key)
+        return
+    file_path = os.path.join(script_dir, filename)
+    if os.path.exists(file_path):
+        yield from iter_records(file_path, key)
+
+# IDs of the records in a saved export file
+def saved_ids(filename, key=None):
+    return entity_ids(iter_saved(filename, key))
+
+# Records of an entity type as fetched, without the fields the import never
+# sends when drop_unused_fields is set
+def fetched(entity, records):
+    projection = fetch_projection(entity) if drop_unused_fields else None
+    return records if projection is None else project_all(projection, records)
+
 def fetch_and_save(endpoint, filename):
     data = get_data(endpoint)
     save_data(data, filename)
 
-def fetch_test_runs_from_plans(test_plans):
+# Fetch every page of a bulk endpoint and stream the items to a file. In an
+# incremental export only the records changed since the entity's high-water
+# mark are fetched and merged into the existing file.
+def fetch_and_save_paginated(endpoint, key, filename, entity=None):
+    if export_state is None or entity is None:
+        save_items(fetched(key, paginate(get_data, endpoint, key, strict=True)), filename, key)
+        return
+    try:
+        delta = list(fetched(key, paginate(get_data, export_state.filtered_endpoint(endpoint, entity), key, strict=True)))
+    except PaginationError as e:
+        export_failed(filename, e)  # Its high-water mark stays, so the delta is fetched again next time
+        return
+    if merge_data(delta, filename, key):
+        export_state.advance(entity, export_state.newest(delta, entity))
+
+# Apply func to every item on a bounded worker pool; results keep the input order.
+# Only a few items per worker are submitted ahead, so a long list of items does
+# not turn into as many pending futures.
+def fan_out(func, items):
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        window = deque()
+        for item in items:
+            if len(window) >= 2 * max_workers:
+                results.append(window.popleft().result())
+            window.append(executor.submit(func, item))
+        results.extend(future.result() for future in window)
+    return results
+
+# Put an item into a bounded queue, waiting while it is full unless stop is set
+def put_unless_stopped(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+# Lazily yield (item, pages) for every item in input order, where pages iterates
+# the pages (lists) of func(item). Up to max_workers items are fetched in
+# parallel ahead of the one being consumed, each buffering at most pages_ahead
+# pages, so memory is bounded by pages whatever the size of each item. An error
+# of func is raised when the consumer reaches it, as in the sequential path.
+def fan_out_pages(func, items):
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield item, iter(func(item))
+        return
+    end = object()
+    stop = threading.Event()
+
+    def produce(item, page_queue):
+        try:
+            for page in func(item):
+                if not put_unless_stopped(page_queue, page, stop):
+                    return
+        except Exception as e:
+            put_unless_stopped(page_queue, e, stop)
+            return
+        put_unless_stopped(page_queue, end, stop)
+
+    def consume(page_queue):
+        while True:
+            page = page_queue.get()
+            if page is end:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = iter(items)
+        window = deque()
+
+        def start(item):
+            page_queue = queue.Queue(maxsize=max(1, pages_ahead))
+            executor.submit(produce, item, page_queue)
+            window.append((item, page_queue))
+
+        try:
+            for item in itertools.islice(pending, max_workers):
+                start(item)
+            while window:
+                item, page_queue = window.popleft()
+                page_iter = consume(page_queue)
+                yield item, page_iter
+                try:
+                    for _ in page_iter:  # Pages the caller did not read
+                        pass
+                except Exception:
+                    pass  # Nor needs their error
+                for item in itertools.islice(pending, 1):
+                    start(item)
+        finally:
+            stop.set()
+
+# IDs of the entities that are well-formed dicts with an 'id'
+def entity_ids(entities):
+    return [entity['id'] for entity in entities if isinstance(entity, dict) and 'id' in entity]
+
+# Sections of every suite in the project (multi-suite projects need one listing per suite)
+def iter_sections():
+    suites = get_data(f'get_suites/{project_id}')
+    suite_ids = entity_ids(suites) if isinstance(suites, list) else []
+    if not suite_ids:
+        yield from fetched('sections', paginate(get_data, f'get_sections/{project_id}', 'sections', strict=True))
+    for suite_id in suite_ids:
+        yield from fetched('sections', paginate(get_data, f'get_sections/{project_id}&suite_id={suite_id}', 'sections', strict=True))
+
+def fetch_test_runs_from_plans(plan_ids):
     test_runs = []
-    if isinstance(test_plans, dict) and 'plans' in test_plans:
-        for plan in test_plans['plans']:
-            if isinstance(plan, dict) and 'id' in plan:
-                plan_id = plan['id']
-                plan_details = get_data(f'get_plan/{plan_id}')
-                if plan_details:
-                    for entry in plan_details.get('entries', []):
-                        for run in entry.get('runs', []):
-                            test_runs.append(run)
-    else:
-        logging.error("Test plans data is not in the expected format.")
+    for plan_details in fan_out(lambda plan_id: get_data(f'get_plan/{plan_id}'), plan_ids):
+        if plan_details:
+            for entry in plan_details.get('entries', []):
+                for run in entry.get('runs', []):
+                    test_runs.append(run)
     return test_runs
 
+def results_pages(run_id):
+    run_pages = paginate_pages(get_data, f'get_results_for_run/{run_id}', 'results', strict=True)
+    return (list(fetched('results', page)) for page in run_pages) if drop_unused_fields else run_pages
+
+def tests_pages(run_id):
+    return paginate_pages(get_data, f'get_tests/{run_id}', 'tests', strict=True)
+
+# {'run_id': id, 'results': page} chunks of the results of every run, a page at a
+# time and in run order (a run without results gives one empty chunk). The pages
+# are also spooled when the results_run_{id} files are exported.
+def iter_result_chunks(run_ids):
+    for run_id, run_pages in fan_out_pages(results_pages, run_ids):
+        empty = True
+        for page in run_pages:
+            empty = False
+            if result_spool is not None:
+                result_spool.add_results(run_id, page)
+            yield {'run_id': run_id, 'results': page}
+        if result_spool is not None:
+            result_spool.finish_results(run_id)
+        if empty:
+            yield {'run_id': run_id, 'results': []}
+
+# Results of a run created since its high-water mark, or None if a page failed
+def fetch_results_delta_for_run(run_id):
+    endpoint = export_state.filtered_endpoint(f'get_results_for_run/{run_id}', 'results', run_id)
+    try:
+        return list(fetched('results', paginate(get_data, endpoint, 'results', strict=True)))
+    except PaginationError as e:
+        export_failed('test_results.json', e)  # The run's high-water mark stays
+        return None
+
+# Combine a run's exported results with its delta, newer copies winning
+def merge_run_results(old, new):
+    new_ids = set(entity_ids(new['results']))
+    kept = [result for result in old.get('results', []) if not (isinstance(result, dict) and result.get('id') in new_ids)]
+    return {'run_id': old['run_id'], 'results': kept + new['results']}
+
+def fetch_and_merge_test_results(run_ids):
+    deltas = [
+        (run_id, results)
+        for run_id, results in zip(run_ids, fan_out(fetch_results_delta_for_run, run_ids))
+        if results is not None
+    ]
+    delta = [{'run_id': run_id, 'results': results} for run_id, results in deltas]
+    if merge_data(delta, 'test_results.json', id_field='run_id', combine=merge_run_results):
+        for run_id, results in deltas:
+            export_state.advance('results', export_state.newest(results, 'results', run_id), run_id)
+
+# Stream the results of every run into test_results.json a page at a time
 def fetch_and_save_test_results(test_runs):
-    all_results = []
-    for run in test_runs:
-        if isinstance(run, dict) and 'id' in run:
-            run_id = run['id']
-            results = get_data(f'get_results_for_run/{run_id}')
-            if results is not None:
-                all_results.append({
-                    'run_id': run_id,
-                    'results': results
-                })
-    save_data(all_results, 'test_results.json')
-
-def fetch_tests_with_pagination(run_id):
-    tests = []
-    offset = 0
-    limit = 250
-    while True:
-        endpoint = f'get_tests/{run_id}&offset={offset}&limit={limit}'
-        response = get_data(endpoint)
-        if response and 'tests' in response:
-            tests.extend(response['tests'])
-            if len(response['tests']) < limit:
-                break
-            offset += limit
-        else:
-            break
-    return tests
+    run_ids = entity_ids(test_runs)
+    if export_state is not None:
+        fetch_and_merge_test_results(run_ids)
+        return
+    save_items(iter_result_chunks(run_ids), 'test_results.json', group='run_id')
+
+# Store for attachment files, in the archive or in attachments_dir
+def blob_store():
+    if archive is not None:
+        return ArchiveBlobStore(archive)
+    return BlobStore(os.path.join(script_dir, attachments_dir))
+
+# SHA-256 of every attachment downloaded in this run, by attachment ID, so an
+# attachment listed under several entities (e.g. a run and its test) is fetched once
+downloaded_attachments = {}
+downloaded_attachments_lock = threading.Lock()
+
+# Stream an attachment's file into the blob store in chunks and record its
+# SHA-256 in the metadata, which the importer uses to find the file again
+def download_attachment(attachment):
+    attachment_id = attachment.get('id') or attachment.get('attachment_id')
+    with downloaded_attachments_lock:
+        sha256 = downloaded_attachments.get(attachment_id)
+    if sha256 is None:
+        url = client.url(f'get_attachment/{attachment_id}')
+        try:
+            with client.get_stream(f'get_attachment/{attachment_id}') as response:
+                response.raise_for_status()
+                sha256, _ = blob_store().save_chunks(response.iter_content(CHUNK_SIZE))
+        except requests.exceptions.RequestException as e:
+            logging.error(f"RequestException for URL {url}: {e}")
+            return attachment
+        except IOError as e:
+            logging.error(f"IOError while saving attachment {attachment_id}: {e}")
+            return attachment
+        with downloaded_attachments_lock:
+            downloaded_attachments[attachment_id] = sha256
+    attachment['sha256'] = sha256
+    return attachment
+
+# Fetch and save the attachment metadata of each entity, one file per entity,
+# downloading the attachment files alongside when download_attachments is set
+def fetch_and_save_attachments(entity, ids):
+    def fetch_one(entity_id):
+        attachments = paginate(get_data, f'get_attachments_for_{entity}/{entity_id}', 'attachments', strict=True)
+        if download_attachments:
+            attachments = (download_attachment(attachment) if isinstance(attachment, dict) else attachment
+                           for attachment in attachments)
+        save_items(attachments, f'attachments_{entity}_{entity_id}.json', 'attachments')
+    fan_out(fetch_one, ids)
+
+# Save results_run_{id}.json for every run from one results listing per run,
+# grouped by test through the spool. Runs already downloaded by the
+# test_results stage are in the spool; only the others are fetched.
+def save_results_by_test(run_ids):
+    missing = [run_id for run_id in run_ids if not result_spool.has_results(run_id)]
+    failed = set()
+    for run_id, run_pages in fan_out_pages(results_pages, missing):
+        # Drop what an interrupted test_results listing of the run spooled
+        result_spool.discard_results(run_id)
+        try:
+            for page in run_pages:
+                result_spool.add_results(run_id, page)
+        except PaginationError as e:
+            export_failed(f'results_run_{run_id}.json', e)
+            failed.add(run_id)
+            continue
+        result_spool.finish_results(run_id)
+    for run_id in run_ids:
+        if run_id not in failed:
+            save_items(result_spool.iter_results_by_test(run_id), f'results_run_{run_id}.json')
+
+# Tests of a run, spooled on their way to tests_run_{id}.json
+def spooled_tests(run_id, run_pages):
+    for page in run_pages:
+        result_spool.add_tests(run_id, page)
+        yield from page
 
 def fetch_and_save_tests_and_attachments(test_runs):
-    for run in test_runs:
-        if isinstance(run, dict) and 'id' in run:
-            run_id = run['id']
-            tests = fetch_tests_with_pagination(run_id)
-            if tests:
-                save_data(tests, f'tests_run_{run_id}.json')
-                if import_config.get('test_results'):
-                    all_results = []
-                    for test in tests:
-                        if isinstance(test, dict) and 'id' in test:
-                            test_id = test['id']
-                            results = get_data(f'get_results/{test_id}')
-                            if results:
-                                all_results.append({
-                                    'test_id': test_id,
-                                    'results': results
-                                })
-                    save_data(all_results, f'results_run_{run_id}.json')
-                if import_config.get('attachments_for_test'):
-                    for test in tests:
-                        if isinstance(test, dict) and 'id' in test:
-                            test_id = test['id']
-                            attachments = get_data(f'get_attachments_for_test/{test_id}')
-                            save_data(attachments, f'attachments_test_{test_id}.json')
+    # Each stage fans out over every run/test at once instead of nesting pools per run
+    run_ids = entity_ids(test_runs)
+    runs_with_tests = []
+    for run_id, run_pages in fan_out_pages(tests_pages, run_ids):
+        try:
+            first = next(run_pages, None)
+        except PaginationError as e:
+            export_failed(f'tests_run_{run_id}.json', e)
+            continue
+        if not first:
+            continue
+        if save_items(spooled_tests(run_id, itertools.chain([first], run_pages)), f'tests_run_{run_id}.json'):
+            runs_with_tests.append(run_id)
+
+    if import_config.get('test_results'):
+        save_results_by_test(runs_with_tests)
+
+    if import_config.get('attachments_for_test'):
+        fetch_and_save_attachments('test', result_spool.test_ids())
+
+# Stages plan_export() estimates itself; every other enabled stage is one request
+stages_planned_separately = {
+    'milestones', 'test_cases', 'sections', 'test_plans', 'test_runs', 'test_results', 'runs', 'tests',
+    'attachments_for_case', 'attachments_for_plan', 'attachments_for_run', 'attachments_for_test',
+}
+
+# Requests of the per-entity attachment listings of count entities, sampled
+# from ids, plus the attachment downloads
+def plan_attachments(entity, count, ids):
+    attachments = mean(sample_counts(get_data, [f'get_attachments_for_{entity}/{i}' for i in ids], 'attachments'))
+    downloads = count * attachments if download_attachments else 0
+    return StagePlan(f'attachments_for_{entity}', count + downloads, max_workers,
+                     f'{count} {entity}s, ~{round(count * attachments)} attachments')
+
+# Estimate the requests of every enabled stage of export_all() with a few cheap
+# calls: the first page of each listing (see run_planner.count_items) and the
+# per-run and per-entity listings of a sample of the plans, runs, tests and cases
+def plan_export():
+    stages = []
+    if import_config.get('milestones'):
+        count, _ = count_items(get_data, f'get_milestones/{project_id}&is_completed=0', 'milestones')
+        stages.append(StagePlan('milestones', pages(count), detail=f'{count} milestones'))
+
+    cases, case_page = 0, []
+    if import_config.get('test_cases') or import_config.get('attachments_for_case'):
+        cases, case_page = count_items(get_data, f'get_cases/{project_id}', 'cases')
+    if import_config.get('test_cases'):
+        stages.append(StagePlan('test_cases', pages(cases), detail=f'{cases} cases'))
+
+    if import_config.get('sections'):
+        suites = get_data(f'get_suites/{project_id}')
+        suite_ids = entity_ids(suites) if isinstance(suites, list) else []
+        endpoints = [f'get_sections/{project_id}&suite_id={suite_id}' for suite_id in suite_ids] or [f'get_sections/{project_id}']
+        counts = [count_items(get_data, endpoint, 'sections')[0] for endpoint in endpoints]
+        stages.append(StagePlan('sections', 1 + sum(map(pages, counts)), detail=f'{sum(counts)} sections in {len(endpoints)} suites'))
+
+    # Runs are only exported from plans; their number is extrapolated from a sample of plans
+    plans, plan_ids, runs, run_ids = 0, [], 0, []
+    if import_config.get('test_plans'):
+        plans, plan_page = count_items(get_data, f'get_plans/{project_id}', 'plans')
+        plan_ids = entity_ids(plan_page)
+        sampled = [get_data(f'get_plan/{plan_id}') for plan_id in spread(plan_ids)]
+        sampled_runs = [run for plan in sampled if isinstance(plan, dict)
+                        for entry in plan.get('entries', []) for run in entry.get('runs', [])]
+        runs = round(plans * len(sampled_runs) / len(sampled)) if sampled else 0
+        run_ids = entity_ids(sampled_runs)
+        stages.append(StagePlan('test_plans', pages(plans), detail=f'{plans} plans'))
+        stages.append(StagePlan('test_runs', plans, max_workers, f'get_plan of every plan, ~{runs} runs'))
+
+    results_per_run = []
+    if import_config.get('test_results') or import_config.get('tests'):
+        results_per_run = sample_counts(get_data, [f'get_results_for_run/{run_id}' for run_id in run_ids], 'results')
+    result_pages = runs * mean(map(pages, results_per_run), 1)
+    if import_config.get('test_results'):
+        stages.append(StagePlan('test_results', result_pages, max_workers, f'~{round(runs * mean(results_per_run))} results'))
+
+    for name in import_config:
+        if import_config[name] and name not in stages_planned_separately:
+            stages.append(StagePlan(name, 1))
+    if import_config.get('runs'):
+        count, _ = count_items(get_data, f'get_runs/{project_id}', 'runs')
+        stages.append(StagePlan('runs', pages(count), detail=f'{count} runs'))
+
+    if import_config.get('tests'):
+        tests_per_run, test_ids = [], []
+        for run_id in spread(run_ids):
+            count, test_page = count_items(get_data, f'get_tests/{run_id}', 'tests')
+            tests_per_run.append(count)
+            test_ids.extend(entity_ids(test_page))
+        tests = round(runs * mean(tests_per_run))
+        # Results already fetched by the test_results stage are read back from the spool
+        request_count = runs * mean(map(pages, tests_per_run), 1) + (0 if import_config.get('test_results') else result_pages)
+        stages.append(StagePlan('tests', request_count, max_workers, f'~{tests} tests'))
+        if import_config.get('attachments_for_test'):
+            stages.append(plan_attachments('test', tests, test_ids))
+
+    if import_config.get('attachments_for_case'):
+        stages.append(plan_attachments('case', cases, entity_ids(case_page)))
+    if import_config.get('attachments_for_plan'):
+        stages.append(plan_attachments('plan', plans, plan_ids))
+    if import_config.get('attachments_for_run'):
+        stages.append(plan_attachments('run', runs, run_ids))
+    return RunPlan(stages, measured_latency(metrics, get_data, f'get_project/{project_id}'), client.limiter)
+
+# Export project_id into script_dir; returns whether the export completed
+def export_project():
+    global archive, store, result_spool
+    if archive_filename and store_filename:
+        logging.error("Set only one of archive_filename and store_filename")
+        return False
+    if (archive_filename or store_filename) and incremental:
+        logging.error("An incremental export can only update separate files; set incremental = False")
+        return False
+    if archive_filename:
+        archive = ExportArchive(os.path.join(script_dir, archive_filename), 'w')
+    if store_filename:
+        store = ExportStore(os.path.join(script_dir, store_filename))
+    if import_config.get('tests'):
+        result_spool = ResultSpool(script_dir)
+    metrics.start(os.path.join(script_dir, metrics_filename), os.path.join(script_dir, prometheus_filename),
+                  interval=metrics_interval)
+    progress = None
+    completed = False
+    failed_files.clear()
+    try:
+        if progress_interval:
+            plan = plan_export()
+            plan.log()
+            progress = ProgressReporter(plan, metrics, progress_interval)
+            progress.start()
+        export_all()
+        completed = not failed_files
+    finally:
+        if progress is not None:
+            progress.stop()
+        metrics.stop()
+        if archive is not None:
+            archive.close(commit=completed)
+            if completed:
+                logging.info(f"Export archived to {archive_filename}")
+        if store is not None:
+            store.close()
+        if result_spool is not None:
+            result_spool.close()
+            result_spool = None
+    return completed
+
+def export_all():
+    global export_state
+    if incremental:
+        export_state = ExportState(os.path.join(script_dir, state_filename))
 
-def main():
     if import_config.get('milestones'):
-        fetch_and_save(f'get_milestones/{project_id}&is_completed=0', 'milestones.json')
+        fetch_and_save_paginated(f'get_milestones/{project_id}&is_completed=0', 'milestones', 'milestones.json')
 
     if import_config.get('test_cases'):
-        fetch_and_save(f'get_cases/{project_id}', 'test_cases.json')
+        fetch_and_save_paginated(f'get_cases/{project_id}', 'cases', 'test_cases.json', entity='cases')
 
-    test_plans = None
+    if import_config.get('sections'):
+        save_items(iter_sections(), 'sections.json', 'sections')
+
+    plan_ids = []
     if import_config.get('test_plans'):
-        test_plans = get_data(f'get_plans/{project_id}')
-        save_data(test_plans, 'test_plans.json')
+        fetch_and_save_paginated(f'get_plans/{project_id}', 'plans', 'test_plans.json', entity='plans')
+        plan_ids = saved_ids('test_plans.json', 'plans')
 
-    test_runs = fetch_test_runs_from_plans(test_plans)
+    test_runs = fetch_test_runs_from_plans(plan_ids)
 
     if import_config.get('test_runs'):
         save_data({'runs': test_runs}, 'test_runs.json')
@@ -188,7 +718,7 @@ def main():
         fetch_and_save(f'get_shared_steps/{project_id}', 'shared_steps.json')
 
     if import_config.get('runs'):
-        fetch_and_save(f'get_runs/{project_id}', 'runs.json')
+        fetch_and_save_paginated(f'get_runs/{project_id}', 'runs', 'runs.json', entity='runs')
 
     if import_config.get('roles'):
         fetch_and_save('get_roles', 'roles.json')
@@ -218,29 +748,110 @@ def main():
         fetch_and_save_tests_and_attachments(test_runs)
 
     if import_config.get('attachments_for_case'):
-        cases = get_data(f'get_cases/{project_id}')
-        if cases and 'cases' in cases:
-            for case in cases['cases']:
-                if isinstance(case, dict) and 'id' in case:
-                    case_id = case['id']
-                    attachments = get_data(f'get_attachments_for_case/{case_id}')
-                    save_data(attachments, f'attachments_case_{case_id}.json')
-
-    if import_config.get('attachments_for_plan') and test_plans:
-        for plan in test_plans['plans']:
-            if isinstance(plan, dict) and 'id' in plan:
-                plan_id = plan['id']
-                attachments = get_data(f'get_attachments_for_plan/{plan_id}')
-                save_data(attachments, f'attachments_plan_{plan_id}.json')
+        # Reuse the case listing saved above rather than downloading it a second time
+        if import_config.get('test_cases'):
+            case_ids = saved_ids('test_cases.json', 'cases')
+        else:
+            try:
+                case_ids = entity_ids(paginate(get_data, f'get_cases/{project_id}', 'cases', strict=True))
+            except PaginationError as e:
+                export_failed('attachments_case_*.json', e)
+                case_ids = []
+        fetch_and_save_attachments('case', case_ids)
+
+    if import_config.get('attachments_for_plan'):
+        fetch_and_save_attachments('plan', plan_ids)
 
     if import_config.get('attachments_for_run'):
-        for run in test_runs:
-            if isinstance(run, dict) and 'id' in run:
-                run_id = run['id']
-                attachments = get_data(f'get_attachments_for_run/{run_id}')
-                save_data(attachments, f'attachments_run_{run_id}.json')
+        fetch_and_save_attachments('run', entity_ids(test_runs))
+
+    if export_state is not None:
+        export_state.save()
 
-    logging.info("Export completed successfully.")
+    if failed_files:
+        logging.error(f"Export failed: {len(failed_files)} files could not be fetched completely: {', '.join(failed_files)}")
+    else:
+        logging.info("Export completed successfully.")
+
+# IDs of the projects to export: project_ids, or every active project for 'all'
+def resolve_project_ids():
+    if project_ids != 'all':
+        return list(project_ids)
+    try:
+        return entity_ids(paginate(get_data, 'get_projects&is_completed=0', 'projects', strict=True))
+    except PaginationError as e:
+        logging.error(f"Cannot list the projects to export: {e}")
+        return []
+
+# Set up a project worker process. Every worker sends its requests through the
+# parent's shared rate limiter, on connections of its own.
+def init_project_worker(limiter):
+    client.session.close()
+    client.limiter = limiter
+
+# Export one project into its own directory under base_dir (in a worker process)
+def export_project_into(project, base_dir):
+    global project_id, script_dir, metrics
+    project_id = project
+    script_dir = os.path.join(base_dir, f'project_{project}')
+    os.makedirs(script_dir, exist_ok=True)
+    metrics = client.metrics = RequestMetrics(labels={'script': 'export', 'project_id': project})
+    # Projects log to the same console, so every message says which project it is about
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(f'%(asctime)s - %(levelname)s - project {project} - %(message)s'))
+    start = time.perf_counter()
+    try:
+        completed = export_project()
+    except Exception as e:
+        logging.error(f"Export of project {project} failed: {e}")
+        completed = False
+    return project, completed, time.perf_counter() - start
+
+# Export several projects in parallel worker processes (one project per process,
+# since the export keeps its state in module globals), sharing one rate budget
+def export_projects():
+    ids = resolve_project_ids()
+    if not ids:
+        logging.error("No projects to export")
+        return
+    limiter = SharedRateLimiter(rate=client.limiter.rate, max_rate=client.limiter.max_rate)
+    logging.info(f"Exporting {len(ids)} projects with {project_workers} workers")
+    start = time.perf_counter()
+    failed = []
+    tasks = [(project, script_dir) for project in ids]
+    # chunksize=1 hands out one project per task, so with maxtasksperchild=1 every project gets a fresh process
+    with multiprocessing.Pool(min(project_workers, len(ids)), initializer=init_project_worker, initargs=(limiter,),
+                              maxtasksperchild=1) as pool:
+        for project, completed, seconds in pool.starmap(export_project_into, tasks, chunksize=1):
+            logging.info(f"Project {project} {'exported' if completed else 'failed'} in {seconds:.1f}s")
+            if not completed:
+                failed.append(project)
+    logging.info(f"Exported {len(ids) - len(failed)} of {len(ids)} projects in {time.perf_counter() - start:.1f}s")
+    if failed:
+        logging.error(f"Export failed for projects: {', '.join(map(str, failed))}")
+
+# Log the plan of every project to export (see plan_export) and exit
+def plan_projects():
+    global project_id
+    ids = resolve_project_ids() if project_ids else [project_id]
+    plans = []
+    for project in ids:
+        project_id = project
+        plans.append(plan_export())
+        plans[-1].log(f'Project {project}' if project_ids else 'Plan')
+    if len(plans) > 1:
+        # Projects share one rate budget and run project_workers at a time
+        request_count = sum(plan.requests for plan in plans)
+        seconds = max(plans[0].rate_seconds(request_count), sum(plan.total_seconds for plan in plans) / min(project_workers, len(plans)))
+        logging.info(f"All {len(plans)} projects: {request_count} requests in about {format_duration(seconds)}")
+
+def main():
+    if plan_only:
+        plan_projects()
+    elif project_ids:
+        export_projects()
+    else:
+        export_project()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,555 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+# Local stand-in for the TestRail API v2, used to test and benchmark the export
+# and import scripts without a real instance. It serves synthetic projects of
+# configurable size with TestRail's offset/limit/_links pagination and
+# updated_after/created_after filters, stores whatever the import creates so it
+# can be read back, and can inject latency, 429 throttling and server errors.
+# Usage: python fake_testrail.py --cases 5000 --runs 20 --port 8080
+
+PAGE_LIMIT = 250
+
+# Methods that return a paginated {key: [...]} response, and that key
+PAGINATED = {
+    'get_projects': 'projects',
+    'get_cases': 'cases',
+    'get_sections': 'sections',
+    'get_milestones': 'milestones',
+    'get_plans': 'plans',
+    'get_runs': 'runs',
+    'get_tests': 'tests',
+    'get_results': 'results',
+    'get_results_for_run': 'results',
+    'get_results_for_case': 'results',
+    'get_attachments_for_case': 'attachments',
+    'get_attachments_for_plan': 'attachments',
+    'get_attachments_for_run': 'attachments',
+    'get_attachments_for_test': 'attachments',
+    'get_users': 'users',
+    'get_roles': 'roles',
+    'get_groups': 'groups',
+    'get_shared_steps': 'shared_steps',
+    'get_datasets': 'datasets',
+}
+
+# Static lookup responses (plain lists, as TestRail returns them)
+LOOKUPS = {
+    'get_statuses': [{'id': i, 'name': name, 'label': name.title(), 'is_system': True}
+                     for i, name in enumerate(['passed', 'blocked', 'untested', 'retest', 'failed'], 1)],
+    'get_case_statuses': [{'case_status_id': 1, 'name': 'Approved', 'abbreviation': 'A', 'is_default': True}],
+    'get_case_types': [{'id': i, 'name': name, 'is_default': i == 1}
+                       for i, name in enumerate(['Other', 'Functional', 'Regression', 'Smoke'], 1)],
+    'get_case_fields': [{'id': 1, 'system_name': 'custom_steps', 'name': 'steps', 'type_id': 3, 'configs': []}],
+    'get_priorities': [{'id': i, 'name': name, 'priority': i, 'short_name': name, 'is_default': i == 2}
+                       for i, name in enumerate(['Low', 'Medium', 'High', 'Critical'], 1)],
+}
+
+
+# Deterministic synthetic data for one or more projects, plus everything created through the API
+class FakeData:
+    def __init__(self, projects=1, cases=1000, sections=50, milestones=10, plans=5, runs_per_plan=2, runs=5,
+                 tests_per_run=200, results_per_test=2, attachment_every=20, unique_blobs=50,
+                 blob_size=20000, text_size=400, seed=1):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_ids = Counter()
+        self.blob_size = blob_size
+        self.unique_blobs = unique_blobs
+        self.now = 1700000000
+        self.projects = {}
+        self.suites, self.sections, self.cases, self.milestones = {}, {}, {}, {}
+        self.plans, self.runs, self.tests, self.results = {}, {}, {}, {}
+        self.tests_by_run, self.results_by_run = {}, {}  # run_id -> [test] / [result], in creation order
+        self.section_sizes = Counter()  # section_id -> number of cases
+        self.attachments = {}  # (entity, entity_id) -> [attachment]
+        self.created = Counter()  # POST method -> number of entities created
+        self.users = [{'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'is_active': True} for i in range(1, 6)]
+        for _ in range(projects):
+            self.seed_project(cases, sections, milestones, plans, runs_per_plan, runs, tests_per_run,
+                              results_per_test, attachment_every, text_size)
+        # An empty project to import into
+        self.add_project({'name': 'Import target'})
+
+    def new_id(self, kind):
+        self.next_ids[kind] += 1
+        return self.next_ids[kind]
+
+    def stamp(self):
+        self.now += 1
+        return self.now
+
+    def add_project(self, data):
+        project = {'id': self.new_id('project'), 'name': data.get('name', 'Project'), 'suite_mode': 1,
+                   'is_completed': False, 'announcement': data.get('announcement')}
+        self.projects[project['id']] = project
+        self.add_suite(project['id'], {'name': 'Master'})
+        return project
+
+    def add_suite(self, project_id, data):
+        suite = {'id': self.new_id('suite'), 'project_id': project_id, 'name': data.get('name', 'Suite'),
+                 'description': data.get('description')}
+        self.suites[suite['id']] = suite
+        return suite
+
+    def add_section(self, project_id, data):
+        suite_id = data.get('suite_id') or self.project_suites(project_id)[0]['id']
+        parent = self.sections.get(data.get('parent_id'))
+        siblings = [s for s in self.sections.values() if s['suite_id'] == suite_id and s['parent_id'] == data.get('parent_id')]
+        section = {'id': self.new_id('section'), 'suite_id': suite_id, 'name': data.get('name', 'Section'),
+                   'description': data.get('description'), 'parent_id': data.get('parent_id'),
+                   'depth': parent['depth'] + 1 if parent else 0, 'display_order': len(siblings) + 1}
+        self.sections[section['id']] = section
+        return section
+
+    def add_case(self, section_id, data):
+        section = self.sections[section_id]
+        stamp = self.stamp()
+        case = dict(data)
+        case.update({'id': self.new_id('case'), 'section_id': section_id, 'suite_id': section['suite_id'],
+                     'created_on': stamp, 'updated_on': stamp, 'created_by': 1, 'updated_by': 1,
+                     'display_order': self.section_sizes[section_id] + 1})
+        self.section_sizes[section_id] += 1
+        case.setdefault('title', 'Case')
+        self.cases[case['id']] = case
+        return case
+
+    def add_milestone(self, project_id, data):
+        milestone = dict(data)
+        milestone.update({'id': self.new_id('milestone'), 'project_id': project_id, 'is_completed': False,
+                          'created_on': self.stamp()})
+        self.milestones[milestone['id']] = milestone
+        return milestone
+
+    def add_run(self, project_id, data, plan_id=None):
+        run = {key: data.get(key) for key in ('name', 'description', 'milestone_id', 'suite_id')}
+        run.update({'id': self.new_id('run'), 'project_id': project_id, 'plan_id': plan_id,
+                    'is_completed': False, 'created_on': self.stamp()})
+        self.runs[run['id']] = run
+        return run
+
+    def add_test(self, run_id, case):
+        test = {'id': self.new_id('test'), 'run_id': run_id, 'case_id': case['id'], 'title': case['title'],
+                'status_id': 3, 'assignedto_id': None}
+        self.tests[test['id']] = test
+        self.tests_by_run.setdefault(run_id, []).append(test)
+        return test
+
+    def add_result(self, test, data):
+        result = {key: value for key, value in data.items() if key not in ('id', 'test_id', 'case_id')}
+        result.update({'id': self.new_id('result'), 'test_id': test['id'], 'created_on': self.stamp(), 'created_by': 1})
+        result.setdefault('status_id', 1)
+        self.results[result['id']] = result
+        self.results_by_run.setdefault(test['run_id'], []).append(result)
+        return result
+
+    def add_attachment(self, entity, entity_id, name, size):
+        attachment = {'id': self.new_id('attachment'), 'name': name, 'size': size, 'created_on': self.stamp(),
+                      'entity_type': entity, 'entity_id': entity_id}
+        self.attachments.setdefault((entity, entity_id), []).append(attachment)
+        return attachment
+
+    # Blob content of an attachment; only unique_blobs distinct contents exist, to exercise dedupe
+    def blob(self, attachment_id):
+        seed = f'blob-{attachment_id % self.unique_blobs}'.encode()
+        return (seed * (self.blob_size // len(seed) + 1))[:self.blob_size]
+
+    def seed_project(self, cases, sections, milestones, plans, runs_per_plan, runs, tests_per_run,
+                     results_per_test, attachment_every, text_size):
+        project = self.add_project({'name': f'Project {len(self.projects) + 1}'})
+        project_id = project['id']
+        text = 'Lorem ipsum dolor sit amet. ' * (text_size // 28 + 1)
+        section_ids = []
+        for i in range(sections):
+            parent_id = self.rng.choice(section_ids) if section_ids and self.rng.random() < 0.6 else None
+            section_ids.append(self.add_section(project_id, {'name': f'Section {i + 1}', 'parent_id': parent_id})['id'])
+        project_cases = []
+        for i in range(cases):
+            case = self.add_case(self.rng.choice(section_ids), {
+                'title': f'Case {i + 1}', 'type_id': self.rng.randint(1, 4), 'priority_id': self.rng.randint(1, 4),
+                'template_id': 1, 'estimate': None, 'refs': None, 'milestone_id': None,
+                'custom_preconds': text[:text_size // 2], 'custom_steps': text[:text_size],
+            })
+            project_cases.append(case)
+            if attachment_every and i % attachment_every == 0:
+                self.add_attachment('case', case['id'], f'case_{case["id"]}.png', self.blob_size)
+        milestone_ids = [self.add_milestone(project_id, {'name': f'Milestone {i + 1}'})['id'] for i in range(milestones)]
+
+        def seed_run(run):
+            for case in self.rng.sample(project_cases, min(tests_per_run, len(project_cases))):
+                test = self.add_test(run['id'], case)
+                for _ in range(results_per_test):
+                    self.add_result(test, {'status_id': self.rng.choice([1, 1, 1, 5]), 'comment': 'Automated result'})
+                if attachment_every and test['id'] % attachment_every == 0:
+                    self.add_attachment('test', test['id'], f'test_{test["id"]}.log', self.blob_size)
+            if attachment_every:
+                self.add_attachment('run', run['id'], f'run_{run["id"]}.txt', self.blob_size)
+
+        for i in range(plans):
+            plan = {'id': self.new_id('plan'), 'project_id': project_id, 'name': f'Plan {i + 1}',
+                    'milestone_id': self.rng.choice(milestone_ids) if milestone_ids else None,
+                    'created_on': self.stamp(), 'is_completed': False}
+            self.plans[plan['id']] = plan
+            for j in range(runs_per_plan):
+                seed_run(self.add_run(project_id, {'name': f'Plan {i + 1} run {j + 1}',
+                                                   'milestone_id': plan['milestone_id']}, plan_id=plan['id']))
+            if attachment_every:
+                self.add_attachment('plan', plan['id'], f'plan_{plan["id"]}.pdf', self.blob_size)
+        for i in range(runs):
+            seed_run(self.add_run(project_id, {'name': f'Run {i + 1}',
+                                               'milestone_id': self.rng.choice(milestone_ids) if milestone_ids else None}))
+
+    def project_suites(self, project_id):
+        return [s for s in self.suites.values() if s['project_id'] == project_id]
+
+    def plan_details(self, plan):
+        entries = {}
+        for run in self.runs.values():
+            if run['plan_id'] == plan['id']:
+                entries.setdefault(run['suite_id'], []).append(run)
+        details = dict(plan)
+        details['entries'] = [{'id': f'entry-{plan["id"]}-{suite_id}', 'suite_id': suite_id, 'runs': runs}
+                              for suite_id, runs in entries.items()]
+        return details
+
+
+# Server-wide fault injection: latency, a token-bucket rate limit answered with
+# 429 + Retry-After, and a random failure rate answered with 500
+class Faults:
+    def __init__(self, latency=0.0, rate_limit=0.0, failure_rate=0.0, seed=1):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = rate_limit
+        self.last = time.monotonic()
+
+    def delay(self):
+        if self.latency:
+            with self.lock:
+                jitter = self.rng.uniform(0.5, 1.5)
+            time.sleep(self.latency * jitter)
+
+    def throttled(self):
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.last) * self.rate_limit)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return False
+            return True
+
+    def failed(self):
+        if not self.failure_rate:
+            return False
+        with self.lock:
+            return self.rng.random() < self.failure_rate
+
+
+# (filename, content) of the 'attachment' field of a multipart/form-data body, or None
+def parse_attachment(content_type, body):
+    message = BytesParser(policy=policy.default).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+    if not message.is_multipart():
+        return None
+    for part in message.iter_parts():
+        if part.get_param('name', header='content-disposition') == 'attachment':
+            return part.get_filename(), part.get_payload(decode=True)
+    return None
+
+
+class FakeTestRailHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def data(self):
+        return self.server.data
+
+    def send_json(self, body, status=200, headers=None):
+        payload = json.dumps(body).encode()
+        self.server.record(self.command, status, len(payload))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_bytes(self, payload):
+        self.server.record(self.command, 200, len(payload))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def parse(self):
+        if self.path == '/stats':
+            return None, None, None, {}
+        match = re.match(r'^/index\.php\?/api/v2/([a-z_]+)(?:/(\d+))?(?:/(\d+))?((?:&[^&=]+=[^&]*)*)$', unquote(self.path))
+        if not match:
+            return False, None, None, {}
+        method, first, second, query = match.groups()
+        params = dict(part.split('=', 1) for part in query.split('&') if part)
+        return method, int(first) if first else None, int(second) if second else None, params
+
+    def precheck(self):
+        self.server.faults.delay()
+        if self.server.faults.throttled():
+            self.send_json({'error': 'API Rate Limit Exceeded'}, 429, {'Retry-After': '1'})
+            return False
+        if self.server.faults.failed():
+            self.send_json({'error': 'Injected server error'}, 500)
+            return False
+        return True
+
+    def do_GET(self):
+        method, first, _, params = self.parse()
+        if method is None:
+            return self.send_json(self.server.stats())
+        if not method:
+            return self.send_json({'error': 'Invalid path'}, 400)
+        if not self.precheck():
+            return
+        with self.data.lock:
+            if method == 'get_attachment':
+                return self.send_bytes(self.data.blob(first))
+            body = self.get(method, first, params)
+        if body is None:
+            return self.send_json({'error': f'Unknown method or object: {method}'}, 400)
+        if method in PAGINATED:
+            body = self.page(method, body, first, params)
+        self.send_json(body)
+
+    def get(self, method, first, params):
+        data = self.data
+        if method in LOOKUPS:
+            return LOOKUPS[method]
+        if method == 'get_projects':
+            return list(data.projects.values())
+        if method == 'get_project':
+            return data.projects.get(first)
+        if method == 'get_suites':
+            return data.project_suites(first)
+        if method == 'get_sections':
+            suite_ids = {int(params['suite_id'])} if 'suite_id' in params else {s['id'] for s in data.project_suites(first)}
+            return [s for s in data.sections.values() if s['suite_id'] in suite_ids]
+        if method == 'get_cases':
+            suite_ids = {int(params['suite_id'])} if 'suite_id' in params else {s['id'] for s in data.project_suites(first)}
+            return [c for c in data.cases.values() if c['suite_id'] in suite_ids]
+        if method == 'get_milestones':
+            return [m for m in data.milestones.values() if m['project_id'] == first]
+        if method == 'get_plans':
+            return [p for p in data.plans.values() if p['project_id'] == first]
+        if method == 'get_plan':
+            plan = data.plans.get(first)
+            return data.plan_details(plan) if plan else None
+        if method == 'get_runs':
+            return [r for r in data.runs.values() if r['project_id'] == first and r['plan_id'] is None]
+        if method == 'get_tests':
+            return data.tests_by_run.get(first, [])
+        if method == 'get_results':
+            return sorted((r for r in data.results.values() if r['test_id'] == first), key=lambda r: -r['id'])
+        if method == 'get_results_for_run':
+            # Newest first
+            return data.results_by_run.get(first, [])[::-1]
+        if method.startswith('get_attachments_for_'):
+            return data.attachments.get((method[len('get_attachments_for_'):], first), [])
+        if method == 'get_users':
+            return data.users
+        if method in ('get_roles', 'get_groups', 'get_shared_steps', 'get_datasets'):
+            return []
+        if method in ('get_templates', 'get_configs', 'get_reports'):
+            return [{'id': 1, 'name': 'Test Case (Text)', 'is_default': True}] if method == 'get_templates' else []
+        return None
+
+    def page(self, method, items, first, params):
+        for param, field in (('updated_after', 'updated_on'), ('created_after', 'created_on')):
+            if param in params:
+                items = [item for item in items if (item.get(field) or 0) > int(params[param])]
+        offset = int(params.get('offset', 0))
+        limit = min(int(params.get('limit', PAGE_LIMIT)), PAGE_LIMIT)
+        chunk = items[offset:offset + limit]
+        base = f'{method}/{first}' if first is not None else method
+        query = ''.join(f'&{k}={v}' for k, v in params.items() if k not in ('offset', 'limit'))
+        next_link = f'/api/v2/{base}{query}&limit={limit}&offset={offset + limit}' if offset + limit < len(items) else None
+        return {'offset': offset, 'limit': limit, 'size': len(chunk),
+                '_links': {'next': next_link, 'prev': None}, PAGINATED[method]: chunk}
+
+    def do_POST(self):
+        method, first, second, _ = self.parse()
+        if not method:
+            return self.send_json({'error': 'Invalid path'}, 400)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        self.server.record_bytes_in(length)
+        if not self.precheck():
+            return
+        if method.startswith('add_attachment_to_'):
+            upload = parse_attachment(self.headers.get('Content-Type', ''), raw)
+            if upload is None:
+                return self.send_json({'error': 'Field :attachment is required'}, 400)
+            with self.data.lock:
+                attachment = self.data.add_attachment(method[len('add_attachment_to_'):], first, upload[0], len(upload[1]))
+                self.data.created[method] += 1
+            return self.send_json({'attachment_id': attachment['id']})
+        try:
+            body = json.loads(raw or b'{}')
+        except ValueError:
+            return self.send_json({'error': 'Invalid JSON'}, 400)
+        with self.data.lock:
+            created = self.post(method, first, second, body)
+            if created is not None:
+                self.data.created[method] += len(created) if isinstance(created, list) else 1
+        if created is None:
+            return self.send_json({'error': f'Unknown method or invalid object: {method}'}, 400)
+        self.send_json(created)
+
+    def post(self, method, first, second, body):
+        data = self.data
+        if method == 'add_project':
+            return data.add_project(body)
+        if method == 'add_suite' and first in data.projects:
+            return data.add_suite(first, body)
+        if method == 'add_section' and first in data.projects:
+            if body.get('parent_id') and body['parent_id'] not in data.sections:
+                return None
+            return data.add_section(first, body)
+        if method == 'add_case' and first in data.sections:
+            return data.add_case(first, body)
+        if method == 'update_case' and first in data.cases:
+            data.cases[first].update(body)
+            data.cases[first]['updated_on'] = data.stamp()
+            return data.cases[first]
+        if method == 'add_milestone' and first in data.projects:
+            return data.add_milestone(first, body)
+        if method == 'update_milestone' and first in data.milestones:
+            data.milestones[first].update(body)
+            return data.milestones[first]
+        if method == 'add_plan' and first in data.projects:
+            plan = {'id': data.new_id('plan'), 'project_id': first, 'name': body.get('name'),
+                    'milestone_id': body.get('milestone_id'), 'created_on': data.stamp()}
+            data.plans[plan['id']] = plan
+            return plan
+        if method == 'add_run' and first in data.projects:
+            run = data.add_run(first, body)
+            # Unknown suites are tolerated and the run gets the cases of the whole project
+            suite_ids = {s['id'] for s in data.project_suites(first)}
+            if run['suite_id'] in suite_ids:
+                suite_ids = {run['suite_id']}
+            if body.get('include_all', True):
+                for case in [c for c in data.cases.values() if c['suite_id'] in suite_ids]:
+                    data.add_test(run['id'], case)
+            return run
+        if method in ('add_result_for_case', 'add_results_for_cases'):
+            results = [dict(body, case_id=second)] if method == 'add_result_for_case' else body.get('results', [])
+            tests = {t['case_id']: t for t in data.tests_by_run.get(first, [])}
+            if first not in data.runs or any(r.get('case_id') not in tests for r in results):
+                return None
+            created = [data.add_result(tests[r['case_id']], r) for r in results]
+            return created[0] if method == 'add_result_for_case' else created
+        if method.startswith(('add_', 'update_')):
+            # Lookups and project settings are accepted but not modelled
+            return dict(body, id=data.new_id(method))
+        return None
+
+
+class FakeTestRailServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data, faults=None, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeTestRailHandler)
+        self.data = data
+        self.faults = faults or Faults()
+        self.stats_lock = threading.Lock()
+        self.requests = Counter()  # (HTTP method, status) -> count
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def record(self, method, status, size):
+        with self.stats_lock:
+            self.requests[(method, status)] += 1
+            self.bytes_out += size
+
+    def record_bytes_in(self, size):
+        with self.stats_lock:
+            self.bytes_in += size
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'requests': sum(count for (method, _), count in self.requests.items() if method in ('GET', 'POST')),
+                'by_status': {f'{method} {status}': count for (method, status), count in sorted(self.requests.items())},
+                'throttled': sum(count for (_, status), count in self.requests.items() if status == 429),
+                'failed': sum(count for (_, status), count in self.requests.items() if status >= 500),
+                'bytes_out': self.bytes_out,
+                'bytes_in': self.bytes_in,
+                'created': dict(self.data.created),
+            }
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def add_data_arguments(parser):
+    parser.add_argument('--projects', type=int, default=1, help='Number of seeded projects')
+    parser.add_argument('--cases', type=int, default=1000, help='Cases per project')
+    parser.add_argument('--sections', type=int, default=50, help='Sections per project')
+    parser.add_argument('--milestones', type=int, default=10, help='Milestones per project')
+    parser.add_argument('--plans', type=int, default=5, help='Test plans per project')
+    parser.add_argument('--runs-per-plan', type=int, default=2, help='Runs in each plan')
+    parser.add_argument('--runs', type=int, default=5, help='Standalone runs per project')
+    parser.add_argument('--tests-per-run', type=int, default=200, help='Tests in each run')
+    parser.add_argument('--results-per-test', type=int, default=2, help='Results of each test')
+    parser.add_argument('--attachment-every', type=int, default=20, help='Attach a file to every Nth case/test (0 = none)')
+    parser.add_argument('--blob-size', type=int, default=20000, help='Size of each attachment in bytes')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean added latency per request in seconds')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Requests per second before answering 429 (0 = unlimited)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the synthetic data')
+
+
+def server_from_args(args, port=0):
+    data = FakeData(projects=args.projects, cases=args.cases, sections=args.sections, milestones=args.milestones,
+                    plans=args.plans, runs_per_plan=args.runs_per_plan, runs=args.runs,
+                    tests_per_run=args.tests_per_run, results_per_test=args.results_per_test,
+                    attachment_every=args.attachment_every, blob_size=args.blob_size, seed=args.seed)
+    faults = Faults(latency=args.latency, rate_limit=args.rate_limit, failure_rate=args.failure_rate, seed=args.seed)
+    return FakeTestRailServer(data, faults, port=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake TestRail API server.')
+    add_data_arguments(parser)
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    args = parser.parse_args()
+    server = server_from_args(args, port=args.port)
+    print(f"Fake TestRail listening on {server.url} (import target project {max(server.data.projects)})")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
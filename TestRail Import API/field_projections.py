@@ -0,0 +1,90 @@
+# Declarative field projections of TestRail entities: the fields the import
+# sends when it creates each entity type, and the fields the export can drop
+# as it fetches records because the import would leave them out anyway.
+
+
+# Projection of a record onto the fields an API call accepts: only the fields
+# in keep (when given), minus the fields in drop
+class Projection:
+    __slots__ = ('keep', 'drop')
+
+    def __init__(self, keep=None, drop=()):
+        self.keep = frozenset(keep) if keep is not None else None
+        self.drop = frozenset(drop)
+
+    def accepts(self, field):
+        return (self.keep is None or field in self.keep) and field not in self.drop
+
+    def apply(self, record):
+        return {field: value for field, value in record.items() if self.accepts(field)}
+
+
+# Fields the import sends when it creates each entity type. Entities that are
+# not listed are posted with all of their fields.
+PAYLOADS = {
+    'milestones': Projection(drop=('id', 'started_on', 'is_started', 'completed_on', 'is_completed', 'url', 'milestones')),
+    'suites': Projection(keep=('name', 'description')),
+    'sections': Projection(keep=('name', 'description')),
+    'cases': Projection(drop=('id', 'section_id', 'created_by', 'created_on', 'updated_by', 'updated_on', 'suite_id',
+                              'display_order', 'is_deleted', 'estimate_forecast', 'case_assignedto_id', 'comments')),
+    'plans': Projection(keep=('name', 'description', 'milestone_id')),
+    'results': Projection(drop=('id', 'test_id', 'created_on', 'created_by')),
+}
+
+# Fields the export and the import rely on besides the payload: IDs linking
+# entities, the high-water marks of incremental exports and the section tree
+KEPT_ON_FETCH = frozenset(('id', 'suite_id', 'section_id', 'parent_id', 'depth', 'display_order', 'plan_id', 'run_id',
+                           'test_id', 'case_id', 'milestone_id', 'created_on', 'updated_on'))
+
+
+# Projection of the records of an entity type as they are fetched: the import's
+# payload plus the fields it relies on, or None when every field is posted
+def fetch_projection(entity):
+    payload = PAYLOADS.get(entity)
+    if payload is None:
+        return None
+    keep = payload.keep | KEPT_ON_FETCH if payload.keep is not None else None
+    return Projection(keep=keep, drop=payload.drop - KEPT_ON_FETCH)
+
+
+# Lazily apply a projection to records, passing through anything that is not a dict
+def project_all(projection, records):
+    for record in records:
+        yield projection.apply(record) if isinstance(record, dict) else record
+
+
+# Base of compact records that hold a fixed set of fields in __slots__ instead
+# of a per-instance dict. Fields missing from the source record stay unset, so
+# 'in', [], get() and items() answer as they would on the original dict.
+class Record:
+    __slots__ = ()
+    fields = ()
+
+    def __init__(self, data):
+        for field in self.fields:
+            if field in data:
+                setattr(self, field, data[field])
+
+    def __contains__(self, field):
+        return field in self.fields and hasattr(self, field)
+
+    def __getitem__(self, field):
+        if field not in self:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        return getattr(self, field, default) if field in self.fields else default
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.fields if hasattr(self, field)]
+
+
+def record_type(name, fields):
+    fields = tuple(fields)
+    return type(name, (Record,), {'__slots__': fields, 'fields': fields})
+
+
+# The exported sections and suites the import keeps in memory to create the section tree
+SectionRecord = record_type('SectionRecord', ('id', 'suite_id', 'parent_id', 'depth', 'display_order', 'name', 'description'))
+SuiteRecord = record_type('SuiteRecord', ('id', 'name', 'description'))
@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Mappings (and misses) kept in memory, least recently used first out
+CACHE_SIZE = 50000
+
+# Raised when a journal was written for another target than the one it is opened for
+class JournalScopeError(Exception):
+    pass
+
+
+# Durable record of every entity created by an import, mapping its source ID
+# to the ID TestRail assigned in the target. Each mapping is committed as soon
+# as the entity is created, so a crashed or interrupted import can be rerun and
+# will skip everything that already succeeded. Lookups go to the indexed table
+# through a bounded LRU cache, so memory does not grow with the number of
+# imported entities (an import can journal millions of results). Target IDs only mean something in
+# the target they were created in, so the journal is bound to a scope (the
+# target URL and project, like the ResponseCache namespace) and refuses to
+# open for another one. A journal without a scope takes the first one given.
+class ImportJournal:
+    def __init__(self, path, scope=''):
+        self.path = path
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS id_map ('
+            ' entity TEXT NOT NULL,'
+            ' source_id TEXT NOT NULL,'
+            ' target_id INTEGER NOT NULL,'
+            ' created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,'
+            ' PRIMARY KEY (entity, source_id))'
+        )
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'scope'").fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('scope', ?)", (scope,))
+        elif row[0] != scope:
+            self.conn.close()
+            raise JournalScopeError(f"Journal {path} belongs to {row[0]!r}, not {scope!r}; "
+                                    f"use another journal file to import into this target")
+        self.conn.commit()
+        self.cache = OrderedDict()
+
+    def _remember(self, key, target_id):
+        self.cache[key] = target_id
+        self.cache.move_to_end(key)
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+    # Target ID of an already imported entity, or None
+    def target_id(self, entity, source_id):
+        if source_id is None:
+            return None
+        key = (entity, str(source_id))
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            row = self.conn.execute('SELECT target_id FROM id_map WHERE entity = ? AND source_id = ?', key).fetchone()
+            target_id = row[0] if row is not None else None
+            self._remember(key, target_id)
+            return target_id
+
+    def record(self, entity, source_id, target_id):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO id_map (entity, source_id, target_id) VALUES (?, ?, ?)',
+                (entity, str(source_id), target_id)
+            )
+            self.conn.commit()
+            self._remember((entity, str(source_id)), target_id)
+
+    # Record several (source_id, target_id) pairs of one entity type in a single transaction
+    def record_many(self, entity, pairs):
+        pairs = [(str(source_id), target_id) for source_id, target_id in pairs]
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO id_map (entity, source_id, target_id) VALUES (?, ?, ?)',
+                [(entity, source_id, target_id) for source_id, target_id in pairs]
+            )
+            self.conn.commit()
+            for source_id, target_id in pairs:
+                self._remember((entity, source_id), target_id)
+
+    # All source -> target mappings of an entity type (source IDs as strings)
+    def mapping(self, entity):
+        with self.lock:
+            return dict(self.conn.execute('SELECT source_id, target_id FROM id_map WHERE entity = ?', (entity,)))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
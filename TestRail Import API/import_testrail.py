@@ -1,7 +1,27 @@
 import requests
 import json
+import math
 import os
 import logging
+import queue
+import itertools
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import json_codec
+from attachment_store import BlobStore
+from export_archive import ArchiveBlobStore, ExportArchive
+from export_files import format_filename, iter_records
+from export_store import ExportStore
+from field_projections import PAYLOADS, SectionRecord, SuiteRecord
+from import_journal import ImportJournal, JournalScopeError
+from request_metrics import RequestMetrics
+from response_cache import ResponseCache
+from run_planner import ProgressReporter, RunPlan, StagePlan, count_items, measured_latency, pages
+from stage_scheduler import log_critical_path, run_stages
+from target_index import build_target_index, listing_endpoints
+from testrail_client import PaginationError, RateLimiter, TestRailClient, paginate
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,11 +31,31 @@ base_url = 'https://your_testrail_instance.testrail.io'
 username = 'your_email@example.com'  # Your TestRail email
 api_key = 'your_api_key'
 new_project_id = 2  # Your new project ID
+results_batch_size = 100  # Results sent per add_results_for_cases request
+stage_workers = 4  # Number of independent import stages run in parallel (1 = one at a time)
+case_workers = 4  # Sections whose test cases are created in parallel; cases within a section keep their order
+attachments_dir = 'attachments'  # Attachment files downloaded by the export
+archive_filename = None  # Read the export from this archive (see export_testrail.archive_filename) instead of separate files
+store_filename = None  # Read the export from this SQLite store (see export_testrail.store_filename) instead of separate files
+cache_dirname = '.testrail_cache'  # On-disk cache of lookup endpoints (statuses, case fields, users, ...)
+journal_filename = 'import_journal.sqlite'  # Source -> target ID journal that lets an interrupted import resume
+pool_size = 10  # Number of pooled keep-alive connections to TestRail
+rate_limit = 5  # Starting request rate per second; adapts to TestRail's 429 responses
+max_retries = 8  # Retries with exponential backoff for throttled or failed requests
+metrics_interval = 60  # Seconds between request metrics snapshots written during a run (0 = only at the end)
+metrics_filename = 'import_metrics.json'  # Per-endpoint request counts, latencies, bytes, status codes and retries
+prometheus_filename = 'import_metrics.prom'  # The same metrics in Prometheus textfile format
+payload_log_every = 100  # Log the payload of one POST in this many (0 = never); with DEBUG logging every payload is logged
+match_existing = True  # Index the target's existing milestones, sections and cases first and reuse matches instead of creating duplicates
+update_existing = True  # Update matched entities whose content differs from the export (False: leave them as they are)
+plan_only = False  # Only estimate the requests and duration of every enabled stage from the export, log the plan and exit
+progress_interval = 0  # Seconds between progress/ETA log lines, measured against a plan made before the run (0 = no plan)
 
 # Import configuration
 import_config = {
     'milestones': True,
     'test_cases': True,
+    'sections': True,
     'test_plans': False,
     'test_runs': False,
     'test_results': False,
@@ -46,160 +86,452 @@ import_config = {
 # Get the directory of the current script
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
+# Per-endpoint metrics of every request sent by the client
+metrics = RequestMetrics(labels={'script': 'import'})
+
+# Number of POST requests so far, for sampling the payloads that are logged
+posts_sent = itertools.count()
+
+# Shared client, reusing pooled connections and one rate limit across all requests
+client = TestRailClient(base_url, username, api_key, pool_size=pool_size,
+                        limiter=RateLimiter(rate=rate_limit), max_retries=max_retries, metrics=metrics)
+
+# Cache of slowly changing lookup responses
+response_cache = ResponseCache(os.path.join(script_dir, cache_dirname), namespace=base_url)
+
+# Journal of imported entities, opened by main()
+journal = None
+
+# Archive holding the export, opened by main() when archive_filename is set
+archive = None
+
+# SQLite store holding the export, opened by main() when store_filename is set
+store = None
+
+# Record streams fed by a running export instead of export files, set by migrate.py
+streams = None
+
+# Index of the entities that already exist in the target (see target_index.py), set in main()
+target_index = None
+
 # Function to post data to TestRail API
 def post_data(endpoint, data):
-    url = f'{base_url}/index.php?/api/v2/{endpoint}'
-    logging.info(f"Posting to {url} with data: {json.dumps(data, indent=4)}")  # Debugging output
-    response = requests.post(url, auth=(username, api_key), json=data)
+    url = client.url(endpoint)
+    # Payloads are only formatted when they are logged
+    if payload_log_every and next(posts_sent) % payload_log_every == 0:
+        logging.info(f"Posting to {url} with data: {json.dumps(data, indent=4)}")
+    elif logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Posting to {url} with data: {json.dumps(data, indent=4)}")
+    response = client.post(endpoint, data)
+    response_cache.invalidate_for_write(endpoint)
     try:
         response.raise_for_status()  # Raise an error for bad status codes
     except requests.exceptions.HTTPError as e:
         logging.error(f"HTTPError for URL {url}: {e}")
         logging.error(f"Response content: {response.content}")  # Debugging output
         return None
-    return response.json()
+    return json_codec.loads(response.content)
+
+
+# Function to upload a file to TestRail API (a path or a function opening the file)
+def post_file(endpoint, source, filename):
+    url = client.url(endpoint)
+    logging.info(f"Uploading {filename} to {url}")
+    response = client.upload(endpoint, source, filename)
+    try:
+        response.raise_for_status()  # Raise an error for bad status codes
+    except requests.exceptions.HTTPError as e:
+        logging.error(f"HTTPError for URL {url}: {e}")
+        logging.error(f"Response content: {response.content}")  # Debugging output
+        return None
+    return json_codec.loads(response.content)
 
 # Function to get data from TestRail API
 def get_data(endpoint):
-    url = f'{base_url}/index.php?/api/v2/{endpoint}'
-    response = requests.get(url, auth=(username, api_key))
+    cached, data = response_cache.get(endpoint)
+    if cached:
+        return data
+    url = client.url(endpoint)
+    response = client.get(endpoint)
     try:
         response.raise_for_status()  # Raise an error for bad status codes
     except requests.exceptions.HTTPError as e:
         logging.error(f"HTTPError for URL {url}: {e}")
         logging.error(f"Response content: {response.content}")  # Debugging output
         return None
-    return response.json()
-
-# Function to load data from a JSON file
-def load_data(filename):
-    file_path = os.path.join(script_dir, filename)
-    with open(file_path, 'r') as f:
-        return json.load(f)
+    data = json_codec.loads(response.content)
+    response_cache.put(endpoint, data, len(response.content))
+    return data
+
+# Function to check the journal for an entity created by a previous run
+def is_imported(entity, source_id):
+    target_id = journal.target_id(entity, source_id)
+    if target_id is not None:
+        logging.info(f"Skipping {entity} {source_id}, already imported as {target_id}")
+        return True
+    return False
+
+# Function to post a new entity and journal its source -> target ID mapping
+def post_entity(entity, source_id, endpoint, data):
+    response = post_data(endpoint, data)
+    if response and source_id is not None and 'id' in response:
+        journal.record(entity, source_id, response['id'])
+    return response
+
+# Function to reuse an existing target entity matching the exported one instead
+# of creating a duplicate. The match is journaled, and updated first when its
+# content differs. Returns its target ID, or None when nothing matches.
+def claim_existing(entity, source_id, scope, payload, update_endpoint):
+    if target_index is None:
+        return None
+    match = target_index.claim(entity, scope, payload)
+    if match is None:
+        return None
+    target_id, changed = match
+    if changed and update_existing:
+        if post_data(f'{update_endpoint}/{target_id}', payload) is None:
+            logging.error(f"Failed to update existing {entity} {target_id} for source {entity} {source_id}")
+            return target_id
+        logging.info(f"Updated existing {entity} {target_id} for source {entity} {source_id}")
+    else:
+        logging.info(f"Reusing existing {entity} {target_id} for source {entity} {source_id}")
+    if source_id is not None:
+        journal.record(entity, source_id, target_id)
+    return target_id
+
+# Function to lazily iterate the records of an export file, preferring the
+# JSON Lines variant (e.g. test_cases.jsonl) when the export was streamed.
+# Grouped files (group set) are read in chunks of a group's records.
+def iter_data(filename, key=None, group=None):
+    if streams is not None:
+        return streams.iter_records(filename)
+    if store is not None:
+        return store.iter_records(filename, key)
+    if archive is not None:
+        jsonl_name = format_filename(filename, 'jsonl')
+        return archive.iter_records(jsonl_name if archive.has(jsonl_name) else filename, key, group)
+    file_path = os.path.join(script_dir, format_filename(filename, 'jsonl'))
+    if not os.path.exists(file_path):
+        file_path = os.path.join(script_dir, filename)
+    return iter_records(file_path, key, group)
+
+# Function to check whether an export file exists in either format
+def data_exists(filename):
+    if streams is not None:
+        return streams.has(filename)
+    if store is not None:
+        return store.has(filename)
+    names = (format_filename(filename, 'jsonl'), filename)
+    if archive is not None:
+        return any(archive.has(name) for name in names)
+    return any(os.path.exists(os.path.join(script_dir, name)) for name in names)
+
+# Function to list the names of the export files
+def export_filenames():
+    if store is not None:
+        return store.filenames()
+    if archive is not None:
+        return archive.names()
+    return os.listdir(script_dir)
+
+# Function to get the store holding the exported attachment files
+def blob_store():
+    if archive is not None:
+        return ArchiveBlobStore(archive)
+    return BlobStore(os.path.join(script_dir, attachments_dir))
 
 # Function to import milestones
 def import_milestones():
-    milestones_data = load_data('milestones.json')
-    if 'milestones' in milestones_data:
-        for milestone in milestones_data['milestones']:
-            if isinstance(milestone, dict):
-                milestone['project_id'] = new_project_id
-                # Remove fields that are not required when creating a new milestone
-                fields_to_remove = [
-                    'id', 'started_on', 'is_started', 'completed_on', 'is_completed', 
-                    'url', 'milestones'
-                ]
-                for field in fields_to_remove:
-                    milestone.pop(field, None)
-                
-                # Post the milestone to the TestRail API
-                response = post_data(f'add_milestone/{new_project_id}', milestone)
-                if response:
-                    logging.info(f"Successfully added milestone: {response['id']}")
-                else:
-                    logging.error(f"Failed to add milestone: {milestone['name']}")
+    for milestone in iter_data('milestones.json', 'milestones'):
+        if isinstance(milestone, dict):
+            source_id = milestone.get('id')
+            if is_imported('milestones', source_id):
+                continue
+            milestone = PAYLOADS['milestones'].apply(milestone)
+            milestone['project_id'] = new_project_id
+            if claim_existing('milestones', source_id, (), milestone, 'update_milestone') is not None:
+                continue
+            
+            # Post the milestone to the TestRail API
+            response = post_entity('milestones', source_id, f'add_milestone/{new_project_id}', milestone)
+            if response:
+                logging.info(f"Successfully added milestone: {response['id']}")
             else:
-                logging.warning(f"Unexpected milestone format: {milestone}")
-    else:
-        logging.error("No 'milestones' key found in the provided data.")
-
-# Function to ensure the section exists or create it
+                logging.error(f"Failed to add milestone: {milestone['name']}")
+        else:
+            logging.warning(f"Unexpected milestone format: {milestone}")
+
+# Source sections and suites by ID, loaded once from the export on first use
+source_sections = None
+source_suites = None
+
+# Function to load the exported section hierarchy and suites
+def load_source_tree():
+    global source_sections, source_suites
+    if source_sections is None:
+        source_sections = {}
+        if data_exists('sections.json'):
+            source_sections = {section['id']: SectionRecord(section) for section in iter_data('sections.json', 'sections') if isinstance(section, dict) and 'id' in section}
+        else:
+            logging.warning("No sections export found; test cases can only go into sections imported earlier.")
+        source_suites = {}
+        if data_exists('suites.json'):
+            source_suites = {suite['id']: SuiteRecord(suite) for suite in iter_data('suites.json') if isinstance(suite, dict) and 'id' in suite}
+
+# Function to ensure the suite exists or create it; returns the target suite ID,
+# or None when the suite is unknown (single-suite targets need no suite_id)
+def ensure_suite_exists(suite_id):
+    if suite_id is None:
+        return None
+    target_id = journal.target_id('suites', suite_id)
+    if target_id is None and suite_id in source_suites:
+        payload = PAYLOADS['suites'].apply(source_suites[suite_id])
+        target_id = claim_existing('suites', suite_id, (), payload, 'update_suite')
+        if target_id is not None:
+            return target_id
+        response = post_entity('suites', suite_id, f'add_suite/{new_project_id}', payload)
+        if response:
+            target_id = response['id']
+            logging.info(f"Created suite {suite_id} as {target_id}")
+    return target_id
+
+# Function to ensure the section exists or create it, parents first. The
+# source -> target map is looked up in the journal (through its cache), so no
+# request is made for sections that already exist.
 def ensure_section_exists(section_id):
-    # This function should check if the section exists and return its ID
-    # If the section does not exist, it should create the section and return the new ID
-    # For simplicity, we'll assume the section exists and return the provided section_id
-    return section_id
+    target_id = journal.target_id('sections', section_id)
+    if target_id is not None:
+        return target_id
 
-# Function to import test cases
-def import_test_cases():
-    test_cases_data = load_data('test_cases.json')
-    if 'cases' in test_cases_data:
-        for test_case in test_cases_data['cases']:
-            if isinstance(test_case, dict):
-                section_id = test_case.pop('section_id', None)
-                if section_id is None:
-                    logging.warning(f"Skipping test case due to missing section_id: {test_case}")
-                    continue
-                
-                # Ensure the section exists or create it
-                new_section_id = ensure_section_exists(section_id)
-                if new_section_id is None:
-                    logging.warning(f"Skipping test case due to invalid section_id: {section_id}")
-                    continue
-                
-                # Remove fields that are not required when creating a new test case
-                fields_to_remove = [
-                    'id', 'created_by', 'created_on', 'updated_by', 'updated_on', 
-                    'suite_id', 'display_order', 'is_deleted', 'estimate_forecast', 'case_assignedto_id', 'comments'
-                ]
-                for field in fields_to_remove:
-                    test_case.pop(field, None)
-                
-                # Post the test case to the TestRail API
-                response = post_data(f'add_case/{new_section_id}', test_case)
-                if response:
-                    logging.info(f"Successfully added test case: {response['id']}")
-                else:
-                    logging.error(f"Failed to add test case: {test_case.get('title', 'Unknown')}")
-            else:
-                logging.warning(f"Unexpected test case format: {test_case}")
+    load_source_tree()
+    section = source_sections.get(section_id)
+    if section is None:
+        return None
+
+    payload = PAYLOADS['sections'].apply(section)
+    parent_id = section.get('parent_id')
+    if parent_id:
+        target_parent_id = ensure_section_exists(parent_id)
+        if target_parent_id is None:
+            logging.error(f"Cannot create section {section_id}: parent section {parent_id} is missing")
+            return None
+        payload['parent_id'] = target_parent_id
+    target_suite_id = ensure_suite_exists(section.get('suite_id'))
+    if target_suite_id is not None:
+        payload['suite_id'] = target_suite_id
+
+    # Sections are matched within their parent; an update only changes the name and description
+    details = PAYLOADS['sections'].apply(payload)
+    target_id = claim_existing('sections', section_id, (target_suite_id, payload.get('parent_id')), details, 'update_section')
+    if target_id is not None:
+        return target_id
+    response = post_entity('sections', section_id, f'add_section/{new_project_id}', payload)
+    if not response:
+        logging.error(f"Failed to add section: {section.get('name', section_id)}")
+        return None
+    logging.info(f"Created section {section_id} as {response['id']}")
+    return response['id']
+
+# Function to import the whole section tree top-down, siblings in display order
+def import_sections():
+    load_source_tree()
+    ordered = sorted(source_sections.values(), key=lambda section: (section.get('depth') or 0, section.get('display_order') or 0))
+    for section in ordered:
+        ensure_section_exists(section['id'])
+
+# Function to read the exported test cases and queue each one for the worker of its section
+def queue_test_cases(shards, assignment):
+    for test_case in iter_data('test_cases.json', 'cases'):
+        if isinstance(test_case, dict):
+            source_id = test_case.get('id')
+            if is_imported('cases', source_id):
+                continue
+            section_id = test_case.get('section_id')
+            if section_id is None:
+                logging.warning(f"Skipping test case due to missing section_id: {test_case}")
+                continue
+            
+            # Ensure the section exists or create it
+            new_section_id = ensure_section_exists(section_id)
+            if new_section_id is None:
+                logging.warning(f"Skipping test case due to invalid section_id: {section_id}")
+                continue
+
+            test_case = PAYLOADS['cases'].apply(test_case)
+
+            # All cases of a section go to the same worker, in export order
+            worker = assignment.setdefault(new_section_id, len(assignment) % len(shards))
+            shards[worker].put((test_case, source_id, new_section_id))
+        else:
+            logging.warning(f"Unexpected test case format: {test_case}")
+
+# Function to create one test case in its target section
+def import_test_case(test_case, source_id, new_section_id):
+    if claim_existing('cases', source_id, (new_section_id,), test_case, 'update_case') is not None:
+        return
+
+    # Post the test case to the TestRail API
+    response = post_entity('cases', source_id, f'add_case/{new_section_id}', test_case)
+    if response:
+        logging.info(f"Successfully added test case: {response['id']}")
     else:
-        logging.error("No 'cases' key found in the provided data.")
+        logging.error(f"Failed to add test case: {test_case.get('title', 'Unknown')}")
+
+# Function to create the cases of one worker's sections one after another, in
+# the order they are queued, until None. Errors are collected, not raised, so
+# the worker keeps draining its queue.
+def import_case_shard(cases, errors):
+    while True:
+        item = cases.get()
+        if item is None:
+            return
+        try:
+            import_test_case(*item)
+        except Exception as e:
+            logging.error(f"Failed to add test case {item[1]}: {e}")
+            errors.append(e)
+
+# Function to import test cases. Cases are sharded by target section: each
+# section is pinned to one of case_workers workers, which creates its cases
+# in export order, so TestRail's display order within every section matches
+# the source while different sections are filled in parallel. Sections are
+# resolved (and created) here, one at a time, before their cases are queued.
+def import_test_cases():
+    shards = [queue.Queue(maxsize=100) for _ in range(max(1, case_workers))]  # Bounded: reading waits for slow workers
+    assignment = {}  # Target section ID -> worker
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        for shard in shards:
+            executor.submit(import_case_shard, shard, errors)
+        try:
+            queue_test_cases(shards, assignment)
+        finally:
+            for shard in shards:
+                shard.put(None)
+    if errors:
+        raise errors[0]
 
 # Function to import test plans
 def import_test_plans():
-    test_plans_data = load_data('test_plans.json')
-    for test_plan in test_plans_data:
+    for test_plan in iter_data('test_plans.json', 'plans'):
         if isinstance(test_plan, dict):
-            test_plan['project_id'] = new_project_id
+            source_id = test_plan.get('id')
+            if is_imported('plans', source_id):
+                continue
             # Ensure milestone_id is valid
             if 'milestone_id' not in test_plan or not test_plan['milestone_id']:
                 logging.warning(f"Skipping test plan due to missing or invalid milestone_id: {test_plan}")
                 continue
-            # Remove fields that are not required when creating a new test plan
-            test_plan = {key: test_plan[key] for key in test_plan if key in ['name', 'description', 'milestone_id']}
-            post_data(f'add_plan/{new_project_id}', test_plan)
+            test_plan = PAYLOADS['plans'].apply(test_plan)
+            post_entity('plans', source_id, f'add_plan/{new_project_id}', test_plan)
         else:
             logging.warning(f"Unexpected test plan format: {test_plan}")
 
 # Function to import test runs
 def import_test_runs():
-    test_runs_data = load_data('test_runs.json')
-    for test_run in test_runs_data:
+    for test_run in iter_data('test_runs.json', 'runs'):
         if isinstance(test_run, dict):
+            if is_imported('runs', test_run.get('id')):
+                continue
             test_run['project_id'] = new_project_id
             if 'milestone_id' not in test_run or not test_run['milestone_id']:
                 logging.warning(f"Skipping test run due to missing or invalid milestone_id: {test_run}")
                 continue
-            post_data(f'add_run/{new_project_id}', test_run)
+            post_entity('runs', test_run.get('id'), f'add_run/{new_project_id}', test_run)
         else:
             logging.warning(f"Unexpected test run format: {test_run}")
 
-# Function to import test results
+# Function to post a batch of (source_id, result) pairs to a run. A failed
+# batch is split in halves and retried until the failing results are isolated.
+def post_results_batch(run_id, batch):
+    response = post_data(f'add_results_for_cases/{run_id}', {'results': [result for _, result in batch]})
+    if isinstance(response, dict):
+        response = response.get('results')
+    if response is not None:
+        # Created results come back in request order
+        journal.record_many('results', [
+            (source_id, created['id'])
+            for (source_id, _), created in zip(batch, response)
+            if source_id is not None and isinstance(created, dict) and 'id' in created
+        ])
+        logging.info(f"Successfully added {len(batch)} results to run {run_id}")
+    elif len(batch) == 1:
+        logging.error(f"Failed to add result for case {batch[0][1].get('case_id')} in run {run_id}")
+    else:
+        middle = len(batch) // 2
+        post_results_batch(run_id, batch[:middle])
+        post_results_batch(run_id, batch[middle:])
+
+# Function to iterate (source run ID, results) of the exported runs. The
+# results of a run are only read as they are iterated, a chunk at a time.
+def iter_results_by_run():
+    if store is not None:
+        for run_id in store.values('results', 'run_id', file='test_results'):
+            yield run_id, store.query('results', file='test_results', run_id=run_id)
+        return
+    chunks = iter_data('test_results.json', group='run_id')
+    for run_id, run_chunks in itertools.groupby(chunks, key=lambda chunk: chunk.get('run_id')):
+        yield run_id, (result for chunk in run_chunks for result in chunk.get('results') or [])
+
+# Function to map the source test IDs of a run to their source case IDs, from
+# the tests the export saved for the run (tests_run_{id})
+def load_test_cases(source_run_id):
+    filename = f'tests_run_{source_run_id}.json'
+    if not data_exists(filename):
+        return {}
+    return {test.get('id'): test.get('case_id') for test in iter_data(filename) if isinstance(test, dict)}
+
+# Function to import test results, grouped per run and sent in batches.
+# TestRail results only name their test, so they are mapped to cases through
+# the run's exported tests (or a case_id already added by the migration).
 def import_test_results():
-    test_results_data = load_data('test_results.json')
-    for result in test_results_data:
-        run_id = result.get('run_id')
-        for test_result in result.get('results', []):
+    for source_run_id, results in iter_results_by_run():
+        run_id = journal.target_id('runs', source_run_id)
+        if run_id is None:
+            logging.warning(f"Skipping results of run {source_run_id}: the run has not been imported")
+            continue
+        test_cases = load_test_cases(source_run_id)
+        batch = []
+        dropped = 0
+        for test_result in results:
             if isinstance(test_result, dict):
-                post_data(f'add_result_for_case/{run_id}/{test_result["case_id"]}', test_result)
+                source_id = test_result.get('id')
+                if journal.target_id('results', source_id) is not None:
+                    continue
+                # Drop results whose case is not in the target before making any request
+                source_case_id = test_result.get('case_id') or test_cases.get(test_result.get('test_id'))
+                case_id = journal.target_id('cases', source_case_id)
+                if case_id is None:
+                    dropped += 1
+                    continue
+                payload = PAYLOADS['results'].apply(test_result)
+                payload['case_id'] = case_id
+                batch.append((source_id, payload))
+                if len(batch) >= results_batch_size:
+                    post_results_batch(run_id, batch)
+                    batch = []
             else:
                 logging.warning(f"Unexpected test result format: {test_result}")
+        if batch:
+            post_results_batch(run_id, batch)
+        if dropped:
+            logging.warning(f"Dropped {dropped} results of run {source_run_id} whose cases have not been imported"
+                            + ("" if test_cases else " (its tests were not exported)"))
 
 # Function to import reports
 def import_reports():
-    reports_data = load_data('reports.json')
-    for report in reports_data:
+    for report in iter_data('reports.json'):
         if isinstance(report, dict):
+            if is_imported('reports', report.get('id')):
+                continue
             report['project_id'] = new_project_id
-            post_data(f'add_report/{new_project_id}', report)
+            post_entity('reports', report.get('id'), f'add_report/{new_project_id}', report)
         else:
             logging.warning(f"Unexpected report format: {report}")
 
 # Function to import users
 def import_users():
-    users_data = load_data('users.json')
-    for user in users_data:
+    for user in iter_data('users.json', 'users'):
         if isinstance(user, dict):
             response = post_data('add_user', user)
             if response is None and 'The Email Address is already in use by another user.' in response.content.decode():
@@ -209,8 +541,7 @@ def import_users():
 
 # Function to import project users
 def import_project_users():
-    project_users_data = load_data('project_users.json')
-    for user in project_users_data:
+    for user in iter_data('project_users.json', 'users'):
         if isinstance(user, dict):
             user['project_id'] = new_project_id
             post_data(f'add_user_to_project/{new_project_id}', user)
@@ -219,232 +550,440 @@ def import_project_users():
 
 # Function to import templates
 def import_templates():
-    templates_data = load_data('templates.json')
-    for template in templates_data:
+    for template in iter_data('templates.json'):
         if isinstance(template, dict):
-                       post_data(f'add_template/{new_project_id}', template)
+            if is_imported('templates', template.get('id')):
+                continue
+            post_entity('templates', template.get('id'), f'add_template/{new_project_id}', template)
         else:
             logging.warning(f"Unexpected template format: {template}")
 
 # Function to import suites
 def import_suites():
-    suites_data = load_data('suites.json')
-    for suite in suites_data:
+    for suite in iter_data('suites.json'):
         if isinstance(suite, dict):
-            suite['project_id'] = new_project_id
-            post_data(f'add_suite/{new_project_id}', suite)
+            if is_imported('suites', suite.get('id')):
+                continue
+            details = PAYLOADS['suites'].apply(suite)
+            if claim_existing('suites', suite.get('id'), (), details, 'update_suite') is not None:
+                continue
+            details['project_id'] = new_project_id
+            post_entity('suites', suite.get('id'), f'add_suite/{new_project_id}', details)
         else:
             logging.warning(f"Unexpected suite format: {suite}")
 
 # Function to import case statuses
 def import_case_statuses():
-    case_statuses_data = load_data('case_statuses.json')
-    for status in case_statuses_data:
+    for status in iter_data('case_statuses.json'):
         if isinstance(status, dict):
-            post_data('add_case_status', status)
+            if is_imported('case_statuses', status.get('id')):
+                continue
+            post_entity('case_statuses', status.get('id'), 'add_case_status', status)
         else:
             logging.warning(f"Unexpected case status format: {status}")
 
 # Function to import statuses
 def import_statuses():
-    statuses_data = load_data('statuses.json')
-    for status in statuses_data:
+    for status in iter_data('statuses.json'):
         if isinstance(status, dict):
-            post_data('add_status', status)
+            if is_imported('statuses', status.get('id')):
+                continue
+            post_entity('statuses', status.get('id'), 'add_status', status)
         else:
             logging.warning(f"Unexpected status format: {status}")
 
 # Function to import shared steps
 def import_shared_steps():
-    shared_steps_data = load_data('shared_steps.json')
-    for step in shared_steps_data:
+    for step in iter_data('shared_steps.json', 'shared_steps'):
         if isinstance(step, dict):
-            post_data(f'add_shared_step/{new_project_id}', step)
+            if is_imported('shared_steps', step.get('id')):
+                continue
+            post_entity('shared_steps', step.get('id'), f'add_shared_step/{new_project_id}', step)
         else:
             logging.warning(f"Unexpected shared step format: {step}")
 
 # Function to import runs
 def import_runs():
-    runs_data = load_data('runs.json')
-    for run in runs_data:
+    for run in iter_data('runs.json', 'runs'):
         if isinstance(run, dict):
+            if is_imported('runs', run.get('id')):
+                continue
             run['project_id'] = new_project_id
-            post_data(f'add_run/{new_project_id}', run)
+            post_entity('runs', run.get('id'), f'add_run/{new_project_id}', run)
         else:
             logging.warning(f"Unexpected run format: {run}")
 
 # Function to import roles
 def import_roles():
-    roles_data = load_data('roles.json')
-    for role in roles_data:
+    for role in iter_data('roles.json', 'roles'):
         if isinstance(role, dict):
-            post_data('add_role', role)
+            if is_imported('roles', role.get('id')):
+                continue
+            post_entity('roles', role.get('id'), 'add_role', role)
         else:
             logging.warning(f"Unexpected role format: {role}")
 
 # Function to import groups
 def import_groups():
-    groups_data = load_data('groups.json')
-    for group in groups_data:
+    for group in iter_data('groups.json', 'groups'):
         if isinstance(group, dict):
-            post_data('add_group', group)
+            if is_imported('groups', group.get('id')):
+                continue
+            post_entity('groups', group.get('id'), 'add_group', group)
         else:
             logging.warning(f"Unexpected group format: {group}")
 
 # Function to import datasets
 def import_datasets():
-    datasets_data = load_data('datasets.json')
-    for dataset in datasets_data:
+    for dataset in iter_data('datasets.json', 'datasets'):
         if isinstance(dataset, dict):
-            post_data(f'add_dataset/{new_project_id}', dataset)
+            if is_imported('datasets', dataset.get('id')):
+                continue
+            post_entity('datasets', dataset.get('id'), f'add_dataset/{new_project_id}', dataset)
         else:
             logging.warning(f"Unexpected dataset format: {dataset}")
 
 # Function to import configs
 def import_configs():
-    configs_data = load_data('configs.json')
-    for config in configs_data:
+    for config in iter_data('configs.json'):
         if isinstance(config, dict):
-            post_data(f'add_config/{new_project_id}', config)
+            if is_imported('configs', config.get('id')):
+                continue
+            post_entity('configs', config.get('id'), f'add_config/{new_project_id}', config)
         else:
             logging.warning(f"Unexpected config format: {config}")
 
 # Function to import case types
 def import_case_types():
-    case_types_data = load_data('case_types.json')
-    for case_type in case_types_data:
+    for case_type in iter_data('case_types.json'):
         if isinstance(case_type, dict):
-            post_data('add_case_type', case_type)
+            if is_imported('case_types', case_type.get('id')):
+                continue
+            post_entity('case_types', case_type.get('id'), 'add_case_type', case_type)
         else:
             logging.warning(f"Unexpected case type format: {case_type}")
 
 # Function to import case fields
 def import_case_fields():
-    case_fields_data = load_data('case_fields.json')
-    for case_field in case_fields_data:
+    for case_field in iter_data('case_fields.json'):
         if isinstance(case_field, dict):
-            post_data('add_case_field', case_field)
+            if is_imported('case_fields', case_field.get('id')):
+                continue
+            post_entity('case_fields', case_field.get('id'), 'add_case_field', case_field)
         else:
             logging.warning(f"Unexpected case field format: {case_field}")
 
 # Function to import priorities
 def import_priorities():
-    priorities_data = load_data('priorities.json')
-    for priority in priorities_data:
+    for priority in iter_data('priorities.json'):
         if isinstance(priority, dict):
-            post_data('add_priority', priority)
+            if is_imported('priorities', priority.get('id')):
+                continue
+            post_entity('priorities', priority.get('id'), 'add_priority', priority)
         else:
             logging.warning(f"Unexpected priority format: {priority}")
 
 # Function to import project
 def import_project():
-    project_data = load_data('project.json')
+    project_data = next(iter_data('project.json'), None)
     if isinstance(project_data, dict):
-        post_data('add_project', project_data)
+        if is_imported('projects', project_data.get('id')):
+            return
+        post_entity('projects', project_data.get('id'), 'add_project', project_data)
     else:
         logging.warning(f"Unexpected project format: {project_data}")
 
 # Function to import tests
 def import_tests():
-    tests_data = load_data('tests.json')
-    for test in tests_data:
+    for test in iter_data('tests.json', 'tests'):
         if isinstance(test, dict):
             post_data(f'add_test/{new_project_id}', test)
         else:
             logging.warning(f"Unexpected test format: {test}")
 
+# Journal entity holding the target IDs of each attachment owner type
+attachment_owners = {'case': 'cases', 'plan': 'plans', 'run': 'runs', 'test': 'tests'}
+
+# Function to list the source IDs in the names of the per-entity export files
+# starting with prefix (e.g. tests_run_ gives the IDs of the runs with tests)
+def exported_ids(prefix):
+    pattern = re.compile(rf'^{prefix}(\d+)\.jsonl?$')
+    return sorted({int(match.group(1)) for match in map(pattern.match, export_filenames()) if match})
+
+# Function to list the source IDs of the entities of one type with exported attachment metadata
+def attachment_sources(entity):
+    return exported_ids(f'attachments_{entity}_')
+
+# Function to import the attachment files of one entity type (case, plan, run
+# or test) from the per-entity metadata files written by the export. Files are
+# streamed from the content-addressed store as multipart uploads. TestRail has
+# no way to link one upload to several entities, so a blob is uploaded once per
+# target entity, and the journal makes sure it is never uploaded to it twice.
+def import_attachments(entity):
+    blobs = blob_store()
+    for source_id in attachment_sources(entity):
+        target_id = journal.target_id(attachment_owners[entity], source_id)
+        if target_id is None:
+            logging.warning(f"Skipping attachments of {entity} {source_id}: the {entity} has not been imported")
+            continue
+        for attachment in iter_data(f'attachments_{entity}_{source_id}.json', 'attachments'):
+            if not isinstance(attachment, dict):
+                logging.warning(f"Unexpected attachment format: {attachment}")
+                continue
+            sha256 = attachment.get('sha256')
+            if not sha256 or not blobs.has(sha256):
+                logging.warning(f"Skipping attachment {attachment.get('name')} of {entity} {source_id}: its file was not exported")
+                continue
+            blob_key = f'{entity}/{target_id}/{sha256}'
+            if journal.target_id('attachment_blobs', blob_key) is not None:
+                continue
+            response = post_file(f'add_attachment_to_{entity}/{target_id}', lambda: blobs.open(sha256), attachment.get('name') or sha256)
+            if response:
+                journal.record('attachment_blobs', blob_key, response.get('attachment_id') or response.get('id'))
+            else:
+                logging.error(f"Failed to add attachment {attachment.get('name')} to {entity} {target_id}")
+
 # Function to import attachments for cases
 def import_attachments_for_case():
-    attachments_data = load_data('attachments_for_case.json')
-    for attachment in attachments_data:
-        if isinstance(attachment, dict):
-            post_data(f'add_attachment_to_case/{attachment["case_id"]}', attachment)
-        else:
-            logging.warning(f"Unexpected attachment format: {attachment}")
+    import_attachments('case')
 
 # Function to import attachments for plans
 def import_attachments_for_plan():
-    attachments_data = load_data('attachments_for_plan.json')
-    for attachment in attachments_data:
-        if isinstance(attachment, dict):
-            post_data(f'add_attachment_to_plan/{attachment["plan_id"]}', attachment)
-        else:
-            logging.warning(f"Unexpected attachment format: {attachment}")
+    import_attachments('plan')
 
 # Function to import attachments for runs
 def import_attachments_for_run():
-    attachments_data = load_data('attachments_for_run.json')
-    for attachment in attachments_data:
-        if isinstance(attachment, dict):
-            post_data(f'add_attachment_to_run/{attachment["run_id"]}', attachment)
-        else:
-            logging.warning(f"Unexpected attachment format: {attachment}")
+    import_attachments('run')
+
+# Function to journal the target tests of the exported tests with attachments.
+# TestRail creates the tests of a run itself, so the target of a source test is
+# the test of its case in the target run, found with one get_tests per run.
+def map_target_tests():
+    sources = set(attachment_sources('test'))
+    for source_run_id in exported_ids('tests_run_'):
+        run_id = journal.target_id('runs', source_run_id)
+        if run_id is None:
+            continue
+        pending = [test for test in iter_data(f'tests_run_{source_run_id}.json')
+                   if isinstance(test, dict) and test.get('id') in sources and journal.target_id('tests', test['id']) is None]
+        if not pending:
+            continue
+        try:
+            target_tests = {test.get('case_id'): test['id']
+                            for test in paginate(get_data, f'get_tests/{run_id}', 'tests', strict=True) if 'id' in test}
+        except PaginationError as e:
+            logging.error(f"Cannot list the tests of run {run_id}, skipping the attachments of its tests: {e}")
+            continue
+        journal.record_many('tests', [
+            (test['id'], target_tests[case_id]) for test in pending
+            for case_id in [journal.target_id('cases', test.get('case_id'))] if case_id in target_tests
+        ])
 
 # Function to import attachments for tests
 def import_attachments_for_test():
-    attachments_data = load_data('attachments_for_test.json')
-    for attachment in attachments_data:
-        if isinstance(attachment, dict):
-            post_data(f'add_attachment_to_test/{attachment["test_id"]}', attachment)
+    map_target_tests()
+    import_attachments('test')
+
+# Import stages and the stages each one depends on. A stage starts once all of
+# its enabled dependencies have finished; stages without a path between them
+# run in parallel.
+import_stages = {
+    'project': (import_project, []),
+    'milestones': (import_milestones, []),
+    'suites': (import_suites, []),
+    'sections': (import_sections, ['suites']),
+    'templates': (import_templates, []),
+    'case_fields': (import_case_fields, ['templates']),
+    'case_types': (import_case_types, []),
+    'priorities': (import_priorities, []),
+    'case_statuses': (import_case_statuses, []),
+    'statuses': (import_statuses, []),
+    'roles': (import_roles, []),
+    'groups': (import_groups, []),
+    'users': (import_users, ['roles', 'groups']),
+    'project_users': (import_project_users, ['users']),
+    'shared_steps': (import_shared_steps, []),
+    'datasets': (import_datasets, []),
+    'configs': (import_configs, []),
+    'reports': (import_reports, []),
+    'test_cases': (import_test_cases, ['suites', 'sections', 'templates', 'case_fields', 'case_types', 'priorities', 'case_statuses']),
+    'test_plans': (import_test_plans, ['milestones', 'configs']),
+    'test_runs': (import_test_runs, ['milestones', 'test_cases', 'test_plans', 'configs']),
+    'runs': (import_runs, ['milestones', 'test_cases', 'test_plans', 'configs', 'test_runs']),
+    'tests': (import_tests, ['test_runs', 'runs']),
+    'test_results': (import_test_results, ['test_runs', 'runs', 'test_cases', 'statuses', 'users']),
+    'attachments_for_case': (import_attachments_for_case, ['test_cases']),
+    'attachments_for_plan': (import_attachments_for_plan, ['test_plans']),
+    'attachments_for_run': (import_attachments_for_run, ['test_runs', 'runs']),
+    'attachments_for_test': (import_attachments_for_test, ['test_runs', 'runs', 'test_cases']),
+}
+
+# Entity types indexed in the target, and the stages that create them
+indexed_stages = {
+    'milestones': ['milestones'],
+    'suites': ['suites', 'sections', 'test_cases'],
+    'sections': ['sections', 'test_cases'],
+    'cases': ['test_cases'],
+}
+
+# Function to index the target's existing entities of the enabled stages,
+# leaving out the ones a previous run already mapped in the journal
+def index_target(stages):
+    global target_index
+    entities = [entity for entity, names in indexed_stages.items() if any(name in stages for name in names)]
+    if not entities:
+        return
+    start = time.perf_counter()
+    target_index = build_target_index(get_data, new_project_id, entities)
+    for entity in entities:
+        target_index.exclude(entity, journal.mapping(entity).values())
+    counts = ', '.join(f"{target_index.size(entity)} {entity}" for entity in entities)
+    logging.info(f"Indexed {counts} of the target project in {time.perf_counter() - start:.1f}s")
+
+# Export file, record key and journal entity of the stages that send one
+# request per exported record (no journal entity: every record is sent)
+planned_records = {
+    'project': ('project.json', None, 'projects'),
+    'milestones': ('milestones.json', 'milestones', 'milestones'),
+    'suites': ('suites.json', None, 'suites'),
+    'sections': ('sections.json', 'sections', 'sections'),
+    'templates': ('templates.json', None, 'templates'),
+    'case_fields': ('case_fields.json', None, 'case_fields'),
+    'case_types': ('case_types.json', None, 'case_types'),
+    'priorities': ('priorities.json', None, 'priorities'),
+    'case_statuses': ('case_statuses.json', None, 'case_statuses'),
+    'statuses': ('statuses.json', None, 'statuses'),
+    'roles': ('roles.json', 'roles', 'roles'),
+    'groups': ('groups.json', 'groups', 'groups'),
+    'users': ('users.json', 'users', None),
+    'project_users': ('project_users.json', 'users', None),
+    'shared_steps': ('shared_steps.json', 'shared_steps', 'shared_steps'),
+    'datasets': ('datasets.json', 'datasets', 'datasets'),
+    'configs': ('configs.json', None, 'configs'),
+    'reports': ('reports.json', None, 'reports'),
+    'test_cases': ('test_cases.json', 'cases', 'cases'),
+    'test_plans': ('test_plans.json', 'plans', 'plans'),
+    'test_runs': ('test_runs.json', 'runs', 'runs'),
+    'runs': ('runs.json', 'runs', 'runs'),
+    'tests': ('tests.json', 'tests', None),
+}
+
+# Function to count the exported records of a file that are not in the journal yet
+def count_pending(filename, key, entity):
+    if not data_exists(filename):
+        return 0
+    return sum(1 for record in iter_data(filename, key)
+               if not isinstance(record, dict) or entity is None or journal.target_id(entity, record.get('id')) is None)
+
+# Function to count the pending results and the add_results_for_cases batches they take
+def count_result_batches():
+    results = batches = 0
+    if data_exists('test_results.json'):
+        for _, run_results in iter_results_by_run():
+            pending = sum(1 for result in run_results
+                          if isinstance(result, dict) and journal.target_id('results', result.get('id')) is None)
+            results += pending
+            batches += math.ceil(pending / results_batch_size)
+    return results, batches
+
+# Function to count the attachment files of one entity type not uploaded yet
+def count_attachment_uploads(entity):
+    uploads = 0
+    for source_id in attachment_sources(entity):
+        target_id = journal.target_id(attachment_owners[entity], source_id)
+        for attachment in iter_data(f'attachments_{entity}_{source_id}.json', 'attachments'):
+            if isinstance(attachment, dict) and attachment.get('sha256') and (
+                    target_id is None or journal.target_id('attachment_blobs', f"{entity}/{target_id}/{attachment['sha256']}") is None):
+                uploads += 1
+    return uploads
+
+# Function to count the requests of indexing the target (see index_target)
+def plan_index(stages):
+    entities = [entity for entity, names in indexed_stages.items() if any(name in stages for name in names)]
+    if not entities:
+        return None
+    suites = get_data(f'get_suites/{new_project_id}')
+    suite_ids = [suite['id'] for suite in suites if 'id' in suite] if isinstance(suites, list) else []
+    request_count = 1
+    counts = []
+    for entity in entities:
+        count = 0
+        for endpoint in listing_endpoints(new_project_id, entity, suite_ids):
+            items, _ = count_items(get_data, endpoint, entity)
+            count += items
+            request_count += pages(items)
+        counts.append(f'{count} {entity}')
+    return StagePlan('index', request_count, detail=', '.join(counts))
+
+# Function to estimate the requests of every enabled stage from the export and
+# the journal (records already imported are skipped) and the wall time of the
+# stages, which overlap as run_stages() runs them. Matched entities are counted
+# as created, so with match_existing the estimate is an upper bound.
+def plan_import(stages):
+    planned = []
+    if match_existing:
+        index = plan_index(stages)
+        if index is not None:
+            planned.append(index)
+    for name in stages:
+        if name == 'test_results':
+            results, batches = count_result_batches()
+            planned.append(StagePlan(name, batches, detail=f'{results} results'))
+        elif name.startswith('attachments_for_'):
+            uploads = count_attachment_uploads(name[len('attachments_for_'):])
+            planned.append(StagePlan(name, uploads, detail=f'{uploads} files'))
         else:
-            logging.warning(f"Unexpected attachment format: {attachment}")
+            count = count_pending(*planned_records[name])
+            planned.append(StagePlan(name, count, case_workers if name == 'test_cases' else 1, f'{count} records'))
+    return RunPlan(planned, measured_latency(metrics, get_data, f'get_project/{new_project_id}'), client.limiter, graph=stages)
 
 # Main function to handle the import process
 def main():
-    if import_config['milestones']:
-        import_milestones()
-    if import_config['test_cases']:
-        import_test_cases()
-    if import_config['test_plans']:
-        import_test_plans()
-    if import_config['test_runs']:
-        import_test_runs()
-    if import_config['test_results']:
-        import_test_results()
-    if import_config['reports']:
-        import_reports()
-    if import_config['users']:
-        import_users()
-    if import_config['project_users']:
-        import_project_users()
-    if import_config['templates']:
-        import_templates()
-    if import_config['suites']:
-        import_suites()
-    if import_config['case_statuses']:
-        import_case_statuses()
-    if import_config['statuses']:
-        import_statuses()
-    if import_config['shared_steps']:
-        import_shared_steps()
-    if import_config['runs']:
-        import_runs()
-    if import_config['roles']:
-        import_roles()
-    if import_config['groups']:
-        import_groups()
-    if import_config['datasets']:
-        import_datasets()
-    if import_config['configs']:
-        import_configs()
-    if import_config['case_types']:
-        import_case_types()
-    if import_config['case_fields']:
-        import_case_fields()
-    if import_config['priorities']:
-        import_priorities()
-    if import_config['project']:
-        import_project()
-    if import_config['tests']:
-        import_tests()
-    if import_config['attachments_for_case']:
-        import_attachments_for_case()
-    if import_config['attachments_for_plan']:
-        import_attachments_for_plan()
-    if import_config['attachments_for_run']:
-        import_attachments_for_run()
-    if import_config['attachments_for_test']:
-        import_attachments_for_test()
+    global journal, archive, store
+    try:
+        journal = ImportJournal(os.path.join(script_dir, journal_filename), f'{client.base_url} project {new_project_id}')
+    except JournalScopeError as e:
+        logging.error(f"Not importing: {e}")
+        return
+    if archive_filename:
+        archive = ExportArchive(os.path.join(script_dir, archive_filename))
+    if store_filename:
+        store_path = os.path.join(script_dir, store_filename)
+        if not os.path.exists(store_path):
+            logging.error(f"Export store {store_path} does not exist")
+            return
+        store = ExportStore(store_path)
+    metrics.start(os.path.join(script_dir, metrics_filename), os.path.join(script_dir, prometheus_filename),
+                  interval=metrics_interval)
+
+    stages = {name: stage for name, stage in import_stages.items() if import_config.get(name)}
+    start = time.perf_counter()
+    progress = None
+    try:
+        # Streamed records can only be read once, by the stages themselves
+        if (plan_only or progress_interval) and streams is None:
+            plan = plan_import(stages)
+            plan.log()
+            if plan_only:
+                return
+            progress = ProgressReporter(plan, metrics, progress_interval)
+            progress.start()
+        if match_existing:
+            try:
+                index_target(stages)
+            except PaginationError as e:
+                logging.error(f"Cannot index the target project, not importing to avoid duplicates: {e}")
+                return
+        durations = run_stages(stages, max_workers=stage_workers)
+    finally:
+        if progress is not None:
+            progress.stop()
+        metrics.stop()
+        if archive is not None:
+            archive.close()
+        if store is not None:
+            store.close()
+    log_critical_path(stages, durations, time.perf_counter() - start)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
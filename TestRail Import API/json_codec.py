@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+
+try:
+    import orjson  # Optional: a much faster JSON parser and serializer
+except ImportError:
+    orjson = None
+
+# JSON codec for the hot paths of the scripts: API responses and request
+# bodies, and the records of JSON Lines files, export stores and spools. It is
+# orjson when that is installed and the standard library otherwise, or the one
+# named by the TESTRAIL_JSON_CODEC environment variable ('json' or 'orjson').
+# Both produce compact JSON that either one reads back. The standard library
+# escapes non-ASCII characters and orjson writes them as UTF-8, so files of
+# compact records are opened as UTF-8. Indented .json export files are always
+# written by the standard library, so their format does not depend on the codec.
+
+
+# Standard library codec
+class StdlibCodec:
+    name = 'json'
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj, sort_keys=False, default=None):
+        return json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys, default=default)
+
+    @staticmethod
+    def dumps_bytes(obj, sort_keys=False, default=None):
+        return json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys, default=default).encode('utf-8')
+
+
+# orjson codec; loads takes str or bytes, dumps_bytes skips decoding the output
+class OrjsonCodec:
+    name = 'orjson'
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps_bytes(obj, sort_keys=False, default=None):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=default, option=option)
+
+    @classmethod
+    def dumps(cls, obj, sort_keys=False, default=None):
+        return cls.dumps_bytes(obj, sort_keys, default).decode('utf-8')
+
+
+CODECS = {'json': StdlibCodec, 'orjson': OrjsonCodec}
+
+codec = StdlibCodec
+
+
+# Switch to the named codec ('json' or 'orjson'); returns its name, which is
+# 'json' when orjson was asked for but is not installed
+def use(name):
+    global codec
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec {name!r}; expected one of {', '.join(CODECS)}")
+    if name == 'orjson' and orjson is None:
+        logging.warning("orjson is not installed, using the standard json module")
+        name = 'json'
+    codec = CODECS[name]
+    return codec.name
+
+
+def loads(data):
+    return codec.loads(data)
+
+
+# Compact JSON text
+def dumps(obj, sort_keys=False, default=None):
+    return codec.dumps(obj, sort_keys, default)
+
+
+# Compact JSON as UTF-8 bytes, e.g. for a request body or a hash
+def dumps_bytes(obj, sort_keys=False, default=None):
+    return codec.dumps_bytes(obj, sort_keys, default)
+
+
+use(os.environ.get('TESTRAIL_JSON_CODEC') or ('orjson' if orjson is not None else 'json'))
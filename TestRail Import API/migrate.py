@@ -0,0 +1,158 @@
+import logging
+import os
+import threading
+import time
+
+import export_testrail as export
+import import_testrail as importer
+from record_streams import RecordStreams
+from response_cache import ResponseCache
+from testrail_client import RateLimiter, TestRailClient, paginate
+
+# Migrates a project from one TestRail instance (or project) to another in one
+# pass: the export fetchers run in background threads and hand their records
+# to the import stages through bounded in-memory queues instead of files, so
+# entities are created in the target while later pages are still downloading.
+
+# Source TestRail URL, username, API key and project
+source_base_url = 'https://your_source_instance.testrail.io'
+source_username = 'your_email@example.com'
+source_api_key = 'your_api_key'
+source_project_id = 1
+
+# Target TestRail URL, username, API key and project
+target_base_url = 'https://your_target_instance.testrail.io'
+target_username = 'your_email@example.com'
+target_api_key = 'your_api_key'
+target_project_id = 2
+
+queue_size = 1000  # Records buffered between the export and the import per entity; a full queue pauses its fetcher
+journal_filename = 'migrate_journal.sqlite'  # Source -> target ID journal that lets an interrupted migration resume
+pool_size = 10  # Number of pooled keep-alive connections to each instance
+rate_limit = 5  # Starting request rate per second of each instance; adapts to TestRail's 429 responses
+max_retries = 8  # Retries with exponential backoff for throttled or failed requests
+drop_unused_fields = True  # Drop fields the import never sends as records are fetched, so the queues hold less
+
+# Migration configuration (the import stages that are fed by the stream)
+migrate_config = {
+    'milestones': True,
+    'suites': True,
+    'sections': True,
+    'test_cases': True,
+    'test_plans': False,
+    'test_runs': False,
+    'test_results': False,
+}
+
+# Get the directory of the current script
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+# Results only name their test, and the tests of a run are not streamed, so
+# add the case_id of each result's test from the run's tests in the source
+def with_case_ids(chunks):
+    run_id, test_cases = None, {}
+    for chunk in chunks:
+        if chunk['run_id'] != run_id:
+            run_id = chunk['run_id']
+            test_cases = {test['id']: test.get('case_id')
+                          for page in export.tests_pages(run_id) for test in page if 'id' in test}
+        for result in chunk['results']:
+            result['case_id'] = test_cases.get(result.get('test_id'))
+        yield chunk
+
+
+def fetch_runs_and_results():
+    plan_ids = export.entity_ids(paginate(export.get_data, f'get_plans/{source_project_id}', 'plans', strict=True))
+    test_runs = export.fetch_test_runs_from_plans(plan_ids)
+    export.save_data({'runs': test_runs}, 'test_runs.json')
+    # A page of results at a time, so they are posted while the next page is fetched
+    export.save_items(with_case_ids(export.iter_result_chunks(export.entity_ids(test_runs))), 'test_results.json')
+
+
+# Producers: the export file each stage reads, and the function that fetches them
+producers = [
+    ({'milestones': 'milestones.json'}, lambda: export.fetch_and_save_paginated(
+        f'get_milestones/{source_project_id}&is_completed=0', 'milestones', 'milestones.json')),
+    ({'suites': 'suites.json'}, lambda: export.fetch_and_save(f'get_suites/{source_project_id}', 'suites.json')),
+    ({'sections': 'sections.json'}, lambda: export.save_items(export.iter_sections(), 'sections.json', 'sections')),
+    ({'test_cases': 'test_cases.json'}, lambda: export.fetch_and_save_paginated(
+        f'get_cases/{source_project_id}', 'cases', 'test_cases.json')),
+    ({'test_plans': 'test_plans.json'}, lambda: export.fetch_and_save_paginated(
+        f'get_plans/{source_project_id}', 'plans', 'test_plans.json')),
+    ({'test_runs': 'test_runs.json', 'test_results': 'test_results.json'}, fetch_runs_and_results),
+]
+
+
+# Point the export at the source and the import at the target, both streaming through streams
+def configure(streams):
+    export.client = TestRailClient(source_base_url, source_username, source_api_key, pool_size=pool_size,
+                                   limiter=RateLimiter(rate=rate_limit), max_retries=max_retries,
+                                   metrics=export.metrics)
+    export.response_cache = ResponseCache(os.path.join(script_dir, export.cache_dirname), namespace=source_base_url)
+    export.project_id = source_project_id
+    export.drop_unused_fields = drop_unused_fields
+    export.script_dir = script_dir
+    export.streams = streams
+
+    importer.client = TestRailClient(target_base_url, target_username, target_api_key, pool_size=pool_size,
+                                     limiter=RateLimiter(rate=rate_limit), max_retries=max_retries,
+                                     metrics=importer.metrics)
+    importer.response_cache = ResponseCache(os.path.join(script_dir, importer.cache_dirname), namespace=target_base_url)
+    importer.new_project_id = target_project_id
+    importer.script_dir = script_dir
+    importer.journal_filename = journal_filename
+    importer.streams = streams
+    for name in importer.import_config:
+        importer.import_config[name] = bool(migrate_config.get(name))
+
+
+# Run a producer, ending its streams even if it fails so the import never waits forever
+def produce(streams, filenames, fetch):
+    try:
+        fetch()
+    except Exception as e:
+        logging.error(f"Fetching {', '.join(filenames)} failed: {e}")
+    finally:
+        for filename in filenames:
+            streams.end(filename)
+
+
+# Start the fetchers of the enabled stages and run the import stages on their streams
+def run(streams):
+    start = time.perf_counter()
+    # Only streams of enabled stages are opened; records of the others are dropped
+    threads = []
+    for files, fetch in producers:
+        filenames = [filename for stage, filename in files.items() if migrate_config.get(stage)]
+        if not filenames:
+            continue
+        for filename in filenames:
+            streams.open(filename)
+        thread = threading.Thread(target=produce, args=(streams, filenames, fetch), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    export.metrics.start(os.path.join(script_dir, export.metrics_filename),
+                         os.path.join(script_dir, export.prometheus_filename), interval=export.metrics_interval)
+    try:
+        importer.main()
+    finally:
+        # Unblock fetchers whose records were not consumed (e.g. a stage failed)
+        streams.close()
+        for thread in threads:
+            thread.join()
+        export.metrics.stop()
+        export.client.close()
+        importer.client.close()
+    logging.info(f"Migration completed in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    streams = RecordStreams(queue_size)
+    configure(streams)
+    run(streams)
+
+
+if __name__ == '__main__':
+    main()
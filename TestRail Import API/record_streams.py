@@ -0,0 +1,87 @@
+import os
+import queue
+import threading
+
+# Default number of records buffered per stream
+DEFAULT_QUEUE_SIZE = 1000
+
+# Seconds a blocked producer waits before checking whether the streams were closed
+PUT_TIMEOUT = 0.5
+
+_END = object()
+
+
+def stream_name(filename):
+    return os.path.splitext(filename)[0]
+
+
+# Bounded in-memory queues connecting the export's save functions to the
+# import's readers, one per export file (by name without extension), so records
+# are imported while later pages are still being fetched. A full queue blocks
+# its producer until the consumer catches up (backpressure), so at most
+# queue_size records per stream are held in memory. Each stream is read once.
+class RecordStreams:
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.queues = {}
+        self.ended = set()
+        self.closed = threading.Event()
+        self.lock = threading.Lock()
+
+    # Declare a stream; records saved to files without a stream are dropped
+    def open(self, filename):
+        with self.lock:
+            self.queues.setdefault(stream_name(filename), queue.Queue(self.queue_size))
+
+    def has(self, filename):
+        return stream_name(filename) in self.queues
+
+    def _put(self, name, item):
+        while not self.closed.is_set():
+            try:
+                self.queues[name].put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Put every record into the stream, blocking while it is full, then end it.
+    # Returns the number of records put.
+    def put_all(self, filename, records):
+        name = stream_name(filename)
+        if name not in self.queues:
+            return 0
+        count = 0
+        for record in records:
+            if not self._put(name, record):
+                break
+            count += 1
+        self.end(filename)
+        return count
+
+    # Mark the end of a stream (more than once is harmless), e.g. when its producer failed
+    def end(self, filename):
+        name = stream_name(filename)
+        with self.lock:
+            if name not in self.queues or name in self.ended:
+                return
+            self.ended.add(name)
+        self._put(name, _END)
+
+    # Yield the records of a stream as they arrive, until it ends. The end
+    # marker is put back, so later readers of an ended stream get no records
+    # instead of waiting forever.
+    def iter_records(self, filename):
+        q = self.queues.get(stream_name(filename))
+        if q is None:
+            return
+        while True:
+            record = q.get()
+            if record is _END:
+                q.put(_END)
+                return
+            yield record
+
+    # Release producers blocked on streams nobody reads any more
+    def close(self):
+        self.closed.set()
@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Default seconds between snapshots written while a run is in progress
+DEFAULT_INTERVAL = 60
+
+
+# Endpoint with IDs and query parameters removed, so all requests to the same
+# API method share one series: 'get_results_for_run/42&offset=250' -> 'get_results_for_run/{id}'
+def endpoint_template(endpoint):
+    path = endpoint.split('&', 1)[0]
+    return '/'.join('{id}' if part.isdigit() else part for part in path.split('/'))
+
+
+# Size in bytes of a prepared request body (bytes, str or a streaming encoder)
+def body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    return getattr(body, 'len', 0) or 0
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels.items())
+
+
+# Counters of one (method, endpoint template) series
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0  # Attempts sent, including retries
+        self.retries = 0
+        self.errors = 0  # Attempts that got no response (connection errors, timeouts)
+        self.statuses = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Non-cumulative; the last one is +Inf
+
+    def observe(self, status, seconds, bytes_sent, bytes_received, retry):
+        self.requests += 1
+        self.retries += retry
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.latency_sum += seconds
+        self.latency_max = max(self.latency_max, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def cumulative_buckets(self):
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), self.buckets):
+            total += count
+            yield ('+Inf' if bound == float('inf') else f'{bound:g}'), total
+
+    # Latency below which the given fraction of requests fall, interpolated
+    # linearly within the bucket it lands in (as Prometheus' histogram_quantile)
+    def quantile(self, fraction):
+        rank = fraction * self.requests
+        lower = 0.0
+        below = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            if count and below + count >= rank:
+                return min(lower + (bound - lower) * (rank - below) / count, self.latency_max)
+            lower = bound
+            below += count
+        return self.latency_max
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'errors': self.errors,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'latency': {
+                'total_seconds': round(self.latency_sum, 6),
+                'mean_seconds': round(self.latency_sum / self.requests, 6) if self.requests else 0.0,
+                'p50_seconds': round(self.quantile(0.5), 6),
+                'p95_seconds': round(self.quantile(0.95), 6),
+                'max_seconds': round(self.latency_max, 6),
+                'buckets': dict(self.cumulative_buckets()),
+            },
+        }
+
+
+# Per-endpoint request metrics of a TestRailClient: attempt counts, status
+# codes, retries, bytes in each direction and a latency histogram, keyed by
+# HTTP method and endpoint template. Written as a JSON summary and as a
+# Prometheus textfile (for node_exporter's textfile collector), at the end of
+# a run and, once start() is called, every interval seconds during it.
+class RequestMetrics:
+    def __init__(self, labels=None):
+        self.labels = labels or {}
+        self.series = {}  # (method, template) -> EndpointStats
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.json_path = None
+        self.prometheus_path = None
+        self.stop_event = threading.Event()
+        self.writer = None
+
+    # Record one attempt; status is None when no response was received
+    def observe(self, method, endpoint, status, seconds, bytes_sent=0, bytes_received=0, retry=False):
+        key = (method, endpoint_template(endpoint))
+        with self.lock:
+            stats = self.series.get(key)
+            if stats is None:
+                stats = self.series[key] = EndpointStats()
+            stats.observe(status, seconds, bytes_sent, bytes_received, retry)
+
+    def summary(self):
+        with self.lock:
+            endpoints = [
+                dict({'method': method, 'endpoint': template}, **stats.to_dict())
+                for (method, template), stats in self.series.items()
+            ]
+        # Endpoints that took the most time first
+        endpoints.sort(key=lambda e: e['latency']['total_seconds'], reverse=True)
+        totals = {
+            field: sum(e[field] for e in endpoints)
+            for field in ('requests', 'retries', 'errors', 'bytes_sent', 'bytes_received')
+        }
+        totals['latency_seconds'] = round(sum(e['latency']['total_seconds'] for e in endpoints), 6)
+        now = time.time()
+        return {
+            'labels': self.labels,
+            'started_at': self.started,
+            'updated_at': now,
+            'elapsed_seconds': round(now - self.started, 3),
+            'totals': totals,
+            'endpoints': endpoints,
+        }
+
+    def prometheus(self):
+        with self.lock:
+            series = sorted((key, stats) for key, stats in self.series.items())
+            lines = []
+
+            def metric(name, kind, help_text, samples):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for suffix, labels, value in samples:
+                    lines.append(f'{name}{suffix}{{{_labels(labels)}}} {value}')
+
+            def labels_of(method, template, **extra):
+                return dict(self.labels, method=method, endpoint=template, **extra)
+
+            metric('testrail_requests_total', 'counter', 'TestRail API requests sent, including retries, by status code.', [
+                ('', labels_of(method, template, status=status), count)
+                for (method, template), stats in series
+                for status, count in sorted(stats.statuses.items())
+            ] + [
+                ('', labels_of(method, template, status='error'), stats.errors)
+                for (method, template), stats in series if stats.errors
+            ])
+            metric('testrail_retries_total', 'counter', 'TestRail API requests that were retries of a throttled or failed request.', [
+                ('', labels_of(method, template), stats.retries) for (method, template), stats in series
+            ])
+            metric('testrail_request_bytes_total', 'counter', 'Bytes of request bodies sent to TestRail.', [
+                ('', labels_of(method, template), stats.bytes_sent) for (method, template), stats in series
+            ])
+            metric('testrail_response_bytes_total', 'counter', 'Bytes of response bodies received from TestRail.', [
+                ('', labels_of(method, template), stats.bytes_received) for (method, template), stats in series
+            ])
+            histogram = []
+            for (method, template), stats in series:
+                for bound, total in stats.cumulative_buckets():
+                    histogram.append(('_bucket', labels_of(method, template, le=bound), total))
+                histogram.append(('_sum', labels_of(method, template), f'{stats.latency_sum:.6f}'))
+                histogram.append(('_count', labels_of(method, template), stats.requests))
+            metric('testrail_request_duration_seconds', 'histogram', 'Latency of TestRail API requests.', histogram)
+        return '\n'.join(lines) + '\n'
+
+    # Write the JSON summary and the Prometheus textfile, each replaced atomically
+    def write(self, json_path=None, prometheus_path=None):
+        for path, content in ((json_path or self.json_path, lambda: json.dumps(self.summary(), indent=4)),
+                              (prometheus_path or self.prometheus_path, self.prometheus)):
+            if not path:
+                continue
+            tmp_path = f'{path}.tmp'
+            try:
+                with open(tmp_path, 'w') as f:
+                    f.write(content())
+                os.replace(tmp_path, path)
+            except IOError as e:
+                logging.error(f"IOError while writing metrics to {path}: {e}")
+
+    # Write snapshots every interval seconds until stop() (interval 0: only at stop())
+    def start(self, json_path, prometheus_path, interval=DEFAULT_INTERVAL):
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        if interval:
+            def write_periodically():
+                while not self.stop_event.wait(interval):
+                    self.write()
+            self.writer = threading.Thread(target=write_periodically, daemon=True)
+            self.writer.start()
+
+    # Stop the periodic writer, write the final snapshot and log the busiest endpoints
+    def stop(self, top=5):
+        self.stop_event.set()
+        if self.writer is not None:
+            self.writer.join()
+            self.writer = None
+        self.write()
+        summary = self.summary()
+        totals = summary['totals']
+        logging.info(f"{totals['requests']} requests ({totals['retries']} retries) in {summary['elapsed_seconds']:.1f}s; "
+                     f"metrics written to {self.json_path} and {self.prometheus_path}")
+        for e in summary['endpoints'][:top]:
+            logging.info(f"  {e['method']} {e['endpoint']}: {e['requests']} requests, {e['retries']} retries, "
+                         f"{e['latency']['total_seconds']:.1f}s total, p95 {e['latency']['p95_seconds']:.3f}s")
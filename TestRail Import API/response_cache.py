@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Time to live in seconds of each cacheable endpoint, keyed by endpoint name
+# (the part of the endpoint before the first '/' or '&'). Only these slowly
+# changing lookup endpoints are cached; everything else always hits TestRail.
+DEFAULT_TTLS = {
+    'get_statuses': 24 * 3600,
+    'get_case_statuses': 24 * 3600,
+    'get_case_types': 24 * 3600,
+    'get_case_fields': 24 * 3600,
+    'get_priorities': 24 * 3600,
+    'get_templates': 24 * 3600,
+    'get_roles': 24 * 3600,
+    'get_users': 3600,
+}
+
+# Cached lookup endpoint made stale by each write endpoint
+INVALIDATED_BY = {
+    'add_status': 'get_statuses',
+    'add_case_status': 'get_case_statuses',
+    'add_case_type': 'get_case_types',
+    'add_case_field': 'get_case_fields',
+    'add_priority': 'get_priorities',
+    'add_template': 'get_templates',
+    'add_role': 'get_roles',
+    'add_user': 'get_users',
+    'update_user': 'get_users',
+    'add_user_to_project': 'get_users',
+}
+
+# Default size bounds of the in-memory and on-disk tiers, in bytes of JSON
+DEFAULT_MEMORY_BYTES = 32 * 1024 * 1024
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024
+
+
+def endpoint_name(endpoint):
+    return endpoint.split('/', 1)[0].split('&', 1)[0]
+
+
+# Two-tier TTL cache of decoded API responses: a size-bounded LRU in memory in
+# front of a size-bounded directory of JSON files, so lookups survive across
+# runs. Entries are keyed by namespace (the TestRail URL) and endpoint. Cached
+# responses are shared between callers and must be treated as read-only.
+class ResponseCache:
+    def __init__(self, cache_dir, namespace='', ttls=None, max_memory_bytes=DEFAULT_MEMORY_BYTES,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.namespace = namespace
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()  # key -> (expires, data, size, endpoint)
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+
+    def ttl(self, endpoint):
+        return self.ttls.get(endpoint_name(endpoint))
+
+    def _key(self, endpoint):
+        return hashlib.sha256(f'{self.namespace}\n{endpoint}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    # (True, data) for a fresh cached response, (False, None) otherwise
+    def get(self, endpoint):
+        if self.ttl(endpoint) is None:
+            return False, None
+        key = self._key(endpoint)
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.memory.move_to_end(key)
+                    return True, entry[1]
+                self._drop_memory(key)
+            entry = self._read_disk(key, now)
+            if entry is not None:
+                self._put_memory(key, endpoint, *entry)
+                return True, entry[1]
+        return False, None
+
+    def put(self, endpoint, data, size):
+        ttl = self.ttl(endpoint)
+        if ttl is None:
+            return
+        key = self._key(endpoint)
+        expires = time.time() + ttl
+        with self.lock:
+            self._put_memory(key, endpoint, expires, data, size)
+            self._write_disk(key, endpoint, expires, data)
+
+    # Drop cached responses of endpoints starting with prefix (all if None)
+    def invalidate(self, prefix=None):
+        with self.lock:
+            for key, entry in list(self.memory.items()):
+                if prefix is None or entry[3].startswith(prefix):
+                    self._drop_memory(key)
+            if not os.path.isdir(self.cache_dir):
+                return
+            for filename in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, filename)
+                try:
+                    if prefix is not None:
+                        with open(path, 'r') as f:
+                            entry = json.load(f)
+                        if entry.get('namespace') != self.namespace or not entry.get('endpoint', '').startswith(prefix):
+                            continue
+                    os.remove(path)
+                except (IOError, ValueError):
+                    continue
+
+    # Drop the cached lookups a write to endpoint may have changed
+    def invalidate_for_write(self, endpoint):
+        stale = INVALIDATED_BY.get(endpoint_name(endpoint))
+        if stale is not None:
+            self.invalidate(stale)
+
+    def _put_memory(self, key, endpoint, expires, data, size):
+        self._drop_memory(key)
+        if size > self.max_memory_bytes:
+            return
+        self.memory[key] = (expires, data, size, endpoint)
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_memory_bytes:
+            self._drop_memory(next(iter(self.memory)))
+
+    def _drop_memory(self, key):
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= entry[2]
+
+    def _read_disk(self, key, now):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        # Another process sharing the directory may remove the file meanwhile
+        try:
+            if entry.get('expires', 0) <= now:
+                os.remove(path)
+                return None
+            os.utime(path)  # Mark as recently used for LRU eviction on disk
+            return entry['expires'], entry['data'], os.path.getsize(path)
+        except OSError:
+            return None
+
+    def _write_disk(self, key, endpoint, expires, data):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{self._path(key)}.{os.getpid()}.tmp'  # One per process sharing the directory
+            with open(tmp_path, 'w') as f:
+                json.dump({'namespace': self.namespace, 'endpoint': endpoint, 'expires': expires, 'data': data}, f)
+            os.replace(tmp_path, self._path(key))
+            self._evict_disk()
+        except IOError:
+            pass
+
+    # Remove the least recently used files until the directory fits max_disk_bytes
+    def _evict_disk(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            if filename.endswith('.json'):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+import json_codec
+
+# Rows read per fetch while regrouping
+FETCH_SIZE = 500
+
+
+# Temporary on-disk table of the tests and results of the exported runs, so the
+# results_run_{id} files can be grouped by test without holding a run's tests
+# or results in memory: pages are appended as they are downloaded and read back
+# one test at a time, in the order of the run's tests. The database file is
+# removed by close().
+class ResultSpool:
+    def __init__(self, directory=None):
+        fd, self.path = tempfile.mkstemp(prefix='.result_spool_', suffix='.sqlite', dir=directory)
+        os.close(fd)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=OFF')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute('CREATE TABLE tests (seq INTEGER PRIMARY KEY, run_id INTEGER, test_id INTEGER)')
+        self.conn.execute('CREATE TABLE results (seq INTEGER PRIMARY KEY, run_id INTEGER, test_id INTEGER, data TEXT)')
+        self.conn.execute('CREATE TABLE runs (run_id INTEGER PRIMARY KEY)')  # Runs whose results are complete
+        self.conn.execute('CREATE INDEX tests_run ON tests (run_id, seq)')
+        self.conn.execute('CREATE INDEX results_test ON results (run_id, test_id, seq)')
+
+    # Append one page of a run's tests, in run order
+    def add_tests(self, run_id, tests):
+        with self.lock:
+            self.conn.executemany('INSERT INTO tests (run_id, test_id) VALUES (?, ?)', [
+                (run_id, test['id']) for test in tests if isinstance(test, dict) and 'id' in test
+            ])
+            self.conn.commit()
+
+    # Append one page of a run's results
+    def add_results(self, run_id, results):
+        with self.lock:
+            self.conn.executemany('INSERT INTO results (run_id, test_id, data) VALUES (?, ?, ?)', [
+                (run_id, result.get('test_id'), json_codec.dumps(result)) for result in results if isinstance(result, dict)
+            ])
+            self.conn.commit()
+
+    # Remove the results spooled for a run so far
+    def discard_results(self, run_id):
+        with self.lock:
+            self.conn.execute('DELETE FROM results WHERE run_id = ?', (run_id,))
+            self.conn.commit()
+
+    # Mark the results of a run as complete
+    def finish_results(self, run_id):
+        with self.lock:
+            self.conn.execute('INSERT OR IGNORE INTO runs (run_id) VALUES (?)', (run_id,))
+            self.conn.commit()
+
+    def has_results(self, run_id):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM runs WHERE run_id = ?', (run_id,)).fetchone() is not None
+
+    # IDs of all spooled tests, in the order they were added
+    def test_ids(self):
+        with self.lock:
+            return [test_id for test_id, in self.conn.execute('SELECT test_id FROM tests ORDER BY seq')]
+
+    # Lazily yield {'test_id': id, 'results': [...]} for every test of a run that
+    # has results, in the order of the run's tests
+    def iter_results_by_test(self, run_id):
+        with self.lock:
+            cursor = self.conn.execute(
+                'SELECT t.test_id, r.data FROM tests t JOIN results r ON r.run_id = t.run_id AND r.test_id = t.test_id'
+                ' WHERE t.run_id = ? ORDER BY t.seq, r.seq', (run_id,))
+        current = None
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for test_id, data in rows:
+                if current is None or current['test_id'] != test_id:
+                    if current is not None:
+                        yield current
+                    current = {'test_id': test_id, 'results': []}
+                current['results'].append(json_codec.loads(data))
+        if current is not None:
+            yield current
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,205 @@
+import logging
+import math
+import threading
+import time
+
+from stage_scheduler import critical_path
+from testrail_client import PAGE_LIMIT
+
+# Plans, runs, tests or cases sampled to extrapolate per-entity request counts
+SAMPLE_SIZE = 10
+
+# Default seconds between progress log lines
+DEFAULT_INTERVAL = 30
+
+
+# Requests needed to page through count items (an empty listing still takes one)
+def pages(count):
+    return max(1, math.ceil(count / PAGE_LIMIT))
+
+
+def mean(values, default=0.0):
+    values = list(values)
+    return sum(values) / len(values) if values else default
+
+
+# Whether a bulk endpoint has an item at offset, from a one-item page
+def has_item(fetch, endpoint, key, offset):
+    page = fetch(f'{endpoint}&limit=1&offset={offset}')
+    if isinstance(page, list):
+        return offset < len(page)
+    return bool(page and page.get(key))
+
+
+# Number of items of a bulk endpoint and the items of its first page, without
+# paging through it: a listing that does not fit in one page is measured with
+# limit=1 probes, doubling the offset until it is past the end and then
+# bisecting, so counting n items takes about 2 * log2(n / PAGE_LIMIT) requests.
+# A failed first page counts as empty.
+def count_items(fetch, endpoint, key):
+    page = fetch(f'{endpoint}&limit={PAGE_LIMIT}')
+    if page is None:
+        return 0, []
+    if isinstance(page, list):
+        return len(page), page
+    items = page.get(key) or []
+    links = page.get('_links')
+    more = links.get('next') if links is not None else len(items) >= PAGE_LIMIT
+    if not more or not items:
+        return len(items), items
+    present, missing = len(items) - 1, 2 * len(items)
+    while has_item(fetch, endpoint, key, missing):
+        present, missing = missing, 2 * missing
+    while missing - present > 1:
+        middle = (present + missing) // 2
+        if has_item(fetch, endpoint, key, middle):
+            present = middle
+        else:
+            missing = middle
+    return missing, items
+
+
+# At most SAMPLE_SIZE items spread evenly over items
+def spread(items):
+    items = list(items)
+    return items[::max(1, len(items) // SAMPLE_SIZE)][:SAMPLE_SIZE]
+
+
+# Item counts of a sample of the endpoints
+def sample_counts(fetch, endpoints, key):
+    return [count_items(fetch, endpoint, key)[0] for endpoint in spread(endpoints)]
+
+
+# Mean latency of the requests recorded in metrics so far, first sending one
+# request to endpoint if nothing has been sent yet
+def measured_latency(metrics, fetch, endpoint):
+    totals = metrics.summary()['totals']
+    if not totals['requests']:
+        fetch(endpoint)
+        totals = metrics.summary()['totals']
+    return totals['latency_seconds'] / totals['requests'] if totals['requests'] else 0.0
+
+
+# Seconds a RateLimiter starting at rate takes to let requests through when
+# nothing is throttled: every success adds increase / rate to the rate, so after
+# n requests it is sqrt(rate^2 + 2 * increase * n), until it reaches max_rate
+def rate_limited_seconds(requests, rate, max_rate, increase=1.0):
+    if requests <= 0:
+        return 0.0
+    ramp = max(0.0, (max_rate ** 2 - rate ** 2) / (2 * increase))  # Requests until max_rate is reached
+    if requests <= ramp:
+        return (math.sqrt(rate ** 2 + 2 * increase * requests) - rate) / increase
+    return (max_rate - rate) / increase + (requests - ramp) / max_rate
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+# Expected requests of one stage and how many of them are in flight at once
+class StagePlan:
+    def __init__(self, name, requests, concurrency=1, detail=''):
+        self.name = name
+        self.requests = int(round(requests))
+        self.concurrency = max(1, concurrency)
+        self.detail = detail
+
+
+# Request counts and wall time of a run, estimated stage by stage. A stage takes
+# as long as the slower of its latency (requests * latency / concurrency) and
+# the rate limiter, which every stage shares and which keeps ramping up from
+# where the previous stage left it. Stages run one after another unless graph
+# (import_stages-style dependencies) is given, in which case stages without a
+# path between them overlap and the critical path bounds the total.
+class RunPlan:
+    def __init__(self, stages, latency, limiter, graph=None):
+        self.stages = stages
+        self.latency = latency
+        self.rate = limiter.rate
+        self.max_rate = limiter.max_rate
+        self.increase = limiter.increase
+        self.seconds = []
+        sent = 0
+        for stage in stages:
+            by_rate = self.rate_seconds(sent + stage.requests) - self.rate_seconds(sent)
+            self.seconds.append(max(by_rate, stage.requests * latency / stage.concurrency))
+            sent += stage.requests
+        self.requests = sent
+        if graph is None:
+            self.total_seconds = sum(self.seconds)
+        else:
+            durations = {stage.name: seconds for stage, seconds in zip(stages, self.seconds) if stage.name in graph}
+            outside = sum(seconds for stage, seconds in zip(stages, self.seconds) if stage.name not in graph)
+            _, path_seconds = critical_path({name: graph[name] for name in durations}, durations)
+            self.total_seconds = max(outside + path_seconds, self.rate_seconds(sent))
+
+    def rate_seconds(self, requests):
+        return rate_limited_seconds(requests, self.rate, self.max_rate, self.increase)
+
+    # Seconds of the run the model expects to have passed after done requests,
+    # and the stage it expects to be in
+    def expected(self, done):
+        scale = self.total_seconds / sum(self.seconds) if sum(self.seconds) else 0.0
+        elapsed = 0.0
+        for stage, seconds in zip(self.stages, self.seconds):
+            if done < stage.requests:
+                return (elapsed + seconds * done / stage.requests) * scale, stage.name
+            done -= stage.requests
+            elapsed += seconds
+        return self.total_seconds, None
+
+    def log(self, title='Plan'):
+        width = max([len(stage.name) for stage in self.stages] + [5])
+        logging.info(f"{title}: {'stage'.ljust(width)}  requests  parallel  est. time")
+        for stage, seconds in zip(self.stages, self.seconds):
+            detail = f"  ({stage.detail})" if stage.detail else ''
+            logging.info(f"{title}: {stage.name.ljust(width)}  {stage.requests:8d}  {stage.concurrency:8d}  "
+                         f"{format_duration(seconds):>9}{detail}")
+        logging.info(f"{title}: {self.requests} requests in about {format_duration(self.total_seconds)} "
+                     f"({self.latency:.3f}s per request, {self.rate:.1f} -> {self.max_rate:g} requests/s)")
+
+
+# Logs every interval seconds how many of the planned requests were sent, the
+# stage the plan expects the run to be in and the time left. The time left is
+# the plan's remaining time scaled by how fast the run has kept to the plan so
+# far, so a run that is slower or faster than estimated corrects its ETA.
+class ProgressReporter:
+    def __init__(self, plan, metrics, interval=DEFAULT_INTERVAL):
+        self.plan = plan
+        self.metrics = metrics
+        self.interval = interval
+        self.baseline = self.sent()  # Requests of the planning itself
+        self.started = time.perf_counter()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # Requests sent so far, not counting retries
+    def sent(self):
+        totals = self.metrics.summary()['totals']
+        return totals['requests'] - totals['retries']
+
+    def report(self):
+        done = self.sent() - self.baseline
+        elapsed = time.perf_counter() - self.started
+        expected, stage = self.plan.expected(done)
+        remaining = self.plan.total_seconds - expected
+        if expected > 0:
+            remaining *= elapsed / expected
+        percent = 100 * done / self.plan.requests if self.plan.requests else 100
+        where = f", plan stage {stage}" if stage else ''
+        logging.info(f"Progress: {done}/{self.plan.requests} requests ({percent:.0f}%{where}), "
+                     f"{format_duration(elapsed)} elapsed, about {format_duration(max(remaining, 0.0))} left")
+
+    def start(self):
+        def report_periodically():
+            while not self.stop_event.wait(self.interval):
+                self.report()
+        self.thread = threading.Thread(target=report_periodically, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,92 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+# Stages in dependency order (Kahn's algorithm); raises ValueError on a cycle.
+# stages maps a stage name to (function, [names of the stages it depends on]);
+# dependencies on stages that are not in the graph (e.g. disabled) are ignored.
+def topological_order(stages):
+    remaining = {name: {dep for dep in deps if dep in stages} for name, (_, deps) in stages.items()}
+    order = []
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages: {', '.join(sorted(remaining))}")
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return order
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+# Run the stages on a thread pool, starting each one as soon as all of its
+# dependencies have finished, so independent stages overlap. Ready stages are
+# started in declaration order. If a stage raises, no further stages are
+# started, the running ones are allowed to finish and the first error is
+# re-raised. Returns the duration of every stage in seconds.
+def run_stages(stages, max_workers=4):
+    topological_order(stages)
+    pending = dict(stages)
+    running = {}
+    durations = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            if error is None:
+                for name, (func, deps) in list(pending.items()):
+                    if all(dep in durations or dep not in stages for dep in deps):
+                        del pending[name]
+                        logging.info(f"Starting stage {name}")
+                        running[executor.submit(_timed, func)] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    durations[name] = future.result()
+                    logging.info(f"Finished stage {name} in {durations[name]:.1f}s")
+                except Exception as e:
+                    logging.error(f"Stage {name} failed: {e}")
+                    error = error or e
+    if error is not None:
+        raise error
+    return durations
+
+
+# The chain of dependent stages with the largest total duration, which bounds
+# the wall time no matter how many workers are used. Returns (names, seconds).
+def critical_path(stages, durations):
+    finish = {}
+    previous = {}
+    for name in topological_order(stages):
+        if name not in durations:
+            continue
+        deps = [dep for dep in stages[name][1] if dep in finish]
+        before = max(deps, key=finish.get, default=None)
+        previous[name] = before
+        finish[name] = durations[name] + (finish[before] if before else 0.0)
+    if not finish:
+        return [], 0.0
+    name = max(finish, key=finish.get)
+    total = finish[name]
+    path = []
+    while name:
+        path.append(name)
+        name = previous[name]
+    return list(reversed(path)), total
+
+
+def log_critical_path(stages, durations, wall_time):
+    path, total = critical_path(stages, durations)
+    if path:
+        chain = ' -> '.join(f"{name} ({durations[name]:.1f}s)" for name in path)
+        logging.info(f"Critical path: {chain} = {total:.1f}s of {wall_time:.1f}s wall time")
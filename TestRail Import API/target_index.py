@@ -0,0 +1,134 @@
+import hashlib
+import threading
+
+import json_codec
+from testrail_client import paginate
+
+# Field naming an entity: together with its scope (the target IDs of its
+# parents) it identifies the same entity in the source and the target
+NAME_FIELDS = {'milestones': 'name', 'suites': 'name', 'sections': 'name', 'cases': 'title'}
+
+# Fields whose content is compared once an entity is matched; non-empty
+# custom_* fields of cases are compared as well
+CONTENT_FIELDS = {
+    'milestones': ('name', 'description', 'due_on', 'start_on', 'refs'),
+    'suites': ('name', 'description'),
+    'sections': ('name', 'description'),
+    'cases': ('title', 'template_id', 'type_id', 'priority_id', 'estimate', 'refs'),
+}
+
+# Listing endpoint and response key of each indexed entity type
+LISTINGS = {'milestones': 'get_milestones', 'suites': 'get_suites', 'sections': 'get_sections', 'cases': 'get_cases'}
+
+
+# Text with line endings, trailing spaces and surrounding blank space normalized,
+# so an entity that only differs in formatting still matches; '' counts as missing
+def normalize(value):
+    if isinstance(value, str):
+        value = '\n'.join(line.rstrip() for line in value.replace('\r\n', '\n').split('\n')).strip()
+        return value or None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def name_key(record, entity):
+    name = normalize(record.get(NAME_FIELDS[entity]))
+    return ' '.join(name.split()).casefold() if isinstance(name, str) else name
+
+
+# Hash of the normalized content of an entity (an exported record or the payload
+# posted for it), as a raw 20-byte digest to keep large indexes small
+def fingerprint(entity, record):
+    content = [normalize(record.get(field)) for field in CONTENT_FIELDS[entity]]
+    if entity == 'cases':
+        content.append(sorted((field, normalize(value)) for field, value in record.items()
+                              if field.startswith('custom_') and normalize(value) is not None))
+    return hashlib.sha1(json_codec.dumps_bytes(content, sort_keys=True, default=str)).digest()
+
+
+# In-memory index of the milestones, suites, sections and cases that already exist in
+# the target project, keyed by (scope, normalized name) and holding the content
+# fingerprint of each, so the import can reuse an entity instead of creating a
+# duplicate and only needs to update the ones whose content differs. Each
+# target entity is claimed at most once, so repeated names map one to one.
+class TargetIndex:
+    def __init__(self, default_suite_id=None):
+        self.default_suite_id = default_suite_id  # Suite of sections posted without suite_id (single-suite targets)
+        self.entries = {}  # entity -> {(scope, name): [(target_id, fingerprint), ...]}
+        self.lock = threading.Lock()
+
+    # Scope of a target record: the parents its name is unique within
+    @staticmethod
+    def scope_of(entity, record):
+        if entity == 'sections':
+            return (record.get('suite_id'), record.get('parent_id') or None)
+        if entity == 'cases':
+            return (record.get('section_id'),)
+        return ()
+
+    def add(self, entity, record):
+        key = (self.scope_of(entity, record), name_key(record, entity))
+        with self.lock:
+            self.entries.setdefault(entity, {}).setdefault(key, []).append((record['id'], fingerprint(entity, record)))
+
+    # Forget target entities that are already mapped to a source entity (e.g. by the journal)
+    def exclude(self, entity, target_ids):
+        target_ids = set(target_ids)
+        with self.lock:
+            for candidates in self.entries.get(entity, {}).values():
+                candidates[:] = [c for c in candidates if c[0] not in target_ids]
+
+    # Claim the target entity matching record within scope (the target IDs of
+    # its parents, as scope_of returns them). Prefers an entity with the same
+    # content. Returns (target_id, changed), or None when nothing matches.
+    def claim(self, entity, scope, record):
+        if entity == 'sections' and scope[0] is None:
+            scope = (self.default_suite_id,) + scope[1:]
+        key = (scope, name_key(record, entity))
+        with self.lock:
+            candidates = self.entries.get(entity, {}).get(key)
+            if not candidates:
+                return None
+            expected = fingerprint(entity, record)
+            for i, (target_id, existing) in enumerate(candidates):
+                if existing == expected:
+                    del candidates[i]
+                    return target_id, False
+            target_id, _ = candidates.pop(0)
+            return target_id, True
+
+    def size(self, entity):
+        with self.lock:
+            return sum(len(candidates) for candidates in self.entries.get(entity, {}).values())
+
+
+# Listing endpoints of an entity type in a project: one per suite of a
+# multi-suite project for sections and cases
+def listing_endpoints(project_id, entity, suite_ids):
+    method = LISTINGS[entity]
+    if entity in ('milestones', 'suites') or not suite_ids:
+        return [f'{method}/{project_id}']
+    return [f'{method}/{project_id}&suite_id={suite_id}' for suite_id in suite_ids]
+
+
+# Page once through the given entity types of a project (every suite of a
+# multi-suite project) and index them. fetch is a get_data-like function;
+# raises testrail_client.PaginationError if a page cannot be fetched, since an
+# incomplete index would let duplicates through.
+def build_target_index(fetch, project_id, entities):
+    suites = fetch(f'get_suites/{project_id}')
+    suite_ids = [suite['id'] for suite in suites if 'id' in suite] if isinstance(suites, list) else []
+    index = TargetIndex(default_suite_id=suite_ids[0] if len(suite_ids) == 1 else None)
+    for entity in entities:
+        for endpoint in listing_endpoints(project_id, entity, suite_ids):
+            for record in paginate(fetch, endpoint, entity, strict=True):
+                if not isinstance(record, dict) or 'id' not in record:
+                    continue
+                index.add(entity, record)
+                # Sub-milestones are listed inside their parent
+                if entity == 'milestones':
+                    for child in record.get('milestones') or []:
+                        if isinstance(child, dict) and 'id' in child:
+                            index.add(entity, child)
+    return index
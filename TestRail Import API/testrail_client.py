@@ -0,0 +1,294 @@
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from contextlib import ExitStack
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import json_codec
+from request_metrics import body_size
+
+try:
+    from requests_toolbelt import MultipartEncoder  # Optional: streams multipart uploads from disk
+except ImportError:
+    MultipartEncoder = None
+
+# Default number of pooled keep-alive connections per host
+DEFAULT_POOL_SIZE = 10
+
+# Default timeout (connect, read) in seconds for every request
+DEFAULT_TIMEOUT = (10, 120)
+
+# Default starting and maximum request rates (requests per second)
+DEFAULT_RATE = 5.0
+DEFAULT_MAX_RATE = 100.0
+
+# Default number of retries for throttled or failed requests
+DEFAULT_MAX_RETRIES = 8
+
+# Exponential backoff base and cap in seconds (full jitter is applied on top)
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 60.0
+
+# Status codes worth retrying. POSTs are only retried on 429, where TestRail
+# guarantees the request was rejected without being processed.
+RETRY_STATUSES_GET = {429, 500, 502, 503, 504}
+RETRY_STATUSES_POST = {429}
+
+# Page size for bulk endpoints (the maximum TestRail accepts)
+PAGE_LIMIT = 250
+
+
+# Token bucket shared by every request of a client (and by all of its threads).
+# The rate adapts AIMD-style: each successful request nudges it up towards
+# max_rate, each 429 halves it and pauses all callers for the Retry-After
+# period, so throughput settles just below what the server accepts.
+class RateLimiter:
+    def __init__(self, rate=DEFAULT_RATE, max_rate=DEFAULT_MAX_RATE, min_rate=0.2, burst=None, increase=1.0):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst or max(1.0, rate)
+        self.increase = increase  # Additive increase in requests/second per second of success
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        start = max(self.last, self.blocked_until)
+        if now > start:
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self.last = max(now, self.last)
+
+    # Block until the caller may send one request
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserve a token; a negative balance is the queue of callers ahead of us
+            self.tokens -= 1
+            wait = max(self.blocked_until - now, 0.0)
+            if self.tokens < 0:
+                wait += -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            self.burst = max(1.0, self.rate)
+
+    def throttled(self, retry_after=None):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.burst = max(1.0, self.rate)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+def _shared_field(index):
+    return property(lambda self: self.state[index], lambda self, value: self.state.__setitem__(index, value))
+
+
+# RateLimiter whose budget is shared by every process it is handed to (for
+# example through a multiprocessing pool initializer), so clients in several
+# processes together stay within one rate and all pause on a 429. The bucket
+# lives in shared memory behind a process-shared lock.
+class SharedRateLimiter(RateLimiter):
+    rate = _shared_field(0)
+    burst = _shared_field(1)
+    tokens = _shared_field(2)
+    last = _shared_field(3)
+    blocked_until = _shared_field(4)
+
+    def __init__(self, *args, **kwargs):
+        self.state = multiprocessing.RawArray('d', 5)
+        super().__init__(*args, **kwargs)
+        self.lock = multiprocessing.Lock()
+
+
+# Raised by paginate(strict=True) when a page cannot be fetched
+class PaginationError(Exception):
+    pass
+
+
+# Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+# Exponential backoff with full jitter for the given (zero-based) attempt
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+# Lazily yield the pages of a bulk endpoint (get_cases, get_runs, get_tests, ...)
+# as lists of items, fetching the next page only when it is needed. fetch is a
+# get_data-style function returning the decoded response or None on error; key
+# is the list field of the page ('cases', 'runs', ...). Pages are followed
+# through _links.next, falling back to offset/limit for servers that omit the
+# links, and plain list responses from older TestRail versions are yielded as a
+# single page. Empty pages are skipped. A failed page ends the iteration, or
+# raises PaginationError when strict is set so callers can tell it from the last page.
+def paginate_pages(fetch, endpoint, key, limit=PAGE_LIMIT, strict=False):
+    offset = 0
+    next_endpoint = f'{endpoint}&limit={limit}'
+    while next_endpoint:
+        page = fetch(next_endpoint)
+        if page is None:
+            if strict:
+                raise PaginationError(f"Failed to fetch page {next_endpoint}")
+            return
+        if isinstance(page, list):
+            if page:
+                yield page
+            return
+        items = page.get(key) or []
+        if items:
+            yield items
+
+        links = page.get('_links')
+        if links is not None:
+            next_link = links.get('next')
+            next_endpoint = next_link.split('/api/v2/', 1)[-1] if next_link else None
+        elif len(items) >= limit:
+            offset += limit
+            next_endpoint = f'{endpoint}&limit={limit}&offset={offset}'
+        else:
+            next_endpoint = None
+
+
+# Lazily yield every item of a bulk endpoint, one page at a time (see paginate_pages)
+def paginate(fetch, endpoint, key, limit=PAGE_LIMIT, strict=False):
+    for page in paginate_pages(fetch, endpoint, key, limit, strict):
+        yield from page
+
+
+# Shared TestRail API client used by both the export and the import scripts.
+# All requests go through a single requests.Session so TCP/TLS connections are
+# kept alive and reused instead of being re-established for every call.
+# Every attempt is recorded in metrics (a RequestMetrics) when one is given.
+class TestRailClient:
+    def __init__(self, base_url, username, api_key, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 limiter=None, max_retries=DEFAULT_MAX_RETRIES, metrics=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.session = requests.Session()
+        self.session.auth = (username, api_key)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        # One pool per host, each holding up to pool_size reusable connections
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def url(self, endpoint):
+        return f'{self.base_url}/index.php?/api/v2/{endpoint}'
+
+    # Send a request through the rate limiter, retrying throttled and transient
+    # failures. Returns the last response (the caller checks its status) or
+    # raises the last connection error once the retries are exhausted.
+    # attempt_kwargs, if given, is called before every attempt for request
+    # arguments that cannot be reused, such as an upload body.
+    def request(self, method, endpoint, attempt_kwargs=None, **kwargs):
+        url = self.url(endpoint)
+        retry_statuses = RETRY_STATUSES_POST if method == 'POST' else RETRY_STATUSES_GET
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                extra = attempt_kwargs() if attempt_kwargs else {}
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs, **extra)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._observe(method, endpoint, None, start, attempt)
+                if method == 'POST' or attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"{e.__class__.__name__} for URL {url}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self._observe(method, endpoint, response, start, attempt, kwargs.get('stream', False))
+
+            if response.status_code not in retry_statuses:
+                self.limiter.succeeded()
+                return response
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if response.status_code == 429:
+                # The limiter makes every caller wait out Retry-After, not just this one
+                self.limiter.throttled(retry_after)
+                delay = backoff_delay(attempt) if retry_after is None else 0
+            else:
+                delay = max(backoff_delay(attempt), retry_after or 0)
+            if attempt == self.max_retries:
+                return response
+            response.close()
+            logging.warning(f"HTTP {response.status_code} for URL {url}, retry {attempt + 1}/{self.max_retries}")
+            if delay:
+                time.sleep(delay)
+        return response
+
+    def _observe(self, method, endpoint, response, start, attempt, stream=False):
+        if self.metrics is None:
+            return
+        seconds = time.perf_counter() - start
+        if response is None:
+            self.metrics.observe(method, endpoint, None, seconds, retry=attempt > 0)
+            return
+        # Bytes on the wire (compressed) when announced; streamed bodies are not read here
+        received = response.headers.get('Content-Length')
+        if received is not None:
+            received = int(received)
+        else:
+            received = 0 if stream else len(response.content or b'')
+        self.metrics.observe(method, endpoint, response.status_code, seconds,
+                             body_size(response.request.body), received, attempt > 0)
+
+    def get(self, endpoint):
+        return self.request('GET', endpoint)
+
+    def post(self, endpoint, data):
+        return self.request('POST', endpoint, data=json_codec.dumps_bytes(data), headers={'Content-Type': 'application/json'})
+
+    # GET whose body is read incrementally with response.iter_content()
+    def get_stream(self, endpoint):
+        return self.request('GET', endpoint, stream=True)
+
+    # Upload a file as multipart/form-data, reopening it for every attempt so a
+    # throttled upload can be retried. source is a file path or a function
+    # returning a new binary file object, such as an archive member. The body
+    # is streamed when requests-toolbelt is installed and built in memory otherwise.
+    def upload(self, endpoint, source, filename, field='attachment'):
+        open_source = source if callable(source) else lambda: open(source, 'rb')
+        with ExitStack() as stack:
+            def attempt_kwargs():
+                f = stack.enter_context(open_source())
+                if MultipartEncoder is None:
+                    return {'files': {field: (filename, f)}}
+                encoder = MultipartEncoder(fields={field: (filename, f, 'application/octet-stream')})
+                return {'data': encoder, 'headers': {'Content-Type': encoder.content_type}}
+            return self.request('POST', endpoint, attempt_kwargs=attempt_kwargs)
+
+    def close(self):
+        self.session.close()
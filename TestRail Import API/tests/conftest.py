@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# The scripts are modules next to this directory, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_testrail import FakeData, FakeTestRailServer, Faults  # noqa: E402
+from testrail_client import RateLimiter, TestRailClient  # noqa: E402
+
+
+# Start a fake TestRail server on a free port: fake_server(faults=..., **FakeData arguments)
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(faults=None, **data):
+        data.setdefault('attachment_every', 0)
+        server = FakeTestRailServer(FakeData(**data), faults or Faults()).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+# Client of a server that is never throttled on the client side
+def make_client(server, max_retries=2, metrics=None):
+    return TestRailClient(server.url, 'user@example.com', 'key', limiter=RateLimiter(rate=1e6, max_rate=1e6),
+                          max_retries=max_retries, metrics=metrics)
+
+
+# get_data-style fetch through a client: the decoded response, or None on an error status
+def fetcher(client):
+    def fetch(endpoint):
+        response = client.get(endpoint)
+        return response.json() if response.ok else None
+    return fetch
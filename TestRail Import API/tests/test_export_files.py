@@ -0,0 +1,116 @@
+import io
+import json
+
+import pytest
+
+import export_files
+from export_files import iter_records, merge_records, read_records, write_json_groups, write_json_items, write_jsonl_items
+
+ITEMS = [
+    {'id': 1, 'title': 'Login works', 'custom_steps': None, 'refs': 'REQ-1'},
+    {'id': 2, 'title': 'Ünïcödé ✓ "quoted"', 'nested': {'list': [1, [2, {}], []], 'empty': {}}},
+    {'id': 3, 'values': [1.5, True, False, None, -0.0, 1e100]},
+]
+
+
+@pytest.fixture
+def small_reads(monkeypatch):
+    monkeypatch.setattr(export_files, 'READ_SIZE', 7)
+
+
+@pytest.mark.parametrize('items', [ITEMS, [], [{}], [[]], ['text', 3]])
+@pytest.mark.parametrize('key', ['cases', None])
+def test_write_json_items_matches_json_dump(items, key):
+    f = io.StringIO()
+    assert write_json_items(iter(items), f, key) == len(items)
+    assert f.getvalue() == json.dumps({key: items} if key else items, indent=4)
+
+
+def test_write_json_groups_matches_json_dump_of_merged_documents():
+    chunks = [
+        {'run_id': 1, 'results': ITEMS[:2]},
+        {'run_id': 1, 'results': ITEMS[2:]},
+        {'run_id': 2, 'results': []},
+        {'run_id': 3, 'results': ITEMS[:1]},
+    ]
+    expected = [
+        {'run_id': 1, 'results': ITEMS},
+        {'run_id': 2, 'results': []},
+        {'run_id': 3, 'results': ITEMS[:1]},
+    ]
+    f = io.StringIO()
+    assert write_json_groups(iter(chunks), f, 'run_id') == 3
+    assert f.getvalue() == json.dumps(expected, indent=4)
+    f = io.StringIO()
+    assert write_json_groups(iter([]), f, 'run_id') == 0
+    assert f.getvalue() == json.dumps([], indent=4)
+
+
+@pytest.mark.parametrize('document, key, expected', [
+    ({'offset': 0, 'cases': ITEMS}, 'cases', ITEMS),
+    (ITEMS, None, ITEMS),
+    ({'id': 7, 'name': 'Project'}, None, [{'id': 7, 'name': 'Project'}]),
+    ({'_links': {'next': None}, 'runs': []}, 'runs', []),
+])
+def test_read_records_streams_json_documents(small_reads, document, key, expected):
+    for indent in (None, 4):
+        assert list(read_records(io.StringIO(json.dumps(document, indent=indent)), key)) == expected
+
+
+def test_read_records_chunks_grouped_results(small_reads, monkeypatch):
+    monkeypatch.setattr(export_files, 'CHUNK_ITEMS', 2)
+    documents = [{'run_id': 1, 'results': ITEMS}, {'run_id': 2, 'results': []}, {'run_id': 3, 'results': ITEMS[:1]}]
+    chunks = list(read_records(io.StringIO(json.dumps(documents, indent=4)), group='run_id'))
+    assert all(len(chunk['results']) <= 2 for chunk in chunks)
+    merged = {}
+    for chunk in chunks:
+        merged.setdefault(chunk['run_id'], []).extend(chunk['results'])
+    assert merged == {1: ITEMS, 2: [], 3: ITEMS[:1]}
+    assert [chunk['run_id'] for chunk in chunks] == [1, 1, 2, 3]
+
+
+def test_read_records_jsonl_expands_bulk_lines():
+    lines = [json.dumps({'offset': 0, 'cases': ITEMS[:2]}), '', json.dumps(ITEMS[2])]
+    assert list(read_records(io.StringIO('\n'.join(lines)), 'cases', jsonl=True)) == ITEMS
+
+
+def write_export(path, records, key):
+    with open(path, 'w', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            write_jsonl_items(records, f)
+        else:
+            write_json_items(records, f, key)
+
+
+@pytest.mark.parametrize('extension', ['json', 'jsonl'])
+def test_merge_records_replaces_in_place_and_appends(tmp_path, extension):
+    path = str(tmp_path / f'milestones.{extension}')
+    write_export(path, [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}, {'id': 3, 'name': 'c'}], 'milestones')
+    delta = [{'id': 4, 'name': 'new'}, {'id': 2, 'name': 'changed'}]
+    assert merge_records(path, delta, 'milestones') == 4
+    assert list(iter_records(path, 'milestones')) == [
+        {'id': 1, 'name': 'a'}, {'id': 2, 'name': 'changed'}, {'id': 3, 'name': 'c'}, {'id': 4, 'name': 'new'}]
+    assert not (tmp_path / f'milestones.{extension}.tmp').exists()
+
+
+@pytest.mark.parametrize('extension', ['json', 'jsonl'])
+def test_merge_records_combines_records_of_the_same_group(tmp_path, extension):
+    path = str(tmp_path / f'test_results.{extension}')
+    write_export(path, [{'run_id': 1, 'results': [{'id': 10}]}, {'run_id': 2, 'results': [{'id': 20}]}], None)
+    delta = [{'run_id': 2, 'results': [{'id': 21}]}, {'run_id': 3, 'results': [{'id': 30}]}]
+
+    def combine(old, new):
+        return dict(old, results=old['results'] + new['results'])
+    assert merge_records(path, delta, id_field='run_id', combine=combine) == 3
+    assert list(iter_records(path)) == [
+        {'run_id': 1, 'results': [{'id': 10}]},
+        {'run_id': 2, 'results': [{'id': 20}, {'id': 21}]},
+        {'run_id': 3, 'results': [{'id': 30}]},
+    ]
+
+
+def test_merge_records_creates_a_missing_file(tmp_path):
+    path = str(tmp_path / 'runs.json')
+    assert merge_records(path, [{'id': 1}], 'runs') == 1
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == {'runs': [{'id': 1}]}
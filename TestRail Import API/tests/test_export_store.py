@@ -0,0 +1,60 @@
+import pytest
+
+from export_store import ExportStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ExportStore(str(tmp_path / 'export.sqlite'))
+    yield store
+    store.close()
+
+
+def cases(count, start=1):
+    return [{'id': i, 'section_id': i % 3, 'title': f'Case {i}'} for i in range(start, start + count)]
+
+
+def files_count(store, file):
+    return store.conn.execute('SELECT records FROM files WHERE file = ?', (file,)).fetchone()[0]
+
+
+def test_write_replaces_the_records_of_a_file(store):
+    assert store.write('test_cases.json', cases(5)) == 5
+    assert store.write('test_cases.json', cases(2, start=10)) == 2
+    assert list(store.iter_records('test_cases.json')) == cases(2, start=10)
+    assert files_count(store, 'test_cases') == 2
+    assert store.filenames() == ['test_cases.json']
+
+
+def test_failed_write_keeps_the_previous_records(store, monkeypatch):
+    monkeypatch.setattr('export_store.BATCH_SIZE', 100)
+    store.write('test_cases.json', cases(500))
+
+    def failing_page():
+        yield from cases(250, start=1000)  # Already inserted in batches when the next page fails
+        raise ConnectionError('page 2 failed')
+    with pytest.raises(ConnectionError):
+        store.write('test_cases.json', failing_page())
+    assert list(store.iter_records('test_cases.json')) == cases(500)
+    assert files_count(store, 'test_cases') == 500
+    assert store.conn.execute('SELECT COUNT(*) FROM cases').fetchone()[0] == 500  # No staged rows left
+    assert store.write('test_cases.json', cases(3)) == 3
+    assert list(store.iter_records('test_cases.json')) == cases(3)
+
+
+def test_grouped_results_round_trip(store):
+    documents = [
+        {'run_id': 1, 'results': [{'id': 10, 'test_id': 5}, {'id': 11, 'test_id': 6}]},
+        {'run_id': 2, 'results': [{'id': 20, 'test_id': 7}]},
+    ]
+    assert store.write('test_results.json', documents) == 2
+    assert list(store.iter_records('test_results.json')) == documents
+    assert list(store.query('results', run_id=2)) == [{'id': 20, 'test_id': 7}]
+
+
+def test_query_filters_by_indexed_columns(store):
+    store.write('test_cases.json', cases(9))
+    assert [case['id'] for case in store.query('cases', section_id=1)] == [1, 4, 7]
+    assert store.values('cases', 'section_id') == [1, 2, 0]
+    with pytest.raises(ValueError):
+        list(store.query('cases', title='Case 1'))
@@ -0,0 +1,119 @@
+import logging
+
+import pytest
+
+import export_testrail
+import import_journal
+import import_testrail
+from conftest import make_client
+from fake_testrail import Faults
+from import_journal import ImportJournal, JournalScopeError
+from response_cache import ResponseCache
+
+EXPORT_STAGES = ['milestones', 'test_cases', 'sections', 'suites', 'test_plans', 'test_runs', 'test_results', 'tests']
+IMPORT_STAGES = ['milestones', 'suites', 'sections', 'test_cases', 'test_runs', 'test_results']
+
+
+# Point a script module at the fake server and the test's directory, as benchmark_migration.configure does
+def configure(monkeypatch, module, server, out, stages):
+    monkeypatch.setattr(module, 'client', make_client(server, max_retries=0, metrics=module.metrics))
+    monkeypatch.setattr(module, 'script_dir', str(out))
+    monkeypatch.setattr(module, 'response_cache', ResponseCache(str(out / module.cache_dirname), namespace=server.url))
+    monkeypatch.setattr(module, 'progress_interval', 0)
+    monkeypatch.setattr(module, 'metrics_interval', 0)
+    monkeypatch.setattr(module, 'archive_filename', None)
+    monkeypatch.setattr(module, 'store_filename', None)
+    monkeypatch.setattr(module, 'import_config', {name: name in stages for name in module.import_config})
+
+
+@pytest.fixture
+def exported(fake_server, tmp_path, monkeypatch):
+    server = fake_server(cases=40, sections=4, milestones=3, plans=1, runs_per_plan=1, runs=2,
+                         tests_per_run=10, results_per_test=2)
+    configure(monkeypatch, export_testrail, server, tmp_path, EXPORT_STAGES)
+    monkeypatch.setattr(export_testrail, 'project_id', 1)
+    monkeypatch.setattr(export_testrail, 'output_format', 'json')
+    export_testrail.main()
+    return server, tmp_path
+
+
+# Run the import into project 2 with the journal alone guarding against duplicates
+def run_import(monkeypatch, server, out, stages=IMPORT_STAGES):
+    configure(monkeypatch, import_testrail, server, out, stages)
+    monkeypatch.setattr(import_testrail, 'new_project_id', 2)
+    monkeypatch.setattr(import_testrail, 'match_existing', False)
+    for name in ('journal', 'archive', 'store', 'target_index'):
+        monkeypatch.setattr(import_testrail, name, None)
+    import_testrail.main()
+    import_testrail.journal.close()
+
+
+def target_counts(data):
+    suites = {suite_id for suite_id, suite in data.suites.items() if suite['project_id'] == 2}
+    runs = {run_id for run_id, run in data.runs.items() if run['project_id'] == 2}
+    return {
+        'milestones': sum(milestone['project_id'] == 2 for milestone in data.milestones.values()),
+        'sections': sum(section['suite_id'] in suites for section in data.sections.values()),
+        'cases': sum(case['suite_id'] in suites for case in data.cases.values()),
+        'runs': len(runs),
+        'results': sum(len(data.results_by_run.get(run_id, [])) for run_id in runs),
+    }
+
+
+def source_counts(data):
+    return {
+        'milestones': sum(milestone['project_id'] == 1 for milestone in data.milestones.values()),
+        'sections': sum(data.suites[section['suite_id']]['project_id'] == 1 for section in data.sections.values()),
+        'cases': sum(data.suites[case['suite_id']]['project_id'] == 1 for case in data.cases.values()),
+    }
+
+
+def test_interrupted_import_resumes_without_duplicates(exported, monkeypatch, caplog):
+    server, out = exported
+    expected = source_counts(server.data)
+    # An incomplete first import: some creations fail and it stops before the runs, whose
+    # cases must all exist when they are created
+    server.faults = Faults(failure_rate=0.2, seed=3)
+    with caplog.at_level(logging.CRITICAL):
+        run_import(monkeypatch, server, out, IMPORT_STAGES[:4])
+    first = target_counts(server.data)
+    assert first != {**first, **expected}
+
+    server.faults = Faults()
+    run_import(monkeypatch, server, out)
+    complete = target_counts(server.data)
+    assert complete == {**complete, **expected}
+    assert complete['runs'] and complete['results'] == 20 * complete['runs']  # Every result of a run once
+
+    created = server.stats()['created']
+    run_import(monkeypatch, server, out)
+    assert server.stats()['created'] == created
+    assert target_counts(server.data) == complete
+
+    journal = ImportJournal(str(out / import_testrail.journal_filename), f'{server.url} project 2')
+    assert len(journal.mapping('cases')) == expected['cases']
+    assert len(journal.mapping('milestones')) == expected['milestones']
+    journal.close()
+
+
+def test_journal_refuses_another_scope(tmp_path):
+    path = str(tmp_path / 'journal.sqlite')
+    ImportJournal(path, 'https://a project 2').close()
+    with pytest.raises(JournalScopeError):
+        ImportJournal(path, 'https://b project 2')
+    ImportJournal(path, 'https://a project 2').close()
+
+
+def test_lookups_beyond_the_cache_go_to_the_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(import_journal, 'CACHE_SIZE', 3)
+    journal = ImportJournal(str(tmp_path / 'journal.sqlite'))
+    journal.record_many('cases', [(i, 100 + i) for i in range(10)])
+    journal.record('sections', 5, 50)
+    assert len(journal.cache) == 3
+    assert [journal.target_id('cases', i) for i in range(10)] == [100 + i for i in range(10)]
+    assert journal.target_id('cases', 99) is None
+    assert journal.target_id('sections', '5') == 50
+    assert journal.target_id('cases', None) is None
+    assert len(journal.cache) == 3
+    assert journal.mapping('cases') == {str(i): 100 + i for i in range(10)}
+    journal.close()
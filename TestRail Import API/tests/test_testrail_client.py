@@ -0,0 +1,120 @@
+import pytest
+
+import testrail_client
+from conftest import fetcher, make_client
+from fake_testrail import Faults
+from testrail_client import PaginationError, RateLimiter, paginate, paginate_pages, parse_retry_after
+
+
+# fetch function over canned responses, recording the endpoints it is asked for
+def canned(responses):
+    requested = []
+
+    def fetch(endpoint):
+        requested.append(endpoint)
+        return responses.get(endpoint)
+    return fetch, requested
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(testrail_client, 'BACKOFF_BASE', 0.001)
+
+
+def test_paginate_follows_links(fake_server):
+    server = fake_server(cases=600, sections=5, plans=0, runs=0)
+    client = make_client(server)
+    pages = list(paginate_pages(fetcher(client), 'get_cases/1', 'cases'))
+    assert [len(page) for page in pages] == [250, 250, 100]
+    ids = [case['id'] for page in pages for case in page]
+    assert ids == sorted(server.data.cases)[:600]
+    assert server.stats()['by_status'] == {'GET 200': 3}
+
+
+def test_paginate_falls_back_to_offset_without_links():
+    fetch, requested = canned({
+        'get_runs/1&limit=2': {'runs': [{'id': 1}, {'id': 2}]},
+        'get_runs/1&limit=2&offset=2': {'runs': [{'id': 3}, {'id': 4}]},
+        'get_runs/1&limit=2&offset=4': {'runs': [{'id': 5}]},
+    })
+    assert [run['id'] for run in paginate(fetch, 'get_runs/1', 'runs', limit=2)] == [1, 2, 3, 4, 5]
+    assert requested == ['get_runs/1&limit=2', 'get_runs/1&limit=2&offset=2', 'get_runs/1&limit=2&offset=4']
+
+
+def test_paginate_prefers_links_over_offset():
+    fetch, requested = canned({
+        'get_cases/1&limit=2': {'cases': [{'id': 1}, {'id': 2}],
+                                '_links': {'next': '/api/v2/get_cases/1&limit=2&offset=2&cursor=x'}},
+        'get_cases/1&limit=2&offset=2&cursor=x': {'cases': [{'id': 3}], '_links': {'next': None}},
+    })
+    assert [case['id'] for case in paginate(fetch, 'get_cases/1', 'cases', limit=2)] == [1, 2, 3]
+    assert requested[-1] == 'get_cases/1&limit=2&offset=2&cursor=x'
+
+
+def test_paginate_yields_plain_list_as_one_page():
+    fetch, requested = canned({'get_plans/1&limit=250': [{'id': 1}, {'id': 2}]})
+    assert list(paginate_pages(fetch, 'get_plans/1', 'plans')) == [[{'id': 1}, {'id': 2}]]
+    assert len(requested) == 1
+
+
+def test_failed_page_ends_or_raises_when_strict():
+    responses = {'get_runs/1&limit=2': {'runs': [{'id': 1}, {'id': 2}]}}  # The second page fails
+    fetch, _ = canned(responses)
+    assert [run['id'] for run in paginate(fetch, 'get_runs/1', 'runs', limit=2)] == [1, 2]
+    fetch, _ = canned(responses)
+    pages = paginate(fetch, 'get_runs/1', 'runs', limit=2, strict=True)
+    assert [next(pages)['id'], next(pages)['id']] == [1, 2]
+    with pytest.raises(PaginationError):
+        next(pages)
+
+
+def test_strict_paginate_raises_on_server_errors(fake_server):
+    server = fake_server(cases=600, sections=5, plans=0, runs=0, faults=Faults(failure_rate=1.0))
+    client = make_client(server, max_retries=0)
+    with pytest.raises(PaginationError):
+        list(paginate(fetcher(client), 'get_cases/1', 'cases', strict=True))
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0  # In the past
+
+
+def test_429_throttles_the_limiter_and_retries_after_retry_after(fake_server):
+    server = fake_server(cases=10, sections=1, plans=0, runs=0, faults=Faults(rate_limit=1))
+    client = make_client(server)
+    client.limiter = limiter = RateLimiter(rate=50, max_rate=50)
+    assert client.get('get_project/1').status_code == 200  # Takes the server's only token
+    response = client.get('get_project/1')  # 429 with Retry-After: 1, then retried
+    assert response.status_code == 200
+    assert server.stats()['throttled'] == 1
+    assert limiter.rate < 50
+    assert limiter.blocked_until > 0
+
+
+def test_get_retries_server_errors(fake_server):
+    server = fake_server(cases=10, sections=1, plans=0, runs=0, faults=Faults(failure_rate=1.0))
+    client = make_client(server, max_retries=2)
+    assert client.get('get_project/1').status_code == 500
+    assert server.stats()['by_status'] == {'GET 500': 3}
+
+
+def test_post_is_not_retried_on_server_errors(fake_server):
+    server = fake_server(cases=10, sections=1, plans=0, runs=0, faults=Faults(failure_rate=1.0))
+    client = make_client(server, max_retries=2)
+    assert client.post('add_milestone/2', {'name': 'M'}).status_code == 500
+    assert server.stats()['by_status'] == {'POST 500': 1}
+
+
+def test_post_is_retried_on_429(fake_server):
+    server = fake_server(cases=10, sections=1, plans=0, runs=0, faults=Faults(rate_limit=1))
+    client = make_client(server)
+    assert client.post('add_milestone/2', {'name': 'First'}).status_code == 200
+    response = client.post('add_milestone/2', {'name': 'Second'})
+    assert response.status_code == 200
+    assert server.stats()['by_status'] == {'POST 200': 2, 'POST 429': 1}
+    names = [milestone['name'] for milestone in server.data.milestones.values() if milestone['project_id'] == 2]
+    assert names == ['First', 'Second']